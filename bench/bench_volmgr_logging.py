@@ -0,0 +1,109 @@
+##############################################################################
+# COPYRIGHT Ericsson AB 2014
+#
+# The copyright to the computer program(s) herein is the property of
+# Ericsson AB. The programs may be used and/or copied only with written
+# permission from Ericsson AB. or in accordance with the terms and
+# conditions stipulated in the agreement/contract under which the
+# program(s) have been supplied.
+##############################################################################
+
+"""
+Benchmark of the trace logging cost on the task generation hot path,
+comparing eager '%'-formatting against the deferred VolMgrLogger facade
+with trace debug logging disabled. Both paths log the same messages:
+one per File System, 1 in every [rate] Task lines and one summary line
+per Node.
+
+Usage (from the repository root):
+
+    PYTHONPATH=src python bench/bench_volmgr_logging.py [nodes] [fss] [rate]
+"""
+
+import logging
+import sys
+import timeit
+
+from volmgr_plugin.volmgr_logging import VolMgrLogger
+
+
+class _Logger(object):
+    '''
+    Stand-in for LitpLogger exposing a 'trace' logging.Logger
+    '''
+
+    def __init__(self):
+        self.trace = logging.getLogger('volmgr.bench')
+        self.trace.setLevel(logging.INFO)
+
+
+class _Item(object):
+    '''
+    Model item stand-in whose string form is costly to build,
+    as for a ConfigTask
+    '''
+
+    def __init__(self, item_id):
+        self.item_id = item_id
+
+    def __str__(self):
+        return '<Task %s %s>' % (self.item_id, ', '.join(['kwarg=value'] * 8))
+
+
+def _eager(logger, nodes, fss, rate):
+    count = 0
+    for node in nodes:
+        tasks = 0
+        for fs in fss:
+            preamble = '._gen_tasks_for_file_system: %s FS:%s : ' % \
+                       (node.item_id, fs.item_id)
+            logger.trace.debug((preamble + \
+                                "Generating tasks for File System '%s'") % \
+                                fs.item_id)
+            if rate > 0:
+                if count % rate == 0:
+                    logger.trace.debug("._iter_tasks: Task: %s" % fs)
+                count += 1
+            tasks += 1
+        logger.trace.debug("._iter_tasks: Node '%s': %d tasks" % \
+                           (node.item_id, tasks))
+
+
+def _deferred(log, nodes, fss, rate):
+    for node in nodes:
+        summary = log.summary("._iter_tasks: Node '%s': %d tasks",
+                              node.item_id)
+        for fs in fss:
+            preamble = '._gen_tasks_for_file_system: %s FS:%s : '
+            log.debug(preamble + "Generating tasks for File System '%s'",
+                      node.item_id, fs.item_id, fs.item_id)
+            log.debug_sampled('task', rate, "._iter_tasks: Task: %s", fs)
+            summary.add()
+        summary.emit()
+
+
+def main(argv):
+    num_nodes = int(argv[1]) if len(argv) > 1 else 1000
+    num_fss = int(argv[2]) if len(argv) > 2 else 20
+    rate = int(argv[3]) if len(argv) > 3 else 1
+
+    nodes = [_Item('node%d' % i) for i in range(num_nodes)]
+    fss = [_Item('fs%d' % i) for i in range(num_fss)]
+
+    logger = _Logger()
+    log = VolMgrLogger(logger)
+
+    eager = min(timeit.repeat(lambda: _eager(logger, nodes, fss, rate),
+                              number=1, repeat=3))
+    deferred = min(timeit.repeat(lambda: _deferred(log, nodes, fss, rate),
+                                 number=1, repeat=3))
+
+    print("%d nodes x %d file systems, task sample rate %d, " \
+          "trace debug disabled" % (num_nodes, num_fss, rate))
+    print("eager formatting : %.3fs" % eager)
+    print("deferred facade  : %.3fs" % deferred)
+    print("speed-up         : %.1fx" % (eager / deferred))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
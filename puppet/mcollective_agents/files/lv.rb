@@ -0,0 +1,89 @@
+##############################################################################
+# COPYRIGHT Ericsson AB 2014
+#
+# The copyright to the computer program(s) herein is the property of
+# Ericsson AB. The programs may be used and/or copied only with written
+# permission from Ericsson AB. or in accordance with the terms and
+# conditions stipulated in the agreement/contract under which the
+# program(s) have been supplied.
+##############################################################################
+
+module MCollective
+  module Agent
+    # LVM snapshot actions run by the snapshot plans of the lvm plugin.
+    # Every action is idempotent, so a plan can be resumed.
+    class Lv < RPC::Agent
+
+      LVM_BIN = "/sbin"
+
+      action "create_snapshot" do
+        validate_names
+        validate :size, /^[1-9][0-9]*k$/ if request[:size]
+
+        if snapshot_attr
+          reply[:status] = 0
+        elsif request[:size]
+          # A thick snapshot reserves its size in the Volume Group
+          lvm("lvcreate -s -L #{request[:size]} -n #{request[:name]} " +
+              "#{request[:vg]}/#{request[:lv]}")
+        else
+          # A thin snapshot is allocated from the thin pool
+          lvm("lvcreate -s -n #{request[:name]} " +
+              "#{request[:vg]}/#{request[:lv]}")
+        end
+      end
+
+      action "remove_snapshot" do
+        validate_names
+
+        if snapshot_attr
+          lvm("lvremove -f #{snapshot}")
+        else
+          reply[:status] = 0
+        end
+      end
+
+      action "merge_snapshot" do
+        validate_names
+
+        attr = snapshot_attr
+        if attr.nil?
+          reply[:status] = 1
+          reply[:err] = "Snapshot #{snapshot} does not exist"
+        elsif attr.start_with?("S")
+          # Already merging, completed when the origin is next activated
+          reply[:status] = 0
+        else
+          lvm("lvconvert --merge #{snapshot}")
+        end
+      end
+
+      private
+
+      def validate_names
+        [:vg, :lv, :name].each do |key|
+          validate key, /^[A-Za-z0-9_.+-]+$/
+        end
+      end
+
+      def snapshot
+        "#{request[:vg]}/#{request[:name]}"
+      end
+
+      # lv_attr of the snapshot Logical Volume, nil if it does not exist
+      def snapshot_attr
+        out = ""
+        status = run("#{LVM_BIN}/lvs --noheadings -o lv_attr #{snapshot}",
+                     :stdout => out, :stderr => "", :chomp => true)
+        status == 0 ? out.strip : nil
+      end
+
+      def lvm(command)
+        reply[:status] = run("#{LVM_BIN}/#{command}",
+                             :stdout => :out, :stderr => :err,
+                             :chomp => true)
+      end
+
+    end
+  end
+end
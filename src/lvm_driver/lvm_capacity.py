@@ -0,0 +1,571 @@
+##############################################################################
+# COPYRIGHT Ericsson AB 2014
+#
+# The copyright to the computer program(s) herein is the property of
+# Ericsson AB. The programs may be used and/or copied only with written
+# permission from Ericsson AB. or in accordance with the terms and
+# conditions stipulated in the agreement/contract under which the
+# program(s) have been supplied.
+##############################################################################
+
+from volmgr_plugin.volmgr_utils import VolMgrUtils, Size
+
+
+class LvmCapacityChecker(object):
+    '''
+    Batch capacity engine for the LVM Driver.
+    The (node, vg, disk, fs) sizes of any number of Nodes are
+    flattened once into parallel columns, one row per Volume Group
+    and one row per File System. The extent alignment and disk fit
+    checks are then each answered by a single pass over the columns
+    for the whole batch.
+
+    Capacity is counted in Physical Extents. Each System Disk
+    contributes one Physical Volume: the whole Disk, or on a
+    bootable Disk the partition following the aligned boot
+    partition. The extents of a Physical Volume start after its
+    label and metadata area. Each Logical Volume takes its size
+    rounded up to whole extents, and to a whole number of extents
+    per stripe.
+
+    A File System already applied with a different size is
+    resized in place: its applied size is kept alongside,
+    so the extents it grows by can be set against the
+    extents left free in its Volume Group.
+
+    A Volume Group may also have a cache device: a whole System
+    Disk, apart from its Physical Devices, on which a cache pool
+    is built for each cached File System. A cache pool takes its
+    cache size in data extents plus a metadata area; one spare
+    metadata area, as large as the largest, is kept per Volume
+    Group.
+
+    A Volume Group may also have a thin pool, which takes its
+    pool size in extents plus a metadata area and a spare of it.
+    Thin File Systems take no extents of their own: their sizes
+    are virtual, and may add up to the pool size times the
+    overcommit ratio of the Volume Group. A thick File System
+    with a snap_size reserves that percentage of its size for
+    a snapshot.
+    '''
+
+    def __init__(self, extent_size, pe_start, alignment, boot_size,
+                 cache_metadata_min=None, cache_metadata_ratio=1000,
+                 thin_metadata_min=None, thin_metadata_ratio=1024):
+        '''
+        Constructor
+        @param extent_size: Default Physical Extent size, for
+                            Volume Groups which set no pe_size
+        @type extent_size: Size
+        @param pe_start: Offset of the first Physical Extent in a
+                         Physical Volume (label and metadata area)
+        @type pe_start: Size
+        @param alignment: Partition alignment on a partitioned Disk
+        @type alignment: Size
+        @param boot_size: Size of the boot partition of a bootable
+                          System Disk
+        @type boot_size: Size
+        @param cache_metadata_min: Smallest cache pool metadata area
+        @type cache_metadata_min: Size
+        @param cache_metadata_ratio: Cache pool data to metadata ratio
+        @type cache_metadata_ratio: Integer
+        @param thin_metadata_min: Smallest thin pool metadata area
+        @type thin_metadata_min: Size
+        @param thin_metadata_ratio: Thin pool data to metadata ratio
+        @type thin_metadata_ratio: Integer
+        '''
+
+        self.extent_size = extent_size
+        self.pe_start = pe_start
+        self.alignment = alignment
+        self.boot_size = boot_size
+        self.cache_metadata_min = cache_metadata_min or Size.parse('8M')
+        self.cache_metadata_ratio = cache_metadata_ratio
+        self.thin_metadata_min = thin_metadata_min or Size.parse('2M')
+        self.thin_metadata_ratio = thin_metadata_ratio
+
+        self.nodes = []
+
+        # Volume Group rows
+        self.vg_node_rows = []
+        self.vg_items = []
+        self.vg_disks = []
+        self.vg_pd_counts = []
+        self.vg_extent_kb = []
+        self.vg_pv_kb = []
+        self.vg_pv_extents = []
+        self.vg_extents = []
+        self.vg_cache_disks = []
+        self.vg_cache_extents = []
+        self.vg_thin_pool_kb = []
+        self.vg_overcommit = []
+
+        # File System rows
+        self.fs_node_rows = []
+        self.fs_vg_rows = []
+        self.fs_items = []
+        self.fs_kb = []
+        self.fs_applied_kb = []
+        self.fs_stripes = []
+        self.fs_stripe_kb = []
+        self.fs_cache_kb = []
+        self.fs_thin = []
+        self.fs_snap_pct = []
+
+    @staticmethod
+    def _parse_stripes(stripes):
+        '''
+        Return the number of stripes of a File System:
+        1 if unset, 0 if invalid
+        '''
+
+        if stripes is None:
+            return 1
+        try:
+            return int(stripes)
+        except (TypeError, ValueError):
+            return 0
+
+    @staticmethod
+    def _parse_overcommit(overcommit_ratio):
+        '''
+        Return the overcommit ratio of a Volume Group:
+        1 if unset or invalid
+        '''
+
+        try:
+            return max(float(overcommit_ratio), 1.0)
+        except (TypeError, ValueError):
+            return 1.0
+
+    @staticmethod
+    def _parse_snap_pct(snap_size):
+        '''
+        Return the snapshot percentage of a File System:
+        0 if unset or invalid
+        '''
+
+        try:
+            return min(max(int(snap_size), 0), 100)
+        except (TypeError, ValueError):
+            return 0
+
+    def _parse_extent_kb(self, pe_size):
+        '''
+        Return the Physical Extent size of a Volume Group in
+        Kilobytes: the default if unset, 0 if not a power of 2
+        '''
+
+        if pe_size is None:
+            return self.extent_size.kilobytes
+        size = Size.parse(pe_size)
+        if size is None or size.kilobytes & (size.kilobytes - 1):
+            return 0
+        return size.kilobytes
+
+    def get_pv_kb(self, disk_kb, bootable):
+        '''
+        Return the size in Kilobytes of the Physical Volume on a
+        System Disk. A bootable Disk is partitioned: the boot
+        partition starts at the first alignment boundary, and the
+        Physical Volume partition runs from the next boundary after
+        it to the last boundary of the Disk.
+        '''
+
+        if not bootable:
+            return disk_kb
+
+        align_kb = self.alignment.kilobytes
+        boot_end_kb = align_kb + self.boot_size.kilobytes
+        pv_start_kb = -(-boot_end_kb // align_kb) * align_kb
+        pv_end_kb = (disk_kb // align_kb) * align_kb
+
+        return max(pv_end_kb - pv_start_kb, 0)
+
+    def add_node(self, node, index):
+        '''
+        Flatten the LVM Volume Groups and their File Systems
+        of a Node into the columns
+        @param node: Managed Node
+        @type node: QueryItem
+        @param index: Storage index of the Node
+        @type index: NodeStorageIndex
+        '''
+
+        node_row = len(self.nodes)
+        self.nodes.append(node)
+
+        vg_rows = {}
+        for vg in index.volume_groups:
+            if vg.volume_driver != 'lvm':
+                continue
+            vg_rows[vg.get_vpath()] = len(self.vg_items)
+            disks = index.get_vg_disks(vg)
+            extent_kb = self._parse_extent_kb(getattr(vg, 'pe_size', None))
+            self.vg_node_rows.append(node_row)
+            self.vg_items.append(vg)
+            self.vg_disks.append(disks)
+            self.vg_pd_counts.append(len(list(vg.physical_devices)))
+            self.vg_extent_kb.append(extent_kb)
+
+            pvs_kb = []
+            pvs_extents = []
+            for disk, disk_size in zip(disks,
+                                       Size.parse_all([disk.size \
+                                                       for disk in disks])):
+                disk_kb = disk_size.kilobytes if disk_size is not None else 0
+                pv_kb = self.get_pv_kb(disk_kb, disk.bootable == 'true')
+                pvs_kb.append(pv_kb)
+                if extent_kb:
+                    pvs_extents.append(max(pv_kb - self.pe_start.kilobytes,
+                                           0) // extent_kb)
+                else:
+                    pvs_extents.append(0)
+
+            self.vg_pv_kb.append(pvs_kb)
+            self.vg_pv_extents.append(pvs_extents)
+            self.vg_extents.append(sum(pvs_extents))
+
+            cache_disk = None
+            cache_extents = 0
+            cache_device = getattr(vg, 'cache_device', None)
+            if cache_device is not None:
+                cache_disk = index.disks_by_name.get(cache_device)
+            if cache_disk is not None and extent_kb:
+                cache_size = Size.parse(cache_disk.size)
+                cache_kb = cache_size.kilobytes \
+                           if cache_size is not None else 0
+                cache_extents = max(cache_kb - self.pe_start.kilobytes,
+                                    0) // extent_kb
+            self.vg_cache_disks.append(cache_disk)
+            self.vg_cache_extents.append(cache_extents)
+
+            thin_pool_size = Size.parse(getattr(vg, 'thin_pool_size', None))
+            self.vg_thin_pool_kb.append(thin_pool_size.kilobytes \
+                                        if thin_pool_size is not None \
+                                        else None)
+            self.vg_overcommit.append(LvmCapacityChecker._parse_overcommit(
+                                      getattr(vg, 'overcommit_ratio', None)))
+
+        # A tmpfs File System takes no extents
+        file_systems = [(vg, fs) for vg, fs in index.file_systems \
+                        if vg.get_vpath() in vg_rows and fs.type != 'tmpfs']
+        fss = [fs for _, fs in file_systems]
+        sizes = Size.parse_all([fs.size for fs in fss])
+        applied_sizes = Size.parse_all([VolMgrUtils.get_applied_property(fs,
+                                                                     'size') \
+                                        for fs in fss])
+        stripe_sizes = Size.parse_all([getattr(fs, 'stripe_size', None) \
+                                       for fs in fss])
+        cache_sizes = Size.parse_all([getattr(fs, 'cache_size', None) \
+                                      for fs in fss])
+        for (vg, fs), size, applied_size, stripe_size, cache_size in \
+                zip(file_systems, sizes, applied_sizes, stripe_sizes,
+                    cache_sizes):
+            self.fs_node_rows.append(node_row)
+            self.fs_vg_rows.append(vg_rows[vg.get_vpath()])
+            self.fs_items.append(fs)
+            # Sizes rule 7 rejects are left to that rule
+            self.fs_kb.append(size.kilobytes if size is not None else 0)
+            self.fs_applied_kb.append(applied_size.kilobytes \
+                                      if applied_size is not None else None)
+            self.fs_stripes.append(
+                    LvmCapacityChecker._parse_stripes(getattr(fs, 'stripes',
+                                                              None)))
+            self.fs_stripe_kb.append(stripe_size.kilobytes \
+                                     if stripe_size is not None else None)
+            self.fs_cache_kb.append(cache_size.kilobytes \
+                                    if cache_size is not None else None)
+            self.fs_thin.append(getattr(fs, 'thin', None) == 'true')
+            self.fs_snap_pct.append(LvmCapacityChecker._parse_snap_pct(
+                                    getattr(fs, 'snap_size', None)))
+
+    def get_fs_extents(self, row, size_kb=None):
+        '''
+        Return the number of Physical Extents allocated to the
+        Logical Volume of a File System row: its size, or the given
+        size, rounded up to whole extents, then to a whole number
+        per stripe
+        '''
+
+        extent_kb = self.vg_extent_kb[self.fs_vg_rows[row]]
+        if not extent_kb:
+            return 0
+
+        if size_kb is None:
+            size_kb = self.fs_kb[row]
+
+        extents = -(-size_kb // extent_kb)
+        stripes = self.fs_stripes[row]
+        if stripes > 1:
+            extents = -(-extents // stripes) * stripes
+
+        return extents
+
+    def get_fs_snapshot_extents(self, row):
+        '''
+        Return the number of Physical Extents reserved for the
+        snapshot of a thick File System row: snap_size percent of
+        its size, rounded up to whole extents. A thin File System
+        is snapshotted within its thin pool.
+        '''
+
+        extent_kb = self.vg_extent_kb[self.fs_vg_rows[row]]
+        if not extent_kb or self.fs_thin[row]:
+            return 0
+
+        return -(-self.fs_kb[row] * self.fs_snap_pct[row] // \
+                 (100 * extent_kb))
+
+    def get_vg_thin_pool_extents(self):
+        '''
+        Return the number of Physical Extents allocated to the
+        thin pool of every Volume Group row: its data extents,
+        its metadata extents and a spare of them
+        '''
+
+        totals = []
+        for row, pool_kb in enumerate(self.vg_thin_pool_kb):
+            extent_kb = self.vg_extent_kb[row]
+            if not extent_kb or pool_kb is None:
+                totals.append(0)
+                continue
+            metadata_kb = max(self.thin_metadata_min.kilobytes,
+                              pool_kb // self.thin_metadata_ratio)
+            totals.append(-(-pool_kb // extent_kb) + \
+                          2 * -(-metadata_kb // extent_kb))
+
+        return totals
+
+    def get_overcommitted_vg_rows(self):
+        '''
+        Return the Volume Group rows whose thin File Systems add up
+        to more than their thin pool size times the overcommit
+        ratio, along with the thin Kilobytes of every row
+        '''
+
+        thin_kb = [0] * len(self.vg_items)
+        for row, vg_row in enumerate(self.fs_vg_rows):
+            if self.fs_thin[row]:
+                thin_kb[vg_row] += self.fs_kb[row]
+
+        rows = [row for row, pool_kb in enumerate(self.vg_thin_pool_kb) \
+                if pool_kb is not None and \
+                   thin_kb[row] > pool_kb * self.vg_overcommit[row]]
+
+        return rows, thin_kb
+
+    def get_fs_cache_extents(self, row):
+        '''
+        Return the number of Physical Extents of the cache device
+        allocated to the cache pool of a File System row: its data
+        extents and its metadata extents, or (0, 0) if not cached
+        '''
+
+        extent_kb = self.vg_extent_kb[self.fs_vg_rows[row]]
+        cache_kb = self.fs_cache_kb[row]
+        if not extent_kb or cache_kb is None:
+            return 0, 0
+
+        metadata_kb = max(self.cache_metadata_min.kilobytes,
+                          cache_kb // self.cache_metadata_ratio)
+
+        return -(-cache_kb // extent_kb), -(-metadata_kb // extent_kb)
+
+    def get_vg_cache_used_extents(self):
+        '''
+        Return the number of cache device Physical Extents
+        allocated to the cache pools of every Volume Group row,
+        including the spare metadata area
+        '''
+
+        totals = [0] * len(self.vg_items)
+        spares = [0] * len(self.vg_items)
+        for row, vg_row in enumerate(self.fs_vg_rows):
+            data_extents, metadata_extents = self.get_fs_cache_extents(row)
+            totals[vg_row] += data_extents + metadata_extents
+            spares[vg_row] = max(spares[vg_row], metadata_extents)
+
+        return [total + spare for total, spare in zip(totals, spares)]
+
+    def get_overflowing_cache_vg_rows(self):
+        '''
+        Return the Volume Group rows whose cache pools need more
+        Physical Extents than their cache device provides, along
+        with the used cache extents of every row
+        '''
+
+        used = self.get_vg_cache_used_extents()
+        rows = [row for row, disk in enumerate(self.vg_cache_disks) \
+                if disk is not None and self.vg_extent_kb[row] and \
+                   used[row] > self.vg_cache_extents[row]]
+
+        return rows, used
+
+    def get_vg_used_extents(self):
+        '''
+        Return the number of Physical Extents allocated to the
+        Logical Volumes of every Volume Group row
+        '''
+
+        totals = self.get_vg_thin_pool_extents()
+        for row, vg_row in enumerate(self.fs_vg_rows):
+            if not self.fs_thin[row]:
+                totals[vg_row] += self.get_fs_extents(row) + \
+                                  self.get_fs_snapshot_extents(row)
+
+        return totals
+
+    def get_vg_headroom_extents(self):
+        '''
+        Return the number of free Physical Extents left in every
+        Volume Group row, negative if over-committed
+        '''
+
+        return [usable - used for usable, used in \
+                zip(self.vg_extents, self.get_vg_used_extents())]
+
+    def get_shrinking_fs_rows(self):
+        '''
+        Return the File System rows whose size is smaller
+        than their applied size
+        '''
+
+        return [row for row, applied_kb in enumerate(self.fs_applied_kb) \
+                if applied_kb is not None and self.fs_kb[row] and \
+                   self.fs_kb[row] < applied_kb]
+
+    def get_growing_fs_rows(self):
+        '''
+        Return the File System rows whose size is larger
+        than their applied size
+        '''
+
+        return [row for row, applied_kb in enumerate(self.fs_applied_kb) \
+                if applied_kb is not None and self.fs_kb[row] > applied_kb]
+
+    def get_vg_free_extents(self):
+        '''
+        Return the number of Physical Extents of every Volume Group
+        row left free for File Systems to grow into: the usable
+        extents less the thin pool, the snapshot reservations and
+        those of every thick File System at its applied size, or at
+        its size if not yet applied or shrinking
+        '''
+
+        free = [usable - pool for usable, pool in \
+                zip(self.vg_extents, self.get_vg_thin_pool_extents())]
+        for row, vg_row in enumerate(self.fs_vg_rows):
+            if self.fs_thin[row]:
+                continue
+            free[vg_row] -= self.get_fs_snapshot_extents(row)
+            applied_kb = self.fs_applied_kb[row]
+            if applied_kb is not None and self.fs_kb[row] > applied_kb:
+                free[vg_row] -= self.get_fs_extents(row, applied_kb)
+            else:
+                free[vg_row] -= self.get_fs_extents(row)
+
+        return free
+
+    def get_unfit_growing_fs_rows(self):
+        '''
+        Return the growing File System rows of the Volume Groups
+        whose free extents cannot hold all of their growth, along
+        with the extents each row grows by and the free extents
+        of every Volume Group row
+        '''
+
+        free = self.get_vg_free_extents()
+
+        growth = {}
+        for row in self.get_growing_fs_rows():
+            if self.fs_thin[row]:
+                continue
+            growth[row] = self.get_fs_extents(row) - \
+                          self.get_fs_extents(row, self.fs_applied_kb[row])
+
+        needed = [0] * len(self.vg_items)
+        for row, extents in growth.items():
+            needed[self.fs_vg_rows[row]] += extents
+
+        rows = sorted([row for row in growth \
+                       if self.vg_disks[self.fs_vg_rows[row]] and \
+                          needed[self.fs_vg_rows[row]] > \
+                          free[self.fs_vg_rows[row]]])
+
+        return rows, growth, free
+
+    def get_misaligned_fs_rows(self):
+        '''
+        Return the File System rows whose size is not an exact
+        multiple of the Physical Extent size of their Volume Group
+        '''
+
+        rows = []
+        for row, size_kb in enumerate(self.fs_kb):
+            extent_kb = self.vg_extent_kb[self.fs_vg_rows[row]]
+            if extent_kb and size_kb % extent_kb:
+                rows.append(row)
+
+        return rows
+
+    def get_invalid_extent_vg_rows(self):
+        '''
+        Return the Volume Group rows whose pe_size is not
+        a power of 2
+        '''
+
+        return [row for row, extent_kb in enumerate(self.vg_extent_kb) \
+                if not extent_kb]
+
+    def get_overflowing_vg_rows(self):
+        '''
+        Return the Volume Group rows whose Logical Volumes need
+        more Physical Extents than the nominated System Disks
+        provide, along with the used extents of every row
+        '''
+
+        used = self.get_vg_used_extents()
+        rows = [row for row, disks in enumerate(self.vg_disks) \
+                if disks and self.vg_extent_kb[row] and \
+                   used[row] > self.vg_extents[row]]
+
+        return rows, used
+
+    def get_misstriped_fs_rows(self):
+        '''
+        Return (row, reason) pairs for the striped File System rows
+        which cannot be laid out on the Physical Devices of their
+        Volume Group. reason is one of:
+          'stripes'     - not between 1 and the number of PDs
+          'stripe_size' - not a power of 2 between 4K and the extent
+          'alignment'   - size not a multiple of stripes x extent
+          'capacity'    - a stripe does not fit on enough disks
+        File Systems of a Volume Group with an invalid pe_size
+        or no Physical Devices are skipped.
+        '''
+
+        rows = []
+        for row, stripes in enumerate(self.fs_stripes):
+            vg_row = self.fs_vg_rows[row]
+            stripe_kb = self.fs_stripe_kb[row]
+            extent_kb = self.vg_extent_kb[vg_row]
+
+            if not extent_kb or not self.vg_pd_counts[vg_row]:
+                continue
+
+            if stripes < 1 or stripes > self.vg_pd_counts[vg_row]:
+                rows.append((row, 'stripes'))
+            elif stripe_kb is not None and \
+                 (stripe_kb < 4 or stripe_kb > extent_kb or \
+                  stripe_kb & (stripe_kb - 1)):
+                rows.append((row, 'stripe_size'))
+            elif stripes > 1 and self.fs_kb[row] % (stripes * extent_kb):
+                rows.append((row, 'alignment'))
+            elif stripes > 1 and self.vg_disks[vg_row] and \
+                 self.get_fs_extents(row) // stripes > \
+                 sorted(self.vg_pv_extents[vg_row],
+                        reverse=True)[stripes - 1]:
+                rows.append((row, 'capacity'))
+
+        return rows
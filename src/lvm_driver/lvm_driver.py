@@ -9,12 +9,19 @@
 ##############################################################################
 
 from litp.core.validators import ValidationError
-from litp.core.execution_manager import ConfigTask
-from volmgr_plugin.volmgr_utils import VolMgrUtils
-from litp.core.task import OrderedTaskList
+from litp.core.execution_manager import ConfigTask, CallbackTask
+from litp.core.extension import ViewError
+from volmgr_plugin.volmgr_utils import VolMgrUtils, Size
+from volmgr_plugin.volmgr_index import NodeStorageIndex
+from volmgr_plugin.volmgr_cache import VolMgrCache
+from lvm_driver.lvm_task_template import LvmTaskTemplate
+from lvm_driver.lvm_capacity import LvmCapacityChecker
+from volmgr_plugin.volmgr_mount import MountOptions
+
+from volmgr_plugin.volmgr_logging import VolMgrLogger
 
 from litp.core.litp_logging import LitpLogger
-log = LitpLogger()
+log = VolMgrLogger(LitpLogger())
 
 
 class LvmDriver(object):
@@ -22,19 +29,102 @@ class LvmDriver(object):
     LITP LVM Driver
     """
 
+    # Boot partition laid out by anaconda on a bootable System Disk
     SLASH_BOOT_SIZE = 500
 
-    VG_OVERHEAD = 100
+    # Partitions start and end on 1 MiB boundaries
+    PARTITION_ALIGNMENT = Size.parse('1M')
+
+    # Offset of the first Physical Extent, after the PV label
+    # and metadata area (the LVM default 'pe_start')
+    PV_DATA_OFFSET = Size.parse('1M')
 
     LOGICAL_EXTENT_SIZE_MB = 4
 
-    def _gen_file_system_device_name(self, vg, fs):
+    LOGICAL_EXTENT_SIZE = Size.from_megabytes(LOGICAL_EXTENT_SIZE_MB)
+
+    TEMPLATE_CACHE_SIZE = 64
+
+    # File System block size, set explicitly by mkfs whenever
+    # stripe geometry is expressed in blocks
+    FS_BLOCK_SIZE = Size.parse('4K')
+
+    # Stripe size LVM applies when a striped Volume sets none
+    DEFAULT_STRIPE_SIZE = Size.parse('64K')
+
+    LVM_BIN = '/sbin'
+
+    # Cache pool metadata area LVM allocates: a thousandth
+    # of the cache, and no less than 8M
+    CACHE_METADATA_MIN = Size.parse('8M')
+
+    CACHE_METADATA_RATIO = 1000
+
+    # Thin pool metadata area LVM allocates for 64K chunks: a
+    # 1024th of the pool, and no less than 2M
+    THIN_METADATA_MIN = Size.parse('2M')
+
+    THIN_METADATA_RATIO = 1024
+
+    THIN_POOL_NAME = 'thin_pool'
+
+    SNAPSHOT_SUFFIX = '_snapshot'
+
+    # File System types mounted from their Logical Volume
+    MOUNTED_TYPES = ['ext4', 'xfs']
+
+    # File System types lvextend resizes online (-r)
+    ONLINE_GROW_TYPES = ['ext4', 'xfs']
+
+    # udev rules tuning the block queue of the System Disks
+    UDEV_RULES_DIR = '/etc/udev/rules.d'
+
+    # Node agent actions per snapshot plan action
+    SNAPSHOT_ACTIONS = {'create': 'create_snapshot',
+                        'remove': 'remove_snapshot',
+                        'restore': 'merge_snapshot'}
+
+    # Declare all Logical Volumes of a Volume Group in one
+    # lvm::volume_group resource instead of one lvm::volume each
+    BATCH_VOLUMES = False
+
+    def __init__(self):
+        '''
+        Constructor
+        '''
+
+        self.template_cache = VolMgrCache(LvmDriver.TEMPLATE_CACHE_SIZE)
+
+    def _gen_volume_name(self, vg, fs, root=True):
+        '''
+        Generate the Logical Volume name of a File System.
+        The root Volume Group keeps the names given at installation;
+        in any other Volume Group the name is qualified with the
+        Volume Group item_id, as it is also the Task identifier.
+        '''
+
+        if root:
+            return fs.item_id
+        return "%s_%s" % (vg.item_id, fs.item_id)
+
+    def _gen_file_system_device_name(self, vg, fs, root=True):
         '''
         Generate File-System identifier
         This *MUST* synchronize with the
         puppet/modules/lvm/manifests/volume.pp filesystem identifier
         '''
-        return "/dev/%s/%s" % (vg.volume_group_name, fs.item_id)
+        return "/dev/%s/%s" % (vg.volume_group_name,
+                               self._gen_volume_name(vg, fs, root))
+
+    def _is_root_vg(self, node, vg):
+        '''
+        Return boolean True if vg is the root Volume Group of the Node
+        '''
+
+        try:
+            return vg.volume_group_name == node.storage_profile.view_root_vg
+        except ViewError:
+            return False
 
     def _suitable_state(self, items):
         '''
@@ -43,89 +133,724 @@ class LvmDriver(object):
 
         return any((item.is_initial() or item.is_updated()) for item in items)
 
-    def _gen_tasks_for_file_system(self, node, pd, vg, fs):
+    def _gen_exec_task(self, node, model_item, desc, call_id,
+                       command, unless):
+        '''
+        Generate an idempotent shell command Task
+        '''
+
+        return ConfigTask(node,
+                          model_item,
+                          desc,
+                          'exec',
+                          call_id,
+                          command=command,
+                          unless=unless,
+                          path=[LvmDriver.LVM_BIN, '/bin', '/usr/bin'],
+                          provider='shell')
+
+    def _get_grow_size(self, fs):
+        '''
+        Return the applied size of a File System which has been
+        updated to a larger size, else None. Only File Systems
+        resized online and swap are grown.
+        '''
+
+        if not fs.is_updated() or \
+           fs.type not in LvmDriver.ONLINE_GROW_TYPES + ['swap']:
+            return None
+
+        applied_size = Size.parse(VolMgrUtils.get_applied_property(fs,
+                                                                   'size'))
+        size = Size.parse(fs.size)
+        if applied_size is None or size is None or size <= applied_size:
+            return None
+
+        return applied_size
+
+    def _gen_grow_task(self, node, pd, vg, fs, root=True):
+        '''
+        Generate a Task growing the Logical Volume of an applied
+        File System, and its mounted File System, online to the
+        File System size. lvextend resizes an ext4 or xfs File
+        System itself (-r). Swap cannot be resized in use, so it is
+        turned off, extended, re-made and turned back on; the Node
+        runs without that swap meanwhile, and the Task fails before
+        turning it off unless available memory exceeds the swap in
+        use. The Task is skipped once the Volume has the size (and
+        swap is on).
+        '''
+
+        preamble = '._gen_grow_task: %s VG:%s, FS:%s : '
+
+        log.debug(preamble + "Growing Volume from %s to %s",
+                  node.item_id, vg.item_id, fs.item_id,
+                  VolMgrUtils.get_applied_property(fs, 'size'), fs.size)
+
+        lv_name = self._gen_volume_name(vg, fs, root)
+        fs_device = self._gen_file_system_device_name(vg, fs, root)
+        size = Size.parse(fs.size)
+
+        unless = ('test $(lvs --noheadings --nosuffix --units k ' + \
+                  '-o lv_size %s | cut -d. -f1) -ge %d') % \
+                 (fs_device, size.kilobytes)
+        desc = "Grow Volume: %s::%s::%s::%s" % \
+               (fs.item_id, vg.item_id, pd.item_id, node.item_id)
+        if fs.type == 'swap':
+            desc = "Grow Swap offline: %s::%s::%s::%s" % \
+                   (fs.item_id, vg.item_id, pd.item_id, node.item_id)
+            # Pages swapped out must fit in memory once swap is off
+            memory_check = ('awk -v dev="$(readlink -f %s)" ' + \
+                            "'$1 == dev {used = $4} " + \
+                            "/^MemAvailable:/ {avail = $2} " + \
+                            "END {exit used > 0 && used >= avail}' " + \
+                            '/proc/swaps /proc/meminfo') % fs_device
+            command = ' && '.join([memory_check,
+                                   'swapoff %s' % fs_device,
+                                   'lvextend -L %dk %s' % (size.kilobytes,
+                                                           fs_device),
+                                   'mkswap %s' % fs_device,
+                                   'swapon %s' % fs_device])
+            unless += ' && grep -q "^$(readlink -f %s) " /proc/swaps' % \
+                      fs_device
+        else:
+            command = 'lvextend -r -L %dk %s' % (size.kilobytes, fs_device)
+
+        return self._gen_exec_task(node, fs, desc,
+                    'lvextend_%s_%s' % (vg.volume_group_name, lv_name),
+                    command,
+                    unless)
+
+    def _gen_cache_tasks(self, node, pd, vg, fss, cache_disk,
+                         volume_tasks, root=True, vg_tasks=()):
+        '''
+        Generate the Tasks caching the Logical Volumes of the given
+        File Systems on the cache device of their Volume Group: the
+        cache device is added to the Volume Group, then a cache pool
+        is built on it for each cached File System and attached to
+        its Logical Volume. The cache mode of an attached cache pool
+        is changed in place.
+        The cache device is kept non-allocatable in the Volume Group,
+        so growing or creating Logical Volumes never allocates from
+        it; it is made allocatable only while a cache pool is built.
+        @param volume_tasks: Task creating the Logical Volume of each
+                             File System, keyed by File System item_id
+        @type volume_tasks: Dictionary
+        @param vg_tasks: Any other Tasks creating the Volume Group
+        @type vg_tasks: List of Tasks
+        '''
+
+        preamble = '._gen_cache_tasks: %s VG:%s : '
+
+        cached = [fs for fs in fss \
+                  if getattr(fs, 'cache_size', None) is not None]
+        if not cached:
+            return []
+
+        log.debug(preamble + "Caching %d Volumes on '%s'",
+                  node.item_id, vg.item_id, len(cached), cache_disk.name)
+
+        vg_name = vg.volume_group_name
+        cache_dev = self._gen_disk_fact(cache_disk)
+
+        vgextend_task = self._gen_exec_task(node, vg,
+                    "Cache Device: %s::%s::%s" % (vg.item_id, pd.item_id,
+                                                  node.item_id),
+                    'vgextend_%s_cache' % vg_name,
+                    'vgextend %s %s' % (vg_name, cache_dev),
+                    'pvs --noheadings -o vg_name %s | grep -qw %s' % \
+                    (cache_dev, vg_name))
+        for volume_task in list(volume_tasks.values()) + list(vg_tasks):
+            vgextend_task.requires.add(volume_task)
+
+        lock_task = self._gen_exec_task(node, vg,
+                    "Cache Device Allocation: %s::%s::%s" % \
+                    (vg.item_id, pd.item_id, node.item_id),
+                    'pvchange_%s_cache' % vg_name,
+                    'pvchange -x n %s' % cache_dev,
+                    "pvs --noheadings -o pv_attr %s | grep -q '^ *-'" % \
+                    cache_dev)
+        lock_task.requires.add(vgextend_task)
+
+        tasks = [vgextend_task, lock_task]
+        for fs in cached:
+            lv_name = self._gen_volume_name(vg, fs, root)
+            lv = '%s/%s' % (vg_name, lv_name)
+            pool_name = '%s_cache' % lv_name
+            policy = getattr(fs, 'cache_policy', None) or \
+                     VolMgrUtils.DEFAULT_CACHE_POLICY
+            ids = "%s::%s::%s::%s" % (fs.item_id, vg.item_id, pd.item_id,
+                                      node.item_id)
+
+            pool_task = self._gen_exec_task(node, fs,
+                    "Cache Pool: %s" % ids,
+                    'lvcreate_%s_%s' % (vg_name, pool_name),
+                    ('pvchange -x y %s && ' + \
+                     'lvcreate -y --type cache-pool -L %dk -n %s %s %s; ' + \
+                     'rc=$?; pvchange -x n %s && exit $rc') % \
+                    (cache_dev, Size.parse(fs.cache_size).kilobytes,
+                     pool_name, vg_name, cache_dev, cache_dev),
+                    'lvs --noheadings -o lv_name,pool_lv %s | grep -qw %s' % \
+                    (vg_name, pool_name))
+            pool_task.requires.add(lock_task)
+
+            attach_task = self._gen_exec_task(node, fs,
+                    "Cache: %s" % ids,
+                    'lvconvert_%s_%s_cache' % (vg_name, lv_name),
+                    'lvconvert -y --type cache --cachepool %s/%s ' \
+                    '--cachemode %s %s' % (vg_name, pool_name, policy, lv),
+                    'lvs --noheadings -o pool_lv %s | grep -qw %s' % \
+                    (lv, pool_name))
+            attach_task.requires.add(pool_task)
+            if fs.item_id in volume_tasks:
+                attach_task.requires.add(volume_tasks[fs.item_id])
+
+            mode_task = self._gen_exec_task(node, fs,
+                    "Cache Mode: %s" % ids,
+                    'lvchange_%s_%s_cachemode' % (vg_name, lv_name),
+                    'lvchange -y --cachemode %s %s' % (policy, lv),
+                    'lvs --noheadings -o cache_mode %s | grep -qw %s' % \
+                    (lv, policy))
+            mode_task.requires.add(attach_task)
+
+            tasks += [pool_task, attach_task, mode_task]
+
+        return tasks
+
+    def _gen_readahead_task(self, node, pd, vg, fs, root=True):
+        '''
+        Generate a Task setting the read ahead of the Logical Volume
+        of a File System to its readahead_kb, or None if unset.
+        The read ahead is held in the Volume Group metadata, so it
+        persists across reboots.
+        '''
+
+        readahead_kb = getattr(fs, 'readahead_kb', None)
+        if readahead_kb is None:
+            return None
+
+        lv = '%s/%s' % (vg.volume_group_name,
+                        self._gen_volume_name(vg, fs, root))
+        sectors = int(readahead_kb) * 2
+
+        return self._gen_exec_task(node, fs,
+                    "Read Ahead: %s::%s::%s::%s" % \
+                    (fs.item_id, vg.item_id, pd.item_id, node.item_id),
+                    'lvchange_%s_readahead' % lv.replace('/', '_'),
+                    'lvchange -y -r %d %s' % (sectors, lv),
+                    ('test "$(lvs --noheadings --nosuffix --units s ' + \
+                     '-o lv_read_ahead %s | cut -d. -f1 | tr -d \' \')" ' + \
+                     '= %d') % (lv, sectors))
+
+    def _gen_udev_rule(self, disk):
+        '''
+        Generate the udev rule applying the io_scheduler and
+        nr_requests of a System Disk to its block queue, or None
+        if neither is set
+        '''
+
+        attributes = []
+        io_scheduler = getattr(disk, 'io_scheduler', None)
+        if io_scheduler is not None:
+            attributes.append('ATTR{queue/scheduler}="%s"' % io_scheduler)
+        nr_requests = getattr(disk, 'nr_requests', None)
+        if nr_requests is not None:
+            attributes.append('ATTR{queue/nr_requests}="%s"' % nr_requests)
+
+        if not attributes:
+            return None
+
+        return ('ACTION=="add|change", SUBSYSTEM=="block", ' + \
+                'ENV{DEVTYPE}=="disk", ENV{ID_SERIAL}=="3%s", %s\n') % \
+                (disk.uuid, ', '.join(attributes))
+
+    def _gen_disk_tuning_tasks(self, node, disks):
+        '''
+        Generate the Tasks tuning the block queue of the given
+        System Disks: a persistent udev rule per tuned Disk, and
+        a Task applying it to the running Disk
+        '''
+
+        preamble = '._gen_disk_tuning_tasks: %s : '
+
+        tasks = []
+        for disk in disks:
+            rule = self._gen_udev_rule(disk)
+            if rule is None or not self._suitable_state([disk]):
+                continue
+
+            log.debug(preamble + "Tuning the block queue of '%s'",
+                      node.item_id, disk.name)
+
+            rule_file = '%s/99-litp-%s.rules' % (LvmDriver.UDEV_RULES_DIR,
+                                                 disk.uuid)
+            rule_task = ConfigTask(node,
+                                   disk,
+                                   "Disk Tuning Rule: %s::%s" % \
+                                   (disk.item_id, node.item_id),
+                                   'file',
+                                   rule_file,
+                                   path=rule_file,
+                                   ensure='file',
+                                   content=rule,
+                                   owner='0',
+                                   group='0',
+                                   mode='0644',
+                                   backup='false')
+
+            queue = '/sys/block/$(basename %s)/queue' % \
+                    self._gen_disk_fact(disk, whole=True)
+            checks = []
+            io_scheduler = getattr(disk, 'io_scheduler', None)
+            if io_scheduler is not None:
+                checks.append("grep -q '\\[%s\\]' %s/scheduler" % \
+                              (io_scheduler, queue))
+            nr_requests = getattr(disk, 'nr_requests', None)
+            if nr_requests is not None:
+                checks.append('grep -qx %s %s/nr_requests' % \
+                              (nr_requests, queue))
+
+            apply_task = self._gen_exec_task(node, disk,
+                    "Disk Tuning: %s::%s" % (disk.item_id, node.item_id),
+                    'udev_tune_%s' % disk.uuid,
+                    ('udevadm control --reload && udevadm trigger ' + \
+                     '--action=change --sysname-match=$(basename %s)') % \
+                    self._gen_disk_fact(disk, whole=True),
+                    ' && '.join(checks))
+            apply_task.requires.add(rule_task)
+
+            tasks += [rule_task, apply_task]
+
+        return tasks
+
+    def _is_thin(self, fs):
+        '''
+        Return boolean True if a File System is thin provisioned
+        '''
+
+        return getattr(fs, 'thin', None) == 'true'
+
+    def _gen_thin_pool_tasks(self, node, pd, vg, disks, volume_tasks):
+        '''
+        Generate the Tasks creating the thin pool of a Volume Group
+        on its Physical Devices. The Volume Group is created first,
+        unless a Volume Task of this plan creates it.
+        '''
+
+        preamble = '._gen_thin_pool_tasks: %s VG:%s : '
+
+        log.debug(preamble + "Generating thin pool tasks",
+                  node.item_id, vg.item_id)
+
+        vg_name = vg.volume_group_name
+        pvs = ' '.join([self._gen_disk_fact(disk) for disk in disks])
+        pe_size = getattr(vg, 'pe_size', None)
+        ids = "%s::%s::%s" % (vg.item_id, pd.item_id, node.item_id)
+
+        vg_task = self._gen_exec_task(node, vg,
+                    "Volume Group: %s" % ids,
+                    'vgcreate_%s' % vg_name,
+                    'vgcreate %s%s %s' % \
+                    ('-s %s ' % pe_size if pe_size else '', vg_name, pvs),
+                    'vgs %s' % vg_name)
+        for volume_task in volume_tasks.values():
+            vg_task.requires.add(volume_task)
+
+        pool_task = self._gen_exec_task(node, vg,
+                    "Thin Pool: %s" % ids,
+                    'lvcreate_%s_%s' % (vg_name, LvmDriver.THIN_POOL_NAME),
+                    'lvcreate -y --type thin-pool -L %dk -n %s %s %s' % \
+                    (Size.parse(vg.thin_pool_size).kilobytes,
+                     LvmDriver.THIN_POOL_NAME, vg_name, pvs),
+                    'lvs %s/%s' % (vg_name, LvmDriver.THIN_POOL_NAME))
+        pool_task.requires.add(vg_task)
+
+        return [vg_task, pool_task]
+
+    def _gen_tasks_for_thin_file_system(self, node, pd, vg, fs, templates,
+                                        pool_task, root=True):
+        '''
+        Generate all Tasks for a thin File System: its thin Volume
+        in the thin pool of the Volume Group and the File System on
+        it, followed by the Mount Tasks. The Mounts depend on the
+        File System Task in place of a Volume Task.
+        '''
+
+        preamble = '._gen_tasks_for_thin_file_system: %s VG:%s, FS:%s : '
+
+        log.debug(preamble + "Generating thin Volume tasks",
+                  node.item_id, vg.item_id, fs.item_id)
+
+        vg_name = vg.volume_group_name
+        lv_name = self._gen_volume_name(vg, fs, root)
+        fs_device = self._gen_file_system_device_name(vg, fs, root)
+        ids = [fs.item_id, vg.item_id, pd.item_id, node.item_id]
+
+        thin_task = self._gen_exec_task(node, fs,
+                    "Thin Volume: %s" % '::'.join(ids),
+                    'lvcreate_%s_%s' % (vg_name, lv_name),
+                    'lvcreate -y --thin -V %dk -n %s %s/%s' % \
+                    (Size.parse(fs.size).kilobytes, lv_name, vg_name,
+                     LvmDriver.THIN_POOL_NAME),
+                    'lvs %s/%s' % (vg_name, lv_name))
+        if pool_task is not None:
+            thin_task.requires.add(pool_task)
+
+        mkfs_task = self._gen_exec_task(node, fs,
+                    "File System: %s" % '::'.join(ids),
+                    'mkfs_%s_%s' % (vg_name, lv_name),
+                    ' '.join([command for command in \
+                              ('mkfs.%s' % fs.type,
+                               self._gen_mkfs_options(fs), fs_device) \
+                              if command]),
+                    'blkid %s' % fs_device)
+        mkfs_task.requires.add(thin_task)
+
+        tasks = [mkfs_task] + [template.instantiate(node, fs, ids) \
+                               for template in templates[1:]]
+        tasks = [thin_task] + LvmTaskTemplate.link(tasks, templates)
+
+        readahead_task = self._gen_readahead_task(node, pd, vg, fs, root)
+        if readahead_task is not None:
+            readahead_task.requires.add(thin_task)
+            tasks.append(readahead_task)
+
+        if self._get_grow_size(fs) is not None:
+            tasks.insert(0, self._gen_grow_task(node, pd, vg, fs, root))
+
+        return tasks
+
+    def gen_snapshot_tasks(self, node, vg, action, callback, index=None):
+        '''
+        Generate the Tasks taking, removing or restoring the
+        snapshots of the applied File Systems of a given Volume
+        Group for a snapshot plan. Thin File Systems are snapshotted
+        within their thin pool; thick File Systems only with a
+        snap_size, that percentage of their size being reserved in
+        the Volume Group. Restoring merges each snapshot back into
+        its Volume; for a File System in use the merge completes
+        when the Volume is next activated.
+        @param action: Snapshot plan action: create, remove or restore
+        @type action: String
+        @param callback: Plugin method running an agent action on
+                         the Node: callback(api, hostname, action,
+                         **arguments)
+        @return: One CallbackTask per snapshotted File System
+        @rtype: List of CallbackTasks
+        '''
+
+        preamble = '.gen_snapshot_tasks: %s VG:%s : '
+
+        agent_action = LvmDriver.SNAPSHOT_ACTIONS.get(action)
+        if agent_action is None:
+            log.debug(preamble + "Ignoring snapshot action '%s'",
+                      node.item_id, vg.item_id, action)
+            return []
+
+        root = self._is_root_vg(node, vg)
+
+        tasks = []
+        for fs in vg.file_systems:
+            if fs.is_initial() or fs.type in ('swap', 'tmpfs'):
+                continue
+
+            lv_name = self._gen_volume_name(vg, fs, root)
+            arguments = {'vg': vg.volume_group_name,
+                         'lv': lv_name,
+                         'name': lv_name + LvmDriver.SNAPSHOT_SUFFIX}
+            if not self._is_thin(fs):
+                snap_pct = LvmCapacityChecker._parse_snap_pct(
+                                        getattr(fs, 'snap_size', None))
+                if not snap_pct:
+                    continue
+                if action == 'create':
+                    arguments['size'] = '%dk' % \
+                        -(-Size.parse(fs.size).kilobytes * snap_pct // 100)
+
+            log.debug(preamble + "%s of '%s'", node.item_id, vg.item_id,
+                      agent_action, lv_name)
+
+            tasks.append(CallbackTask(fs,
+                         "Snapshot %s: %s::%s::%s" % \
+                         (action, fs.item_id, vg.item_id, node.item_id),
+                         callback,
+                         node.hostname,
+                         agent_action,
+                         **arguments))
+
+        return tasks
+
+    def _get_cache_disk(self, vg, index):
+        '''
+        Return the System Disk nominated as the cache device
+        of a Volume Group, or None
+        '''
+
+        cache_device = getattr(vg, 'cache_device', None)
+        if cache_device is None:
+            return None
+
+        return index.disks_by_name.get(cache_device)
+
+    def _gen_tasks_for_file_system(self, node, pd, vg, fs, disks, templates,
+                                   root=True):
         '''
         Generate all Tasks for a File System in
         a given Volume Group on a given Node.
+        A File System updated to a larger size is grown online
+        first, so the Volume Task finds it at its new size.
         '''
 
-        preamble = '._gen_tasks_for_file_system: %s PD:%s, VG:%s, FS:%s : ' % \
-                   (node.item_id, pd.item_id, vg.item_id, fs.item_id)
+        preamble = '._gen_tasks_for_file_system: %s PD:%s, VG:%s, FS:%s : '
 
-        log.trace.debug((preamble + \
-                         "Generating tasks for File System '%s'") % \
-                         fs.item_id)
+        log.debug(preamble + "Generating tasks for File System '%s'",
+                  node.item_id, pd.item_id, vg.item_id, fs.item_id,
+                  fs.item_id)
 
-        tasks = []
-        tasks.append(self._gen_task_for_volume(node, pd, vg, fs))
+        ids = [fs.item_id, vg.item_id, pd.item_id, node.item_id]
 
-        if fs.type == 'ext4':
-            fs_mount_tasks = self._gen_tasks_for_fs_mount(node, pd, vg, fs)
-            if fs_mount_tasks:
-                tasks += fs_mount_tasks
-                return [OrderedTaskList(node.storage_profile, tasks)]
+        volume_template = templates[0]
+        tasks = [volume_template.instantiate(node, fs, ids,
+                                             pv=self._gen_pv_binding(disks))]
+
+        tasks += [template.instantiate(node, fs, ids) \
+                  for template in templates[1:]]
+
+        tasks = LvmTaskTemplate.link(tasks, templates)
+
+        readahead_task = self._gen_readahead_task(node, pd, vg, fs, root)
+        if readahead_task is not None:
+            readahead_task.requires.add(tasks[0])
+            tasks.append(readahead_task)
+
+        if self._get_grow_size(fs) is not None:
+            grow_task = self._gen_grow_task(node, pd, vg, fs, root)
+            tasks[0].requires.add(grow_task)
+            tasks.insert(0, grow_task)
 
         return tasks
 
-    def _get_node_disk_for_pd(self, node, pd):
+    def _gen_tasks_for_tmpfs(self, node, pd, vg, fs, templates):
         '''
-        Iterate the Node System disks and locate the exact Disk
-        referenced by the Physical Device
+        Generate the Mount Tasks of a tmpfs File System
         '''
 
-        for disk in node.system.disks:
-            if disk.name == pd.device_name:
-                return disk
+        preamble = '._gen_tasks_for_tmpfs: %s VG:%s, FS:%s : '
+
+        log.debug(preamble + "Generating tmpfs Mount tasks",
+                  node.item_id, vg.item_id, fs.item_id)
+
+        ids = [fs.item_id, vg.item_id, pd.item_id, node.item_id]
+        tasks = [template.instantiate(node, fs, ids) \
+                 for template in templates]
+
+        return LvmTaskTemplate.link(tasks, templates)
+
+    def _gen_tasks_for_volume_group_batch(self, node, pd, vg, fss, disks,
+                                          templates, root=True):
+        '''
+        Generate a single Task declaring every Logical Volume of a
+        given Volume Group, followed by the Mount Tasks of the
+        given File Systems. Each Mount depends on the Volume Group
+        Task in place of the Volume Task of its File System.
+        Any File Systems growing are grown first.
+        '''
+
+        preamble = '._gen_tasks_for_volume_group_batch: %s PD:%s, VG:%s : '
+
+        log.debug(preamble + "Generating batched Volume Group task",
+                  node.item_id, pd.item_id, vg.item_id)
 
-    def _gen_task_for_volume(self, node, pd, vg, fs):
+        volumes = {}
+        for fs in vg.file_systems:
+            if self._is_thin(fs) or fs.type == 'tmpfs':
+                continue
+            volume_template = templates[fs.item_id][0]
+            volume_kwargs = volume_template.kwargs
+            volume = {'size': volume_kwargs['size'],
+                      'fstype': volume_kwargs['fstype']}
+            for key in ('stripes', 'stripesize', 'mkfs_options'):
+                if key in volume_kwargs:
+                    volume[key] = volume_kwargs[key]
+            volumes[volume_template.call_id] = volume
+
+        desc = "Volume Group: %s::%s::%s" % \
+               (vg.item_id, pd.item_id, node.item_id)
+
+        vg_kwargs = {}
+        pe_size = getattr(vg, 'pe_size', None)
+        if pe_size is not None:
+            vg_kwargs['pe_size'] = pe_size
+
+        vg_task = ConfigTask(node,
+                             vg,
+                             desc,
+                             'lvm::volume_group',
+                             vg.volume_group_name,
+                             ensure='present',
+                             pv=self._gen_pv_binding(disks),
+                             volumes=volumes,
+                             **vg_kwargs)
+
+        grow_tasks = [self._gen_grow_task(node, pd, vg, fs, root) \
+                      for fs in fss if self._get_grow_size(fs) is not None]
+        for grow_task in grow_tasks:
+            vg_task.requires.add(grow_task)
+
+        tasks = grow_tasks + [vg_task]
+        for fs in fss:
+            ids = [fs.item_id, vg.item_id, pd.item_id, node.item_id]
+            fs_tasks = [vg_task] + [template.instantiate(node, fs, ids) \
+                                    for template in templates[fs.item_id][1:]]
+            tasks += LvmTaskTemplate.link(fs_tasks,
+                                          templates[fs.item_id])[1:]
+            readahead_task = self._gen_readahead_task(node, pd, vg, fs, root)
+            if readahead_task is not None:
+                readahead_task.requires.add(vg_task)
+                tasks.append(readahead_task)
+
+        return tasks
+
+    def _get_node_disk_for_pd(self, node, pd, index=None):
         '''
-        Generate a Task for a Volume in a given Volume Group
-        on a given Physical Device on a given Node.
+        Locate the exact Node System Disk
+        referenced by the Physical Device
         '''
 
-        preamble = '._gen_task_for_volume: %s PD:%s, VG:%s, FS:%s : ' % \
-                   (node.item_id, pd.item_id, vg.item_id, fs.item_id)
+        if index is None:
+            index = NodeStorageIndex(node)
 
-        log.trace.debug(preamble + "Generating Volume task")
+        return index.get_pd_disk(pd)
 
-        disk = self._get_node_disk_for_pd(node, pd)
+    def _gen_disk_fact(self, disk, whole=False):
+        '''
+        Generate the Facter fact naming the device
+        of a System Disk on which to place the VG,
+        or naming the whole Disk
+        '''
 
         disk_fact = '$::disk_scsi' + '_3' + disk.uuid
-        if disk.bootable == 'true':
+        if disk.bootable == 'true' and not whole:
             # If the device is bootable then anaconda has already
             # partitioned the disk therfore put the VG on partition 2
             disk_fact += '_part2'
         disk_fact += '_dev'
 
-        desc = "Volume: %s::%s::%s::%s" % \
-               (fs.item_id, vg.item_id, pd.item_id, node.item_id)
+        return disk_fact
 
-        task = ConfigTask(node,
-                          fs,
-                          desc,
-                          'lvm::volume',
-                          fs.item_id,
-                          ensure='present',
-                          pv=disk_fact,
-                          vg=vg.volume_group_name,
-                          fstype=fs.type,
-                          size=fs.size)
-        return task
+    def _gen_pv_binding(self, disks):
+        '''
+        Generate the Physical Volume binding of a Volume Group:
+        the device fact of its only System Disk, or the list of
+        device facts when the Volume Group spans several Disks
+        '''
+
+        disk_facts = [self._gen_disk_fact(disk) for disk in disks]
+        if len(disk_facts) == 1:
+            return disk_facts[0]
+        return disk_facts
 
-    def _gen_tasks_for_fs_mount(self, node, pd, vg, fs):
+    def _gen_stripe_geometry(self, fs):
         '''
-        Generate Tasks to Mount a File System
+        Return the (stripes, stripe size) of a striped File System,
+        or None if the File System is not striped
         '''
 
-        # We skip over the / ext4 filesystem
-        if fs.mount_point == "/":
-            return []
+        try:
+            stripes = int(getattr(fs, 'stripes', None) or 1)
+        except ValueError:
+            return None
+        if stripes < 2:
+            return None
 
-        desc = "Mount Directory: %s::%s::%s::%s" % \
-               (fs.item_id, vg.item_id, pd.item_id, node.item_id)
-        file_task = ConfigTask(node,
-                               fs,
-                               desc,
+        stripe_size = Size.parse(getattr(fs, 'stripe_size', None)) or \
+                      LvmDriver.DEFAULT_STRIPE_SIZE
+
+        return stripes, stripe_size
+
+    def _gen_mkfs_options(self, fs):
+        '''
+        Generate the mkfs options of a File System from its stripe
+        geometry and inode_ratio. An explicit 'mkfs_options' property
+        overrides the generated options. Returns an empty string
+        if mkfs defaults apply.
+        '''
+
+        mkfs_options = getattr(fs, 'mkfs_options', None)
+        if mkfs_options:
+            return mkfs_options
+
+        geometry = self._gen_stripe_geometry(fs)
+        options = []
+
+        if fs.type == 'ext4':
+            if geometry:
+                stripes, stripe_size = geometry
+                block_size = LvmDriver.FS_BLOCK_SIZE
+                stride = max(stripe_size.kilobytes // \
+                             block_size.kilobytes, 1)
+                options.append('-b %d' % (block_size.kilobytes * 1024))
+                options.append('-E stride=%d,stripe_width=%d' % \
+                               (stride, stride * stripes))
+
+            inode_ratio = getattr(fs, 'inode_ratio', None)
+            if inode_ratio in VolMgrUtils.INODE_RATIO_TYPES:
+                options.append('-T ' + inode_ratio)
+            elif inode_ratio:
+                options.append('-i ' + inode_ratio)
+
+        elif fs.type == 'xfs' and geometry:
+            stripes, stripe_size = geometry
+            options.append('-d su=%dk,sw=%d' % (stripe_size.kilobytes,
+                                                stripes))
+
+        return ' '.join(options)
+
+    def _gen_template_for_volume(self, vg, fs, root=True):
+        '''
+        Generate a Task template for a Volume in a given Volume Group.
+        The Physical Volume is bound per Node. The Volume Group is
+        created with its Physical Extent size, if set. A striped Volume
+        also carries its stripe count and stripe size, and the
+        File System is created with any generated mkfs options.
+        '''
+
+        preamble = '._gen_template_for_volume: VG:%s, FS:%s : '
+
+        log.debug(preamble + "Generating Volume template",
+                  vg.item_id, fs.item_id)
+
+        kwargs = {}
+        pe_size = getattr(vg, 'pe_size', None)
+        if pe_size is not None:
+            kwargs['pe_size'] = pe_size
+        stripes = getattr(fs, 'stripes', None)
+        if stripes is not None:
+            kwargs['stripes'] = stripes
+            stripe_size = getattr(fs, 'stripe_size', None)
+            if stripe_size is not None:
+                kwargs['stripesize'] = stripe_size
+
+        mkfs_options = self._gen_mkfs_options(fs)
+        if mkfs_options:
+            kwargs['mkfs_options'] = mkfs_options
+
+        return LvmTaskTemplate('Volume',
+                               'lvm::volume',
+                               self._gen_volume_name(vg, fs, root),
+                               ensure='present',
+                               vg=vg.volume_group_name,
+                               fstype=fs.type,
+                               size=fs.size,
+                               **kwargs)
+
+    def _gen_template_for_mount_directory(self, fs):
+        '''
+        Generate a Task template for the Mount Directory
+        of a File System
+        '''
+
+        return LvmTaskTemplate('Mount Directory',
                                'file',
                                fs.mount_point,
                                path=fs.mount_point,
@@ -135,151 +860,548 @@ class LvmDriver(object):
                                mode="0755",
                                backup='false')
 
-        desc = "Mount: %s::%s::%s::%s" % \
-               (fs.item_id, vg.item_id, pd.item_id, node.item_id)
+    def _gen_templates_for_tmpfs(self, fs):
+        '''
+        Generate Task templates to Mount a tmpfs File System,
+        which has no Volume: the Mount Directory, then the Mount,
+        capped at the File System size.
+        '''
 
-        fs_device = self._gen_file_system_device_name(vg, fs)
-        mount_task = ConfigTask(node,
-                                fs,
-                                desc,
-                                'mount',
-                                fs.mount_point,
-                                fstype=fs.type,
-                                device=fs_device,
-                                ensure='mounted',
-                                options="defaults",
-                                atboot="true")
-        return [file_task, mount_task]
-
-    def gen_tasks_for_volume_group(self, node, vg):
+        file_template = self._gen_template_for_mount_directory(fs)
+        mount_template = LvmTaskTemplate('Mount',
+                                         'mount',
+                                         fs.mount_point,
+                                         requires=(0,),
+                                         fstype='tmpfs',
+                                         device='tmpfs',
+                                         ensure='mounted',
+                                         options=MountOptions.\
+                                                 get_options_string(fs),
+                                         atboot="true")
+        return [file_template, mount_template]
+
+    def _gen_templates_for_fs_mount(self, vg, fs, root=True):
         '''
-        Generate all Tasks for a given Volume Group
-        for a given Managed Node.
+        Generate Task templates to Mount a File System.
+        The Mount depends on both the Volume and the Mount Directory,
+        which are independent of each other.
         '''
-        preamble = '.gen_tasks_for_volume_group: %s VG:%s : ' % \
-                   (node.item_id, vg.item_id)
 
-        log.trace.debug((preamble + \
-                         "Generating tasks for Volume Group '%s'") % \
-                         vg.item_id)
-        tasks = []
-        the_pd = None
+        # We skip over the / ext4 filesystem
+        if fs.mount_point == "/":
+            return []
+
+        file_template = self._gen_template_for_mount_directory(fs)
+
+        fs_device = self._gen_file_system_device_name(vg, fs, root)
+        options = MountOptions.get_options_string(fs)
+        mount_template = LvmTaskTemplate('Mount',
+                                         'mount',
+                                         fs.mount_point,
+                                         requires=(0, 1),
+                                         fstype=fs.type,
+                                         device=fs_device,
+                                         ensure='mounted',
+                                         options=options,
+                                         atboot="true")
+        return [file_template, mount_template]
+
+    def _gen_templates_for_file_system(self, vg, fs, root=True):
+        '''
+        Generate the Task templates for a File System in a given
+        Volume Group: the Volume template first, then any
+        Mount templates. A tmpfs File System has Mount
+        templates only.
+        '''
+
+        if fs.type == 'tmpfs':
+            return self._gen_templates_for_tmpfs(fs)
+
+        templates = [self._gen_template_for_volume(vg, fs, root)]
+
+        if fs.type in LvmDriver.MOUNTED_TYPES:
+            templates += self._gen_templates_for_fs_mount(vg, fs, root)
+
+        return templates
 
-        for pd in vg.physical_devices:
-            the_pd = pd   # Only 1 PD per VG allowed/expected
-            break
+    def _get_volume_group_templates(self, vg, fingerprint=None, root=True):
+        '''
+        Return the Task templates of every File System in a given
+        Volume Group, keyed by File System item_id. Templates are
+        cached against the Storage Profile fingerprint, so Nodes
+        sharing a Storage Profile share the templates.
+        '''
+
+        preamble = '._get_volume_group_templates: VG:%s : '
 
+        key = (fingerprint, vg.get_vpath(), root)
+        if fingerprint is not None:
+            templates = self.template_cache.get(key)
+            if templates is not None:
+                log.debug(preamble + "Reusing cached templates", vg.item_id)
+                return templates
+
+        templates = {}
         for fs in vg.file_systems:
-            if self._suitable_state([the_pd, vg, fs]):
-                tasks += self._gen_tasks_for_file_system(node, the_pd, vg, fs)
+            templates[fs.item_id] = self._gen_templates_for_file_system(vg,
+                                                                 fs, root)
 
-        return tasks
+        if fingerprint is not None:
+            self.template_cache.put(key, templates)
 
-# -------------
+        return templates
 
-    def _validate_vg_size_against_disk(self, node, vg, disk, rule_number):
+    def iter_tasks_for_volume_group(self, node, vg, index=None):
         '''
-        Validate the File System for a given Volume Group
-        will fit on the nominated System Disk.
+        Generate all Tasks for a given Volume Group
+        for a given Managed Node, yielding them
+        one File System at a time.
         '''
+        preamble = '.iter_tasks_for_volume_group: %s VG:%s : '
+
+        log.debug(preamble + "Generating tasks for Volume Group '%s'",
+                  node.item_id, vg.item_id, vg.item_id)
+
+        if index is None:
+            index = NodeStorageIndex(node)
+
+        pds = list(vg.physical_devices)
+        if not pds:
+            log.debug(preamble + "No Physical Devices, skipping",
+                      node.item_id, vg.item_id)
+            return
+
+        the_pd = pds[0]   # Names the Tasks of the Volume Group
+
+        the_disks = [self._get_node_disk_for_pd(node, pd, index) \
+                     for pd in pds]
+        if None in the_disks:
+            # Reported by validation rule 1.1
+            log.debug(preamble + "A Physical Device has no System Disk, " + \
+                      "skipping", node.item_id, vg.item_id)
+            return
+
+        root = self._is_root_vg(node, vg)
+        templates = self._get_volume_group_templates(vg,
+                                          index.get_profile_fingerprint(),
+                                          root)
 
-        preamble = '_validate_vg_size_against_disk: %s VG:%s, Rule:%s : ' % \
-                   (node.item_id, vg.item_id, rule_number)
+        fss = [fs for fs in vg.file_systems \
+               if self._suitable_state(pds + [vg, fs])]
+        tmpfs_fss = [fs for fs in fss if fs.type == 'tmpfs']
+        thin_fss = [fs for fs in fss \
+                    if self._is_thin(fs) and fs.type != 'tmpfs']
+        thick_fss = [fs for fs in fss \
+                     if fs not in tmpfs_fss and fs not in thin_fss]
 
-        sizes = [VolMgrUtils.get_size_megabytes(fs.size) \
-                    for fs in vg.file_systems]
-        vg_cumulative_size = sum(sizes)
+        volume_tasks = {}
+        if LvmDriver.BATCH_VOLUMES:
+            if thick_fss:
+                for task in self._gen_tasks_for_volume_group_batch(node,
+                                                  the_pd, vg, thick_fss,
+                                                  the_disks, templates, root):
+                    if task.call_type == 'lvm::volume_group':
+                        volume_tasks = dict((fs.item_id, task) \
+                                            for fs in thick_fss)
+                    yield task
+        else:
+            for fs in thick_fss:
+                for task in self._gen_tasks_for_file_system(node, the_pd,
+                                                        vg, fs, the_disks,
+                                                        templates[fs.item_id],
+                                                        root):
+                    if task.call_type == 'lvm::volume':
+                        volume_tasks[fs.item_id] = task
+                    yield task
 
-        disk_size = VolMgrUtils.get_size_megabytes(disk.size)
+        pool_tasks = []
+        if getattr(vg, 'thin_pool_size', None) is not None and \
+           (thin_fss or self._suitable_state(pds + [vg])):
+            pool_tasks = self._gen_thin_pool_tasks(node, the_pd, vg,
+                                                   the_disks, volume_tasks)
+            for task in pool_tasks:
+                yield task
 
-        sundries = LvmDriver.VG_OVERHEAD
+        for fs in thin_fss:
+            for task in self._gen_tasks_for_thin_file_system(node, the_pd,
+                                        vg, fs, templates[fs.item_id],
+                                        pool_tasks[-1] if pool_tasks \
+                                        else None, root):
+                yield task
 
-        if disk.bootable == 'true':
-            sundries += LvmDriver.SLASH_BOOT_SIZE
+        for fs in tmpfs_fss:
+            for task in self._gen_tasks_for_tmpfs(node, the_pd, vg, fs,
+                                                  templates[fs.item_id]):
+                yield task
 
-        if (vg_cumulative_size + sundries) > disk_size:
-            message = ("The System Disk (size = %s) does not have " + \
-                       "sufficient space for all File Systems " + \
-                       "(%d MBs) plus sundries (%d MBs)") % \
-                       (disk.size, vg_cumulative_size, sundries)
-            log.trace.debug(preamble + message)
+        cache_disk = self._get_cache_disk(vg, index)
+        if cache_disk is not None:
+            for task in self._gen_cache_tasks(node, the_pd, vg, thick_fss,
+                                              cache_disk, volume_tasks, root,
+                                              pool_tasks[:1]):
+                yield task
+
+        tuned_disks = list(the_disks)
+        if cache_disk is not None:
+            tuned_disks.append(cache_disk)
+        for task in self._gen_disk_tuning_tasks(node, tuned_disks):
+            yield task
+
+    def gen_tasks_for_volume_group(self, node, vg, index=None):
+        '''
+        Generate all Tasks for a given Volume Group
+        for a given Managed Node.
+        '''
+
+        return list(self.iter_tasks_for_volume_group(node, vg, index))
+
+# -------------
+
+    def _validate_vg_size_against_disk(self, node, vg, disks,
+                                       used_extents, usable_extents,
+                                       extent_kb, rule_number,
+                                       subject='all File Systems'):
+        '''
+        Validate the File System for a given Volume Group
+        will fit on the nominated System Disks.
+        '''
+
+        preamble = '_validate_vg_size_against_disk: %s VG:%s, Rule:%s : '
+
+        if used_extents > usable_extents:
+            if len(disks) == 1:
+                message = "The System Disk (size = %s) does not have " % \
+                          disks[0].size
+            else:
+                message = "The System Disks (sizes = %s) do not have " % \
+                          ', '.join([disk.size for disk in disks])
+            message += ("sufficient space for %s " + \
+                        "(%d extents of %s required, %d usable, " + \
+                        "short by %d extents)") % \
+                        (subject, used_extents, Size(extent_kb),
+                         usable_extents,
+                         used_extents - usable_extents)
+            log.debug(preamble + "%s",
+                      node.item_id, vg.item_id, rule_number, message)
             return ValidationError(item_path=vg.get_vpath(),
                                    error_message=message)
         return None
 
-    def _validate_disk_sizes(self, node, rule_number):
+    def _validate_disk_sizes(self, checker, rule_number, skip_rows=None):
         '''
         Validate that the Volume Groups can fit on the
-        nominated System disks
+        nominated System disks, for every Node of the checker.
+        The usable extents and headroom of every Volume Group
+        are logged. Volume Group rows already reported by another
+        rule may be skipped. Returns (node row, error) pairs.
+        '''
+
+        preamble = '_validate_disk_sizes: Rule:%s : '
+
+        rows, totals = checker.get_overflowing_vg_rows()
+        log.debug(preamble + "%d of %d Volume Groups do not fit",
+                  rule_number, len(rows), len(checker.vg_items))
+
+        if log.is_debug_enabled():
+            for row, vg in enumerate(checker.vg_items):
+                log.debug(preamble + "%s VG:%s : %d of %d usable " + \
+                          "extents used, headroom %d extents",
+                          rule_number,
+                          checker.nodes[checker.vg_node_rows[row]].item_id,
+                          vg.item_id, totals[row], checker.vg_extents[row],
+                          checker.vg_extents[row] - totals[row])
+
+        errors = []
+        for row in rows:
+            if skip_rows and row in skip_rows:
+                continue
+            node_row = checker.vg_node_rows[row]
+            error = self._validate_vg_size_against_disk(
+                                               checker.nodes[node_row],
+                                               checker.vg_items[row],
+                                               checker.vg_disks[row],
+                                               totals[row],
+                                               checker.vg_extents[row],
+                                               checker.vg_extent_kb[row],
+                                               rule_number)
+            if error:
+                errors.append((node_row, error))
+
+        return errors
+
+    def _validate_cache_sizes(self, checker, rule_number):
+        '''
+        Validate that the cache pools of the cached File Systems
+        of a Volume Group fit on its cache device, for every Node
+        of the checker. Returns (node row, error) pairs.
         '''
 
-        preamble = '_validate_disk_sizes: %s Rule:%s : ' % \
-                   (node.item_id, rule_number)
+        rows, totals = checker.get_overflowing_cache_vg_rows()
 
         errors = []
-        for vg in node.storage_profile.volume_groups:
-
-            for pd in vg.physical_devices:
-
-                for disk in node.system.disks:
-                    if disk.name and (disk.name == pd.device_name):
-                        log.trace.debug((preamble + \
-                                         "Will validate %s against %s") % \
-                                        (vg.item_id, disk.item_id))
-                        error = self._validate_vg_size_against_disk(node,
-                                                                   vg,
-                                                                   disk,
-                                                                   rule_number)
-                        if error:
-                            errors.append(error)
-                        break
-
-                # At present only 1 Physical Device is supported
-                break
+        for row in rows:
+            node_row = checker.vg_node_rows[row]
+            error = self._validate_vg_size_against_disk(
+                                               checker.nodes[node_row],
+                                               checker.vg_items[row],
+                                               [checker.vg_cache_disks[row]],
+                                               totals[row],
+                                               checker.vg_cache_extents[row],
+                                               checker.vg_extent_kb[row],
+                                               rule_number,
+                                               'the File System caches')
+            if error:
+                errors.append((node_row, error))
 
         return errors
 
-    def _is_extent_multiple(self, size):
+    def _validate_thin_overcommit(self, checker, rule_number):
         '''
-        Return boolean True if FS size is a multiple of Logical Extent
+        Validate that the thin File Systems of a Volume Group add
+        up to no more than its thin pool size times its overcommit
+        ratio, for every Node of the checker.
+        Returns (node row, error) pairs.
         '''
 
-        size_mb = VolMgrUtils.get_size_megabytes(size)
-        if (int(size_mb) % LvmDriver.LOGICAL_EXTENT_SIZE_MB) == 0:
-            return True
+        preamble = '_validate_thin_overcommit: %s Rule:%s : '
+
+        rows, thin_kb = checker.get_overcommitted_vg_rows()
 
-        return False
+        errors = []
+        for row in rows:
+            node_row = checker.vg_node_rows[row]
+            vg = checker.vg_items[row]
+            msg = ("Thin File Systems (total = %s) exceed the " + \
+                   "thin_pool_size '%s' times the overcommit " + \
+                   "ratio %g") % \
+                   (Size(thin_kb[row]), vg.thin_pool_size,
+                    checker.vg_overcommit[row])
+            log.debug(preamble + "%s", checker.nodes[node_row].item_id,
+                      rule_number, msg)
+            error = ValidationError(item_path=vg.get_vpath(),
+                                    error_message=msg)
+            errors.append((node_row, error))
+
+        return errors
 
-    def _validate_fs_size(self, node, rule_number):
+    def _validate_fs_size(self, checker, rule_number):
         '''
-        Validate that FS size is multiple of Logical Extent
+        Validate that FS size is multiple of Logical Extent,
+        for every Node of the checker.
+        Returns (node row, error) pairs.
         '''
 
-        preamble = '_validate_fs_size: %s Rule:%s : ' % \
-                   (node.item_id, rule_number)
+        preamble = '_validate_fs_size: %s Rule:%s : '
 
         errors = []
-        for vg in node.storage_profile.volume_groups:
-            for fs in vg.file_systems:
-                if not self._is_extent_multiple(fs.size):
-                    msg = ("File System size '%s' is not an exact " + \
-                           "multiple of the LVM Logical Extent " + \
-                           "size ('%d')") % \
-                           (fs.size, LvmDriver.LOGICAL_EXTENT_SIZE_MB)
-                    log.trace.debug(preamble + msg)
-                    error = ValidationError(item_path=fs.get_vpath(),
-                                            error_message=msg)
-                    errors.append(error)
+        for row in checker.get_misaligned_fs_rows():
+            node_row = checker.fs_node_rows[row]
+            fs = checker.fs_items[row]
+            extent_kb = checker.vg_extent_kb[checker.fs_vg_rows[row]]
+            msg = ("File System size '%s' is not an exact " + \
+                   "multiple of the LVM Logical Extent " + \
+                   "size ('%s')") % \
+                   (fs.size, self._format_extent_size(extent_kb))
+            log.debug(preamble + "%s", checker.nodes[node_row].item_id,
+                      rule_number, msg)
+            error = ValidationError(item_path=fs.get_vpath(),
+                                    error_message=msg)
+            errors.append((node_row, error))
 
         return errors
 
-    def validate_node(self, node):
+    def _validate_fs_shrink(self, checker, rule_number):
         '''
-        Public Driver method to validate LVM items per Node
+        Validate that no applied File System is reduced in size,
+        for every Node of the checker.
+        Returns (node row, error) pairs.
+        '''
+
+        preamble = '_validate_fs_shrink: %s Rule:%s : '
+
+        errors = []
+        for row in checker.get_shrinking_fs_rows():
+            node_row = checker.fs_node_rows[row]
+            fs = checker.fs_items[row]
+            msg = ("File System size '%s' is smaller than its " + \
+                   "applied size '%s'; File Systems can only grow") % \
+                   (fs.size, VolMgrUtils.get_applied_property(fs, 'size'))
+            log.debug(preamble + "%s", checker.nodes[node_row].item_id,
+                      rule_number, msg)
+            error = ValidationError(item_path=fs.get_vpath(),
+                                    error_message=msg)
+            errors.append((node_row, error))
+
+        return errors
+
+    def _validate_fs_grow(self, checker, rule_number):
+        '''
+        Validate that the growing File Systems of a Volume Group
+        fit in the extents it has free, for every Node of the
+        checker. Returns (node row, error) pairs, and the
+        Volume Group rows reported.
         '''
 
+        preamble = '_validate_fs_grow: %s Rule:%s : '
+
+        rows, growth, free = checker.get_unfit_growing_fs_rows()
+
+        errors = []
+        vg_rows = set()
+        for row in rows:
+            node_row = checker.fs_node_rows[row]
+            fs = checker.fs_items[row]
+            vg_row = checker.fs_vg_rows[row]
+            vg_rows.add(vg_row)
+            msg = ("File System cannot grow from '%s' to '%s': " + \
+                   "%d extents of %s required, Volume Group '%s' " + \
+                   "has %d free") % \
+                   (VolMgrUtils.get_applied_property(fs, 'size'), fs.size,
+                    growth[row], Size(checker.vg_extent_kb[vg_row]),
+                    checker.vg_items[vg_row].item_id, max(free[vg_row], 0))
+            log.debug(preamble + "%s", checker.nodes[node_row].item_id,
+                      rule_number, msg)
+            error = ValidationError(item_path=fs.get_vpath(),
+                                    error_message=msg)
+            errors.append((node_row, error))
+
+        return errors, vg_rows
+
+    def _validate_fs_stripes(self, checker, rule_number):
+        '''
+        Validate that striped File Systems can be laid out on the
+        Physical Devices of their Volume Group, for every Node of
+        the checker. Returns (node row, error) pairs.
+        '''
+
+        preamble = '_validate_fs_stripes: %s Rule:%s : '
+
         errors = []
-        errors += self._validate_fs_size(node, '14')
-        errors += self._validate_disk_sizes(node, '1.2')
+        for row, reason in checker.get_misstriped_fs_rows():
+            node_row = checker.fs_node_rows[row]
+            fs = checker.fs_items[row]
+            vg = checker.vg_items[checker.fs_vg_rows[row]]
+            extent_size = self._format_extent_size(
+                                checker.vg_extent_kb[checker.fs_vg_rows[row]])
+            if reason == 'stripes':
+                msg = ("File System stripes '%s' must be a number " + \
+                       "between 1 and the number of Physical Devices " + \
+                       "of Volume Group '%s'") % \
+                       (getattr(fs, 'stripes', None), vg.item_id)
+            elif reason == 'stripe_size':
+                msg = ("File System stripe_size '%s' must be a power " + \
+                       "of 2 between 4K and the LVM Logical Extent " + \
+                       "size ('%s')") % \
+                       (fs.stripe_size, extent_size)
+            elif reason == 'alignment':
+                msg = ("File System size '%s' is not an exact " + \
+                       "multiple of %s stripes of the LVM Logical " + \
+                       "Extent size ('%s')") % \
+                       (fs.size, fs.stripes, extent_size)
+            else:
+                msg = ("File System size '%s' cannot be striped " + \
+                       "across %s System Disks of Volume Group '%s'") % \
+                       (fs.size, fs.stripes, vg.item_id)
+            log.debug(preamble + "%s", checker.nodes[node_row].item_id,
+                      rule_number, msg)
+            error = ValidationError(item_path=fs.get_vpath(),
+                                    error_message=msg)
+            errors.append((node_row, error))
 
         return errors
+
+    def _validate_vg_pe_size(self, checker, rule_number):
+        '''
+        Validate that the Physical Extent size of a Volume Group
+        is a power of 2, for every Node of the checker.
+        Returns (node row, error) pairs.
+        '''
+
+        preamble = '_validate_vg_pe_size: %s Rule:%s : '
+
+        errors = []
+        for row in checker.get_invalid_extent_vg_rows():
+            node_row = checker.vg_node_rows[row]
+            vg = checker.vg_items[row]
+            msg = ("Volume Group pe_size '%s' is not a power of 2") % \
+                  vg.pe_size
+            log.debug(preamble + "%s", checker.nodes[node_row].item_id,
+                      rule_number, msg)
+            error = ValidationError(item_path=vg.get_vpath(),
+                                    error_message=msg)
+            errors.append((node_row, error))
+
+        return errors
+
+    @staticmethod
+    def _format_extent_size(extent_kb):
+        '''
+        Format a Physical Extent size for a message: whole
+        Megabytes as a bare number, otherwise with a unit
+        '''
+
+        if extent_kb % Size.UNITS['M'] == 0:
+            return '%d' % (extent_kb // Size.UNITS['M'])
+        return str(Size(extent_kb))
+
+    def _create_capacity_checker(self):
+        '''
+        Create an empty capacity checker for the LVM constraints
+        '''
+
+        return LvmCapacityChecker(LvmDriver.LOGICAL_EXTENT_SIZE,
+                                  LvmDriver.PV_DATA_OFFSET,
+                                  LvmDriver.PARTITION_ALIGNMENT,
+                                  Size.from_megabytes(
+                                          LvmDriver.SLASH_BOOT_SIZE),
+                                  LvmDriver.CACHE_METADATA_MIN,
+                                  LvmDriver.CACHE_METADATA_RATIO,
+                                  LvmDriver.THIN_METADATA_MIN,
+                                  LvmDriver.THIN_METADATA_RATIO)
+
+    def validate_nodes(self, nodes, indexes=None):
+        '''
+        Public Driver method to validate LVM items for a batch
+        of Nodes in one pass. Returns one list of errors per Node,
+        in the order of the Nodes.
+        '''
+
+        if indexes is None:
+            indexes = [NodeStorageIndex(node) for node in nodes]
+
+        checker = self._create_capacity_checker()
+        for node, index in zip(nodes, indexes):
+            checker.add_node(node, index)
+
+        results = [[] for _ in nodes]
+        for node_row, error in self._validate_vg_pe_size(checker, '18'):
+            results[node_row].append(error)
+        for node_row, error in self._validate_fs_size(checker, '14'):
+            results[node_row].append(error)
+        for node_row, error in self._validate_fs_stripes(checker, '15'):
+            results[node_row].append(error)
+        for node_row, error in self._validate_fs_shrink(checker, '23'):
+            results[node_row].append(error)
+        grow_errors, grow_vg_rows = self._validate_fs_grow(checker, '24')
+        for node_row, error in grow_errors:
+            results[node_row].append(error)
+        for node_row, error in self._validate_disk_sizes(checker, '1.2',
+                                                         grow_vg_rows):
+            results[node_row].append(error)
+        for node_row, error in self._validate_cache_sizes(checker, '1.2'):
+            results[node_row].append(error)
+        for node_row, error in self._validate_thin_overcommit(checker,
+                                                              '28'):
+            results[node_row].append(error)
+
+        return results
+
+    def validate_node(self, node, index=None):
+        '''
+        Public Driver method to validate LVM items per Node
+        '''
+
+        if index is None:
+            index = NodeStorageIndex(node)
+
+        return self.validate_nodes([node], [index])[0]
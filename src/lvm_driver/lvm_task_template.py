@@ -0,0 +1,79 @@
+##############################################################################
+# COPYRIGHT Ericsson AB 2014
+#
+# The copyright to the computer program(s) herein is the property of
+# Ericsson AB. The programs may be used and/or copied only with written
+# permission from Ericsson AB. or in accordance with the terms and
+# conditions stipulated in the agreement/contract under which the
+# program(s) have been supplied.
+##############################################################################
+
+from litp.core.execution_manager import ConfigTask
+
+
+class LvmTaskTemplate(object):
+    '''
+    Node independent skeleton of a ConfigTask.
+    Built once per Storage Profile and instantiated per Node by
+    binding the Node, the model item, the description identifiers
+    and any Node specific call arguments.
+    The positions of the sibling templates a Task depends on are
+    held in 'requires'.
+    '''
+
+    __slots__ = ['label', 'call_type', 'call_id', 'kwargs', 'requires']
+
+    def __init__(self, label, call_type, call_id, requires=(), **kwargs):
+        '''
+        Constructor
+        @param label: Leading part of the Task description
+        @type label: String
+        @param call_type: Puppet resource type
+        @type call_type: String
+        @param call_id: Puppet resource title
+        @type call_id: String
+        @param requires: Positions of the sibling templates
+                         this Task depends on
+        @type requires: Tuple of Integers
+        '''
+
+        self.label = label
+        self.call_type = call_type
+        self.call_id = call_id
+        self.requires = tuple(requires)
+        self.kwargs = kwargs
+
+    def instantiate(self, node, model_item, ids, **bindings):
+        '''
+        Create the ConfigTask for a given Node
+        @param ids: Item identifiers appended to the description
+        @type ids: List of Strings
+        @param bindings: Node specific call arguments
+        @return: The bound Task
+        @rtype: ConfigTask
+        '''
+
+        kwargs = dict(self.kwargs)
+        kwargs.update(bindings)
+
+        desc = "%s: %s" % (self.label, '::'.join(ids))
+
+        return ConfigTask(node,
+                          model_item,
+                          desc,
+                          self.call_type,
+                          self.call_id,
+                          **kwargs)
+
+    @staticmethod
+    def link(tasks, templates):
+        '''
+        Add the dependencies declared by templates between the Tasks
+        instantiated from them, position for position
+        '''
+
+        for task, template in zip(tasks, templates):
+            for position in template.requires:
+                task.requires.add(tasks[position])
+
+        return tasks
@@ -0,0 +1,89 @@
+##############################################################################
+# COPYRIGHT Ericsson AB 2014
+#
+# The copyright to the computer program(s) herein is the property of
+# Ericsson AB. The programs may be used and/or copied only with written
+# permission from Ericsson AB. or in accordance with the terms and
+# conditions stipulated in the agreement/contract under which the
+# program(s) have been supplied.
+##############################################################################
+
+import threading
+
+
+class VolMgrCache(object):
+    '''
+    Bounded least-recently-used cache.
+    Entries are evicted oldest-first once max_size is reached.
+    '''
+
+    DEFAULT_MAX_SIZE = 64
+
+    def __init__(self, max_size=None):
+        '''
+        Constructor
+        @param max_size: Maximum number of entries held
+        @type max_size: Integer
+        '''
+
+        if max_size is None:
+            max_size = VolMgrCache.DEFAULT_MAX_SIZE
+
+        self.max_size = max_size
+        self._entries = {}
+        self._tick = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        '''
+        Return the value cached for key, or default if absent
+        '''
+
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._tick += 1
+            entry[1] = self._tick
+            return entry[0]
+        finally:
+            self._lock.release()
+
+    def put(self, key, value):
+        '''
+        Cache value for key, evicting the least recently used
+        entry if the cache is full
+        '''
+
+        if self.max_size < 1:
+            return
+
+        self._lock.acquire()
+        try:
+            if key not in self._entries and \
+               len(self._entries) >= self.max_size:
+                oldest = min(self._entries,
+                             key=lambda k: self._entries[k][1])
+                del self._entries[oldest]
+            self._tick += 1
+            self._entries[key] = [value, self._tick]
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        '''
+        Drop all cached entries
+        '''
+
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+        finally:
+            self._lock.release()
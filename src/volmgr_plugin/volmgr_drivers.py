@@ -0,0 +1,168 @@
+##############################################################################
+# COPYRIGHT Ericsson AB 2014
+#
+# The copyright to the computer program(s) herein is the property of
+# Ericsson AB. The programs may be used and/or copied only with written
+# permission from Ericsson AB. or in accordance with the terms and
+# conditions stipulated in the agreement/contract under which the
+# program(s) have been supplied.
+##############################################################################
+
+import os
+import threading
+
+try:
+    from ConfigParser import RawConfigParser
+except ImportError:
+    from configparser import RawConfigParser
+
+from volmgr_plugin.volmgr_logging import VolMgrLogger
+
+from litp.core.litp_logging import LitpLogger
+log = VolMgrLogger(LitpLogger())
+
+
+class VolMgrDriverRegistry(object):
+    '''
+    Registry of the Volume Manager Drivers, keyed by the
+    'volume_driver' property of a Volume Group.
+    Drivers are registered by class path and are only imported
+    and instantiated on first use. Further Drivers may be
+    registered in the [drivers] section of the plugin
+    configuration file, one 'volume_driver = module.Class'
+    entry each.
+
+    A Driver implements gen_tasks_for_volume_group(node, vg, index)
+    and validate_node(node, index). It may also implement
+    iter_tasks_for_volume_group(node, vg, index) to yield Tasks
+    lazily, and validate_nodes(nodes, indexes) to validate a
+    batch of Nodes in one pass.
+    '''
+
+    DRIVERS = {'lvm': 'lvm_driver.lvm_driver.LvmDriver',
+               'vxvm': 'vxvm_driver.vxvm_driver.VxvmDriver'}
+
+    CONFIG_FILE = '/opt/ericsson/nms/litp/etc/plugins/volmngr_plugin.conf'
+
+    CONFIG_SECTION = 'drivers'
+
+    def __init__(self, config_file=None):
+        '''
+        Constructor
+        @param config_file: Configuration file listing further Drivers
+        @type config_file: String
+        '''
+
+        if config_file is None:
+            config_file = VolMgrDriverRegistry.CONFIG_FILE
+
+        self.config_file = config_file
+        self._class_paths = dict(VolMgrDriverRegistry.DRIVERS)
+        self._config_loaded = False
+        self._drivers = {}
+        self._load_errors = {}
+        self._lock = threading.Lock()
+
+    def _load_config(self):
+        '''
+        Register the Drivers listed in the configuration file,
+        once. The caller holds the lock.
+        '''
+
+        preamble = '._load_config: '
+
+        if self._config_loaded:
+            return
+        self._config_loaded = True
+
+        if not os.path.exists(self.config_file):
+            return
+
+        parser = RawConfigParser()
+        try:
+            parser.read(self.config_file)
+        except Exception as e:
+            log.debug(preamble + "Cannot read '%s': %s", self.config_file, e)
+            return
+
+        if parser.has_section(VolMgrDriverRegistry.CONFIG_SECTION):
+            for name, class_path in \
+                    parser.items(VolMgrDriverRegistry.CONFIG_SECTION):
+                log.debug(preamble + "Registering Driver '%s' as '%s'",
+                          name, class_path)
+                self._class_paths[name] = class_path
+
+    def register(self, name, class_path):
+        '''
+        Register a Driver class path for a volume_driver,
+        replacing any previous Driver of that name
+        '''
+
+        with self._lock:
+            self._load_config()
+            self._class_paths[name] = class_path
+            self._drivers.pop(name, None)
+            self._load_errors.pop(name, None)
+
+    def names(self):
+        '''
+        Return the volume_driver names of all registered Drivers
+        '''
+
+        with self._lock:
+            self._load_config()
+            return sorted(self._class_paths)
+
+    def is_loaded(self, name):
+        '''
+        Return boolean True if the Driver has been instantiated
+        '''
+
+        return self._drivers.get(name) is not None
+
+    def get_load_error(self, name):
+        '''
+        Return the reason no Driver could be loaded for a
+        volume_driver, or None if it loaded or was never requested
+        '''
+
+        return self._load_errors.get(name)
+
+    def get(self, name):
+        '''
+        Return the Driver for a volume_driver, importing and
+        instantiating it on first use
+        @return: The Driver, or None if no Driver is registered
+                 under that name or it cannot be loaded
+        '''
+
+        preamble = '.get: %s : '
+
+        driver = self._drivers.get(name)
+        if driver is not None:
+            return driver
+
+        with self._lock:
+            if name in self._drivers:
+                return self._drivers[name]
+
+            self._load_config()
+            class_path = self._class_paths.get(name)
+            if class_path is None:
+                log.debug(preamble + "No Driver registered", name)
+                self._load_errors[name] = "no Driver is registered"
+                return None
+
+            module_name, _, class_name = class_path.rpartition('.')
+            try:
+                module = __import__(module_name, fromlist=[class_name])
+                driver = getattr(module, class_name)()
+            except Exception as e:
+                log.debug(preamble + "Cannot load Driver '%s': %s",
+                          name, class_path, e)
+                self._load_errors[name] = "cannot load '%s': %s: %s" % \
+                                          (class_path, type(e).__name__, e)
+                driver = None
+
+            self._drivers[name] = driver
+            return driver
@@ -0,0 +1,178 @@
+##############################################################################
+# COPYRIGHT Ericsson AB 2014
+#
+# The copyright to the computer program(s) herein is the property of
+# Ericsson AB. The programs may be used and/or copied only with written
+# permission from Ericsson AB. or in accordance with the terms and
+# conditions stipulated in the agreement/contract under which the
+# program(s) have been supplied.
+##############################################################################
+
+
+class ProfileIndex(object):
+    '''
+    Single-pass index of the Volume Groups and File Systems
+    of a Storage Profile, keyed by the properties that
+    must be unique within that Storage Profile.
+    '''
+
+    def __init__(self, profile):
+        '''
+        Walk the Storage Profile once and build the indices
+        @param profile: Storage Profile to index
+        @type profile: QueryItem
+        '''
+
+        self.vgs_by_name = {}
+        self.fss_by_mount_point = {}
+
+        for vg in profile.volume_groups:
+            self.vgs_by_name.setdefault(vg.volume_group_name, []).append(vg)
+            for fs in vg.file_systems:
+                self.fss_by_mount_point.setdefault(fs.mount_point,
+                                                   []).append(fs)
+
+    def is_vg_name_unique(self, vg):
+        '''
+        Return boolean True if no other Volume Group
+        shares the name of the given Volume Group
+        '''
+
+        return len(self.vgs_by_name.get(vg.volume_group_name, [])) < 2
+
+    def is_mount_point_unique(self, fs):
+        '''
+        Return boolean True if no other File System
+        shares the mount_point of the given File System
+        '''
+
+        return len(self.fss_by_mount_point.get(fs.mount_point, [])) < 2
+
+
+class NodeStorageIndex(object):
+    '''
+    Single-pass index of the storage items of a Managed Node:
+    the System Disks and the linked Storage Profile.
+    Built once per Node and shared by validation and
+    task generation.
+    '''
+
+    def __init__(self, node, profile_fingerprint=None):
+        '''
+        Walk the Node System and Storage Profile once
+        and build the indices
+        @param node: Managed Node to index
+        @type node: QueryItem
+        @param profile_fingerprint: Fingerprint of the Storage Profile,
+                                    computed once per Storage Profile
+        @type profile_fingerprint: Tuple
+        '''
+
+        self.node = node
+        self.disks = []
+        self.disks_by_name = {}
+        self.volume_groups = []
+        self.file_systems = []
+        self.pds_by_device_name = {}
+        self._vg_disks = {}
+        self._profile_fingerprint = profile_fingerprint
+
+        if node.system:
+            for disk in node.system.disks:
+                self.disks.append(disk)
+                if disk.name and disk.name not in self.disks_by_name:
+                    self.disks_by_name[disk.name] = disk
+
+        if node.storage_profile:
+            for vg in node.storage_profile.volume_groups:
+                self.volume_groups.append(vg)
+                vg_disks = []
+                for pd in vg.physical_devices:
+                    self.pds_by_device_name.setdefault(pd.device_name,
+                                                       []).append(pd)
+                    vg_disks.append(self.get_pd_disk(pd))
+                self._vg_disks[vg.get_vpath()] = vg_disks
+                for fs in vg.file_systems:
+                    self.file_systems.append((vg, fs))
+
+    @staticmethod
+    def get_storage_state(node):
+        '''
+        Walk the storage items of a Managed Node without building
+        an index, and return the vpaths of those items, or None if
+        any of them is Initial, Updated or For Removal. The state
+        changes whenever a storage item is added, removed or changed.
+        '''
+
+        items = []
+        if node.system:
+            items.append(node.system)
+            items += node.system.disks
+        if node.storage_profile:
+            items.append(node.storage_profile)
+            for vg in node.storage_profile.volume_groups:
+                items.append(vg)
+                items += vg.physical_devices
+                items += vg.file_systems
+
+        vpaths = []
+        for item in items:
+            if item.is_initial() or item.is_updated() or \
+               item.is_for_removal():
+                return None
+            vpaths.append(item.get_vpath())
+
+        return tuple(vpaths)
+
+    def get_boot_disks(self):
+        '''
+        Return the System Disks that have 'bootable' set to 'true'
+        '''
+
+        return [disk for disk in self.disks if disk.bootable == "true"]
+
+    def get_pd_disk(self, pd):
+        '''
+        Return the System Disk referenced by a Physical Device,
+        or None if there is no such System Disk
+        '''
+
+        return self.disks_by_name.get(pd.device_name)
+
+    def get_vg_disk(self, vg):
+        '''
+        Return the System Disk of the first Physical Device
+        of a Volume Group, or None if there is no such System Disk
+        '''
+
+        vg_disks = self._vg_disks.get(vg.get_vpath())
+        if vg_disks:
+            return vg_disks[0]
+        return None
+
+    def get_vg_disks(self, vg):
+        '''
+        Return the System Disks of all Physical Devices of a
+        Volume Group, in Physical Device order. The list is empty
+        if any Physical Device has no System Disk.
+        '''
+
+        vg_disks = self._vg_disks.get(vg.get_vpath(), [])
+        if None in vg_disks:
+            return []
+        return list(vg_disks)
+
+    def get_pd_refs(self, disk):
+        '''
+        Return all Physical Devices referencing a System Disk
+        '''
+
+        return self.pds_by_device_name.get(disk.name, [])
+
+    def get_profile_fingerprint(self):
+        '''
+        Return the fingerprint of the Node Storage Profile as
+        supplied when indexing, or None if none was supplied
+        '''
+
+        return self._profile_fingerprint
@@ -0,0 +1,108 @@
+##############################################################################
+# COPYRIGHT Ericsson AB 2014
+#
+# The copyright to the computer program(s) herein is the property of
+# Ericsson AB. The programs may be used and/or copied only with written
+# permission from Ericsson AB. or in accordance with the terms and
+# conditions stipulated in the agreement/contract under which the
+# program(s) have been supplied.
+##############################################################################
+
+import itertools
+import logging
+
+
+class VolMgrLogger(object):
+    '''
+    Trace logging facade which defers message formatting until
+    the debug level is known to be enabled. Messages are passed
+    as a format string plus arguments, never pre-formatted.
+    '''
+
+    def __init__(self, logger):
+        '''
+        Constructor
+        @param logger: Logger exposing a 'trace' logging.Logger,
+                       typically a LitpLogger
+        @type logger: Object
+        '''
+
+        self.logger = logger
+        self._counters = {}
+
+    def is_debug_enabled(self):
+        '''
+        Return boolean True if trace debug messages will be emitted
+        '''
+
+        trace = self.logger.trace
+        is_enabled_for = getattr(trace, 'isEnabledFor', None)
+        if is_enabled_for is None:
+            return True
+
+        return is_enabled_for(logging.DEBUG)
+
+    def debug(self, fmt, *args):
+        '''
+        Log a trace debug message, formatting fmt with args
+        only if debug is enabled
+        '''
+
+        if self.is_debug_enabled():
+            if args:
+                fmt = fmt % args
+            self.logger.trace.debug(fmt)
+
+    def debug_sampled(self, key, rate, fmt, *args):
+        '''
+        Log only 1 in every rate messages sharing the same key.
+        A rate below 1 disables the messages altogether.
+        '''
+
+        if rate < 1 or not self.is_debug_enabled():
+            return
+
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._counters.setdefault(key, itertools.count())
+
+        if next(counter) % rate == 0:
+            self.debug(fmt, *args)
+
+    def summary(self, fmt, *args):
+        '''
+        Return a VolMgrLogSummary which counts events and logs
+        a single line for all of them when emitted
+        '''
+
+        return VolMgrLogSummary(self, fmt, args)
+
+
+class VolMgrLogSummary(object):
+    '''
+    Aggregates many debug events into one summary line.
+    The summary format receives its own arguments followed by
+    the number of events counted.
+    '''
+
+    __slots__ = ['log', 'fmt', 'args', 'count']
+
+    def __init__(self, log, fmt, args):
+        self.log = log
+        self.fmt = fmt
+        self.args = args
+        self.count = 0
+
+    def add(self, increment=1):
+        '''
+        Count one or more events
+        '''
+
+        self.count += increment
+
+    def emit(self):
+        '''
+        Log the summary line
+        '''
+
+        self.log.debug(self.fmt, *(self.args + (self.count,)))
@@ -0,0 +1,172 @@
+##############################################################################
+# COPYRIGHT Ericsson AB 2014
+#
+# The copyright to the computer program(s) herein is the property of
+# Ericsson AB. The programs may be used and/or copied only with written
+# permission from Ericsson AB. or in accordance with the terms and
+# conditions stipulated in the agreement/contract under which the
+# program(s) have been supplied.
+##############################################################################
+
+import re
+
+
+class MountOptions(object):
+    '''
+    Mount options of a File System.
+    The 'mount_options' property is a comma separated list of
+    mount options and named performance presets. Presets are
+    expanded in place; each option is then checked against
+    the options supported by the File System type.
+    A File System of type 'tmpfs' is always mounted with its
+    size as the 'size' option.
+    '''
+
+    DEFAULT = 'defaults'
+
+    # Named performance presets
+    PRESETS = {'throughput': ['noatime', 'nodiratime',
+                              'data=writeback', 'commit=60'],
+               'latency': ['noatime', 'nodiratime', 'dioread_nolock'],
+               'ssd': ['noatime', 'nodiratime', 'discard']}
+
+    # Named performance presets of a File System type, which
+    # take precedence over the common presets
+    TYPE_PRESETS = {'xfs': {'throughput': ['noatime', 'nodiratime',
+                                           'inode64', 'largeio',
+                                           'allocsize=64m'],
+                            'latency': ['noatime', 'nodiratime',
+                                        'inode64']},
+                    'tmpfs': {'throughput': ['noatime', 'nodiratime',
+                                             'huge=within_size'],
+                              'latency': ['noatime', 'nodiratime'],
+                              'ssd': ['noatime', 'nodiratime']}}
+
+    # Flag options supported by every mountable File System type
+    COMMON_FLAGS = ['defaults', 'ro', 'rw', 'auto', 'noauto',
+                    'atime', 'noatime', 'diratime', 'nodiratime',
+                    'relatime', 'norelatime', 'strictatime',
+                    'dev', 'nodev', 'exec', 'noexec', 'suid', 'nosuid',
+                    'sync', 'async', 'nofail', '_netdev']
+
+    # Flag and valued options per File System type. A File System
+    # type absent from both tables accepts no mount options.
+    FLAGS = {'ext4': ['discard', 'nodiscard', 'barrier', 'nobarrier',
+                      'delalloc', 'nodelalloc',
+                      'auto_da_alloc', 'noauto_da_alloc',
+                      'dioread_lock', 'dioread_nolock',
+                      'journal_checksum', 'nojournal_checksum',
+                      'journal_async_commit',
+                      'user_xattr', 'nouser_xattr', 'acl', 'noacl'],
+             'vxfs': ['largefiles', 'nolargefiles', 'qio', 'noqio',
+                      'log', 'delaylog', 'tmplog', 'datainlog',
+                      'nodatainlog', 'blkclear', 'cluster'],
+             'xfs': ['discard', 'nodiscard', 'inode32', 'inode64',
+                     'largeio', 'nolargeio', 'noalign', 'attr2', 'noattr2',
+                     'ikeep', 'noikeep', 'filestreams', 'swalloc', 'wsync',
+                     'grpid', 'nogrpid', 'barrier', 'nobarrier', 'dax',
+                     'quota', 'noquota', 'uquota', 'gquota', 'pquota',
+                     'usrquota', 'grpquota', 'prjquota', 'uqnoenforce',
+                     'gqnoenforce', 'pqnoenforce'],
+             'tmpfs': []}
+
+    VALUES = {'ext4': {'commit': re.compile(r'^[0-9]+$'),
+                       'barrier': re.compile(r'^[01]$'),
+                       'data': re.compile(r'^(journal|ordered|writeback)$'),
+                       'stripe': re.compile(r'^[1-9][0-9]*$'),
+                       'inode_readahead_blks': re.compile(r'^[1-9][0-9]*$'),
+                       'min_batch_time': re.compile(r'^[0-9]+$'),
+                       'max_batch_time': re.compile(r'^[0-9]+$'),
+                       'journal_ioprio': re.compile(r'^[0-7]$'),
+                       'errors': re.compile(r'^(continue|remount-ro|panic)$')},
+              'vxfs': {'mincache': re.compile(r'^(direct|dsync|closesync|'
+                                              r'unbuffered|tmpcache)$'),
+                       'convosync': re.compile(r'^(direct|dsync|closesync|'
+                                               r'unbuffered|delay)$'),
+                       'ioerror': re.compile(r'^(disable|nodisable|'
+                                             r'wdisable|mwdisable|'
+                                             r'mdisable)$')},
+              'xfs': {'allocsize': re.compile(r'^[1-9][0-9]*[kmg]?$'),
+                      'logbufs': re.compile(r'^[2-8]$'),
+                      'logbsize': re.compile(r'^(16|32|64|128|256)k$'),
+                      'sunit': re.compile(r'^[1-9][0-9]*$'),
+                      'swidth': re.compile(r'^[1-9][0-9]*$')},
+              'tmpfs': {'nr_inodes': re.compile(r'^[0-9]+[kmg]?$'),
+                        'mode': re.compile(r'^[0-7]{3,4}$'),
+                        'uid': re.compile(r'^[0-9]+$'),
+                        'gid': re.compile(r'^[0-9]+$'),
+                        'huge': re.compile(r'^(never|always|within_size|'
+                                           r'advise)$')}}
+
+    @staticmethod
+    def expand(mount_options, fs_type=None):
+        '''
+        Split a mount_options value into single options,
+        expanding any named presets
+        @param mount_options: Comma separated options and presets
+        @type mount_options: String
+        @param fs_type: File System type, selecting its own presets
+        @type fs_type: String
+        @return: Mount options, in order, without duplicates
+        @rtype: List of Strings
+        '''
+
+        options = []
+        if not mount_options:
+            return options
+
+        presets = dict(MountOptions.PRESETS)
+        presets.update(MountOptions.TYPE_PRESETS.get(fs_type, {}))
+
+        for option in mount_options.split(','):
+            option = option.strip()
+            for expanded in presets.get(option, [option]):
+                if expanded not in options:
+                    options.append(expanded)
+
+        return options
+
+    @staticmethod
+    def is_supported(fs_type, option):
+        '''
+        Return boolean True if a single mount option is
+        supported by a File System type
+        '''
+
+        if fs_type not in MountOptions.FLAGS and \
+           fs_type not in MountOptions.VALUES:
+            return False
+
+        if '=' in option:
+            name, value = option.split('=', 1)
+            pattern = MountOptions.VALUES.get(fs_type, {}).get(name)
+            return pattern is not None and bool(pattern.match(value))
+
+        return option in MountOptions.COMMON_FLAGS or \
+               option in MountOptions.FLAGS.get(fs_type, [])
+
+    @staticmethod
+    def get_unsupported(fs_type, mount_options):
+        '''
+        Return the options of a mount_options value which
+        are not supported by a File System type
+        '''
+
+        return [option for option in \
+                MountOptions.expand(mount_options, fs_type) \
+                if not MountOptions.is_supported(fs_type, option)]
+
+    @staticmethod
+    def get_options_string(fs):
+        '''
+        Return the options string with which to mount a File System
+        '''
+
+        options = MountOptions.expand(getattr(fs, 'mount_options', None),
+                                      fs.type)
+        if fs.type == 'tmpfs':
+            options.insert(0, 'size=%s' % fs.size)
+        if not options:
+            return MountOptions.DEFAULT
+
+        return ','.join(options)
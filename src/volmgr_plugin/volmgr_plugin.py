@@ -11,11 +11,19 @@
 from litp.core.plugin import Plugin
 from litp.core.validators import ValidationError
 from litp.core.extension import ViewError
-from lvm_driver.lvm_driver import LvmDriver
-from vxvm_driver.vxvm_driver import VxvmDriver
+from litp.core.execution_manager import CallbackExecutionException
+from litp.core.rpc_commands import run_rpc_command
+from volmgr_plugin.volmgr_index import ProfileIndex, NodeStorageIndex
+from volmgr_plugin.volmgr_cache import VolMgrCache
+from volmgr_plugin.volmgr_utils import VolMgrUtils, Size
+from volmgr_plugin.volmgr_pool import VolMgrPool
+from volmgr_plugin.volmgr_mount import MountOptions
+from volmgr_plugin.volmgr_drivers import VolMgrDriverRegistry
+
+from volmgr_plugin.volmgr_logging import VolMgrLogger
 
 from litp.core.litp_logging import LitpLogger
-log = LitpLogger()
+log = VolMgrLogger(LitpLogger())
 
 
 class VolMgrPlugin(Plugin):
@@ -23,38 +31,85 @@ class VolMgrPlugin(Plugin):
     LITP Volume Manager Plugin
     """
 
+    # Re-validate only those Nodes whose storage items have changed
+    INCREMENTAL_VALIDATION = True
+
+    NODE_CACHE_SIZE = 4096
+
+    # Pool used to validate Nodes concurrently: 'serial' or 'thread'
+    VALIDATION_POOL = VolMgrPool.THREAD
+
+    VALIDATION_WORKERS = 4
+
+    # Pool used to generate Tasks for Nodes concurrently
+    TASK_POOL = VolMgrPool.THREAD
+
+    TASK_WORKERS = 4
+
+    # Log 1 in every N generated Tasks; 0 logs only per Node summaries
+    TASK_LOG_SAMPLE_RATE = 0
+
     def __init__(self):
         '''
-        Constructor to instantiate Drivers
+        Constructor. Drivers are instantiated on first use.
         '''
 
         super(VolMgrPlugin, self).__init__()
-        self.lvm_driver = LvmDriver()
-        self.vxvm_driver = VxvmDriver()
+        self.drivers = VolMgrDriverRegistry()
+        self.profile_cache = VolMgrCache()
+        self.node_cache = VolMgrCache(VolMgrPlugin.NODE_CACHE_SIZE)
+
+    @property
+    def lvm_driver(self):
+        '''
+        The LVM Driver
+        '''
+
+        return self.drivers.get('lvm')
+
+    @property
+    def vxvm_driver(self):
+        '''
+        The VxVM Driver
+        '''
+
+        return self.drivers.get('vxvm')
+
+    def _get_driver_names(self, index):
+        '''
+        Return the volume_driver names of the Volume Groups
+        of a Node, in Volume Group order, without duplicates
+        '''
+
+        names = []
+        for vg in index.volume_groups:
+            if vg.volume_driver not in names:
+                names.append(vg.volume_driver)
+
+        return names
 
-    def _validate_unique_fs_mountpoint(self, profile, rule_number):
+    def _validate_unique_fs_mountpoint(self, profile, rule_number,
+                                       index=None):
         '''
         Validate that a File System Mount Point is unique
         for a given Storage Profile.
         '''
 
-        preamble = '_validate_unique_fs_mountpoint: ' + rule_number + ': '
+        preamble = '_validate_unique_fs_mountpoint: %s: '
+
+        if index is None:
+            index = ProfileIndex(profile)
 
         errors = []
 
         for vg in profile.volume_groups:
             for fs in vg.file_systems:
-
-                mounts = [fs1.mount_point for fs1 in \
-                            [fs2 for vg1 in profile.volume_groups \
-                                 for fs2 in vg1.file_systems]
-                          if fs1 != fs]
-                if fs.mount_point in mounts:
+                if not index.is_mount_point_unique(fs):
                     message = "File System mount_point in not " + \
                               "unique for this Storage profile"
 
-                    log.trace.debug((preamble + "VG:%s FS:%s Error: %s") % \
-                                    (vg.item_id, fs.item_id, message))
+                    log.debug(preamble + "VG:%s FS:%s Error: %s",
+                              rule_number, vg.item_id, fs.item_id, message)
 
                     errors.append(ValidationError(item_path=fs.get_vpath(),
                                                   error_message=message))
@@ -67,7 +122,7 @@ class VolMgrPlugin(Plugin):
         has a mount_point of 'swap'
         '''
 
-        preamble = '_validate_swap_fs_mountpoint: ' + rule_number + ': '
+        preamble = '_validate_swap_fs_mountpoint: %s: '
 
         errors = []
 
@@ -77,117 +132,445 @@ class VolMgrPlugin(Plugin):
                     message = "A File System with type set to 'swap' " + \
                               "must also have a mount_point set to 'swap'"
 
-                    log.trace.debug((preamble + "VG:%s FS:%s Error: %s") % \
-                                    (vg.item_id, fs.item_id, message))
+                    log.debug(preamble + "VG:%s FS:%s Error: %s",
+                              rule_number, vg.item_id, fs.item_id, message)
+
+                    errors.append(ValidationError(item_path=fs.get_vpath(),
+                                                  error_message=message))
+        return errors
+
+    def _validate_fs_mount_options(self, profile, rule_number):
+        '''
+        Validate that the mount_options of a File System, once
+        any presets are expanded, suit the File System type
+        '''
+
+        preamble = '_validate_fs_mount_options: %s: '
+
+        errors = []
+
+        for vg in profile.volume_groups:
+            for fs in vg.file_systems:
+                mount_options = getattr(fs, 'mount_options', None)
+                if not mount_options:
+                    continue
+                unsupported = MountOptions.get_unsupported(fs.type,
+                                                           mount_options)
+                if unsupported:
+                    message = ("File System mount_options '%s' are " + \
+                               "not valid for a File System of " + \
+                               "type '%s': %s") % \
+                               (mount_options, fs.type,
+                                ', '.join(unsupported))
+
+                    log.debug(preamble + "VG:%s FS:%s Error: %s",
+                              rule_number, vg.item_id, fs.item_id, message)
+
+                    errors.append(ValidationError(item_path=fs.get_vpath(),
+                                                  error_message=message))
+        return errors
+
+    def _validate_fs_inode_ratio(self, profile, rule_number):
+        '''
+        Validate that the inode_ratio of a File System is a number
+        of bytes per inode accepted by mke2fs, or a named usage type
+        '''
+
+        preamble = '_validate_fs_inode_ratio: %s: '
+
+        errors = []
+
+        for vg in profile.volume_groups:
+            for fs in vg.file_systems:
+                inode_ratio = getattr(fs, 'inode_ratio', None)
+                if inode_ratio is None:
+                    continue
+                if inode_ratio in VolMgrUtils.INODE_RATIO_TYPES:
+                    valid = True
+                else:
+                    try:
+                        valid = VolMgrUtils.MIN_INODE_RATIO <= \
+                                int(inode_ratio) <= \
+                                VolMgrUtils.MAX_INODE_RATIO
+                    except ValueError:
+                        valid = False
+                if fs.type != 'ext4':
+                    valid = False
+                if not valid:
+                    message = ("File System inode_ratio '%s' must be " + \
+                               "a number of bytes between %d and %d, " + \
+                               "or one of %s, on a File System of " + \
+                               "type 'ext4'") % \
+                               (inode_ratio, VolMgrUtils.MIN_INODE_RATIO,
+                                VolMgrUtils.MAX_INODE_RATIO,
+                                ', '.join(VolMgrUtils.INODE_RATIO_TYPES))
+
+                    log.debug(preamble + "VG:%s FS:%s Error: %s",
+                              rule_number, vg.item_id, fs.item_id, message)
+
+                    errors.append(ValidationError(item_path=fs.get_vpath(),
+                                                  error_message=message))
+        return errors
+
+    def _validate_fs_mkfs_options(self, profile, rule_number):
+        '''
+        Validate that the mkfs_options of a File System are options
+        of mkfs for its type, free of shell metacharacters, as they
+        are passed to mkfs on the Node command line
+        '''
+
+        preamble = '_validate_fs_mkfs_options: %s: '
+
+        errors = []
+
+        for vg in profile.volume_groups:
+            for fs in vg.file_systems:
+                mkfs_options = getattr(fs, 'mkfs_options', None)
+                if mkfs_options is None or fs.type == 'tmpfs':
+                    # A tmpfs File System takes none, see rule 31
+                    continue
+                if not VolMgrUtils.is_valid_mkfs_options(fs.type,
+                                                         mkfs_options):
+                    message = ("File System mkfs_options '%s' are not " + \
+                               "valid for a File System of type '%s'") % \
+                               (mkfs_options, fs.type)
+
+                    log.debug(preamble + "VG:%s FS:%s Error: %s",
+                              rule_number, vg.item_id, fs.item_id, message)
+
+                    errors.append(ValidationError(item_path=fs.get_vpath(),
+                                                  error_message=message))
+        return errors
+
+    def _validate_fs_cache(self, profile, rule_number):
+        '''
+        Validate that a cached File System has a valid cache_size
+        and cache_policy, and belongs to an LVM Volume Group with
+        a cache_device
+        '''
+
+        preamble = '_validate_fs_cache: %s: '
+
+        errors = []
+
+        for vg in profile.volume_groups:
+            for fs in vg.file_systems:
+                cache_policy = getattr(fs, 'cache_policy', None)
+                cache_size = getattr(fs, 'cache_size', None)
+                if cache_policy is None and cache_size is None:
+                    continue
+                if cache_size is None:
+                    message = ("File System cache_policy '%s' requires " + \
+                               "a cache_size") % cache_policy
+                elif Size.parse(cache_size) is None:
+                    message = ("File System cache_size '%s' is not " + \
+                               "a valid size") % cache_size
+                elif cache_policy is not None and \
+                     cache_policy not in VolMgrUtils.CACHE_POLICIES:
+                    message = ("File System cache_policy '%s' must be " + \
+                               "one of %s") % \
+                               (cache_policy,
+                                ', '.join(VolMgrUtils.CACHE_POLICIES))
+                elif fs.type == 'swap':
+                    message = "A File System of type 'swap' cannot be cached"
+                elif vg.volume_driver != 'lvm' or \
+                     getattr(vg, 'cache_device', None) is None:
+                    message = ("A cached File System must belong to " + \
+                               "a Volume Group with volume_driver " + \
+                               "'lvm' and a cache_device")
+                else:
+                    continue
+
+                log.debug(preamble + "VG:%s FS:%s Error: %s",
+                          rule_number, vg.item_id, fs.item_id, message)
+
+                errors.append(ValidationError(item_path=fs.get_vpath(),
+                                              error_message=message))
+        return errors
+
+    def _validate_thin_provisioning(self, profile, rule_number):
+        '''
+        Validate the thin pool of a Volume Group, its thin
+        File Systems and the snap_size of every File System
+        '''
+
+        preamble = '_validate_thin_provisioning: %s: '
+
+        errors = []
+
+        for vg in profile.volume_groups:
+            thin_pool_size = getattr(vg, 'thin_pool_size', None)
+            overcommit_ratio = getattr(vg, 'overcommit_ratio', None)
+            message = None
+            if thin_pool_size is not None:
+                if Size.parse(thin_pool_size) is None:
+                    message = ("Volume Group thin_pool_size '%s' is " + \
+                               "not a valid size") % thin_pool_size
+                elif vg.volume_driver != 'lvm':
+                    message = ("A Volume Group with a thin pool must " + \
+                               "have volume_driver 'lvm'")
+            if message is None and overcommit_ratio is not None:
+                try:
+                    valid = float(overcommit_ratio) >= 1
+                except ValueError:
+                    valid = False
+                if not valid or thin_pool_size is None:
+                    message = ("Volume Group overcommit_ratio '%s' must " + \
+                               "be a number of at least 1, on a Volume " + \
+                               "Group with a thin_pool_size") % \
+                               overcommit_ratio
+            if message is not None:
+                log.debug(preamble + "VG:%s Error: %s",
+                          rule_number, vg.item_id, message)
+                errors.append(ValidationError(item_path=vg.get_vpath(),
+                                              error_message=message))
+
+            for fs in vg.file_systems:
+                snap_size = getattr(fs, 'snap_size', None)
+                message = None
+                if snap_size is not None:
+                    try:
+                        valid = 0 <= int(snap_size) <= 100
+                    except ValueError:
+                        valid = False
+                    if not valid:
+                        message = ("File System snap_size '%s' must be " + \
+                                   "a percentage between 0 and 100") % \
+                                   snap_size
+                if message is None and getattr(fs, 'thin', None) == 'true':
+                    if thin_pool_size is None:
+                        message = ("A thin File System must belong to " + \
+                                   "a Volume Group with a thin_pool_size")
+                    elif fs.type == 'swap' or fs.mount_point == '/':
+                        message = ("A File System of type 'swap' or " + \
+                                   "mounted on '/' cannot be thin")
+                    elif getattr(fs, 'stripes', None) not in (None, '1') or \
+                         getattr(fs, 'cache_size', None) is not None:
+                        message = ("A thin File System cannot be " + \
+                                   "striped or cached")
+                if message is not None:
+                    log.debug(preamble + "VG:%s FS:%s Error: %s",
+                              rule_number, vg.item_id, fs.item_id, message)
+                    errors.append(ValidationError(item_path=fs.get_vpath(),
+                                                  error_message=message))
+        return errors
+
+    def _validate_fs_readahead(self, profile, rule_number):
+        '''
+        Validate that the readahead_kb of a File System is a number
+        of Kilobytes within bounds, on a File System of an LVM
+        Volume Group
+        '''
+
+        preamble = '_validate_fs_readahead: %s: '
+
+        errors = []
+
+        for vg in profile.volume_groups:
+            for fs in vg.file_systems:
+                readahead_kb = getattr(fs, 'readahead_kb', None)
+                if readahead_kb is None:
+                    continue
+                try:
+                    valid = 0 <= int(readahead_kb) <= \
+                            VolMgrUtils.MAX_READAHEAD_KB
+                except ValueError:
+                    valid = False
+                if vg.volume_driver != 'lvm':
+                    valid = False
+                if not valid:
+                    message = ("File System readahead_kb '%s' must be " + \
+                               "a number of Kilobytes between 0 and %d, " + \
+                               "on a File System of a Volume Group " + \
+                               "with volume_driver 'lvm'") % \
+                               (readahead_kb, VolMgrUtils.MAX_READAHEAD_KB)
+
+                    log.debug(preamble + "VG:%s FS:%s Error: %s",
+                              rule_number, vg.item_id, fs.item_id, message)
 
                     errors.append(ValidationError(item_path=fs.get_vpath(),
                                                   error_message=message))
         return errors
 
-    def _validate_unique_vg_name(self, profile, rule_number):
+    def _validate_fs_type_properties(self, profile, rule_number):
+        '''
+        Validate the properties of a File System against its type:
+        a tmpfs File System is mounted on a directory and takes no
+        Logical Volume property; an xfs File System is large enough
+        for mkfs.xfs
+        '''
+
+        preamble = '_validate_fs_type_properties: %s: '
+
+        errors = []
+
+        for vg in profile.volume_groups:
+            for fs in vg.file_systems:
+                message = None
+                if fs.type == 'tmpfs':
+                    volume_props = [name for name in \
+                                    VolMgrUtils.VOLUME_FS_PROPERTIES \
+                                    if getattr(fs, name, None) is not None]
+                    if not fs.mount_point or \
+                       not fs.mount_point.startswith('/') or \
+                       fs.mount_point == '/':
+                        message = ("A File System of type 'tmpfs' must " + \
+                                   "be mounted on a directory other " + \
+                                   "than '/'")
+                    elif volume_props:
+                        message = ("A File System of type 'tmpfs' has no " + \
+                                   "Logical Volume and takes no %s") % \
+                                   ', '.join(volume_props)
+                elif fs.type == 'xfs':
+                    size = Size.parse(fs.size)
+                    if size is not None and \
+                       size < Size.from_megabytes(VolMgrUtils.MIN_XFS_SIZE_MB):
+                        message = ("A File System of type 'xfs' must be " + \
+                                   "at least %dM") % \
+                                   VolMgrUtils.MIN_XFS_SIZE_MB
+                if message is not None:
+                    log.debug(preamble + "VG:%s FS:%s Error: %s",
+                              rule_number, vg.item_id, fs.item_id, message)
+                    errors.append(ValidationError(item_path=fs.get_vpath(),
+                                                  error_message=message))
+        return errors
+
+    def _validate_unique_vg_name(self, profile, rule_number, index=None):
         '''
         Validate that a Volume Group name is unique
         in a given Storage Profile
         '''
 
-        preamble = '_validate_unique_vg_name: ' + rule_number + ': '
+        preamble = '_validate_unique_vg_name: %s: '
+
+        if index is None:
+            index = ProfileIndex(profile)
 
         errors = []
 
         for vg in profile.volume_groups:
-            vg_names = [vg1.volume_group_name \
-                        for vg1 in profile.volume_groups \
-                        if vg1 != vg]
-            if vg.volume_group_name in vg_names:
+            if not index.is_vg_name_unique(vg):
                 message = "Volume Group name in not " + \
                           "unique for this Storage profile"
 
-                log.trace.debug((preamble + "VG:%s Error: %s") % \
-                                (vg.item_id, message))
+                log.debug(preamble + "VG:%s Error: %s",
+                          rule_number, vg.item_id, message)
 
                 errors.append(ValidationError(item_path=vg.get_vpath(),
                                               error_message=message))
 
         return errors
 
-    def _validate_bootable_disk(self, node, rule_number):
+    def _validate_bootable_disk(self, node, rule_number, index=None):
         '''
         Validate that only 1 System Disk has "bootable" set to True
         '''
 
-        preamble = '_validate_bootable_disk: %s Rule:%s : ' % \
-                   (node.item_id, rule_number)
+        preamble = '_validate_bootable_disk: %s Rule:%s : '
+
+        if index is None:
+            index = NodeStorageIndex(node)
 
         errors = []
 
-        num_boot_disks = len([disk for disk in node.system.disks \
-                                if disk.bootable == "true"])
+        num_boot_disks = len(index.get_boot_disks())
 
         if num_boot_disks != 1:
             message = "One System Disk should have 'bootable' Property " + \
                       "set to 'true'"
-            log.trace.debug(preamble + message)
+            log.debug(preamble + "%s", node.item_id, rule_number, message)
             error = ValidationError(item_path=node.system.get_vpath(),
                                     error_message=message)
             errors.append(error)
 
         return errors
 
-    def _validate_disk_exists(self, node, rule_number):
+    def _validate_disk_tuning(self, node, rule_number, index=None):
+        '''
+        Validate the io_scheduler and nr_requests of
+        the System Disks of a Node
+        '''
+
+        preamble = '_validate_disk_tuning: %s Rule:%s : '
+
+        if index is None:
+            index = NodeStorageIndex(node)
+
+        errors = []
+        for disk in index.disks:
+            io_scheduler = getattr(disk, 'io_scheduler', None)
+            nr_requests = getattr(disk, 'nr_requests', None)
+            message = None
+            if io_scheduler is not None and \
+               io_scheduler not in VolMgrUtils.IO_SCHEDULERS:
+                message = ("System Disk io_scheduler '%s' must be " + \
+                           "one of %s") % \
+                           (io_scheduler,
+                            ', '.join(VolMgrUtils.IO_SCHEDULERS))
+            elif nr_requests is not None:
+                try:
+                    valid = VolMgrUtils.MIN_NR_REQUESTS <= \
+                            int(nr_requests) <= \
+                            VolMgrUtils.MAX_NR_REQUESTS
+                except ValueError:
+                    valid = False
+                if not valid:
+                    message = ("System Disk nr_requests '%s' must be " + \
+                               "a number between %d and %d") % \
+                               (nr_requests, VolMgrUtils.MIN_NR_REQUESTS,
+                                VolMgrUtils.MAX_NR_REQUESTS)
+            if message is not None:
+                log.debug(preamble + "%s", node.item_id, rule_number,
+                          message)
+                errors.append(ValidationError(item_path=disk.get_vpath(),
+                                              error_message=message))
+        return errors
+
+    def _validate_disk_exists(self, node, rule_number, index=None):
         '''
         Validate that the Physical Device exists as
         a System Disk
         '''
 
-        preamble = '_validate_disk_exists: %s Rule:%s : ' % \
-                   (node.item_id, rule_number)
+        preamble = '_validate_disk_exists: %s Rule:%s : '
+
+        if index is None:
+            index = NodeStorageIndex(node)
 
         errors = []
-        for vg in node.storage_profile.volume_groups:
+        for vg in index.volume_groups:
 
             for pd in vg.physical_devices:
 
-                system_disk_found = False
-
-                for disk in node.system.disks:
-                    if disk.name and (disk.name == pd.device_name):
-                        system_disk_found = True
-                        break
-
-                if not system_disk_found:
+                if index.get_pd_disk(pd) is None:
                     message = "Failed to find System disk '%s'" % \
                               pd.device_name
-                    log.trace.debug((preamble + "VG:%s PD:%s " + message) % \
-                                    (vg.item_id, pd.item_id))
+                    log.debug(preamble + "VG:%s PD:%s %s",
+                              node.item_id, rule_number,
+                              vg.item_id, pd.item_id, message)
                     error = ValidationError(item_path=pd.get_vpath(),
                                             error_message=message)
                     errors.append(error)
 
-                # At present only 1 Physical Device is supported
-                break
-
         return errors
 
-    def _validate_pd_disks(self, node, rule_number):
+    def _validate_pd_disks(self, node, rule_number, index=None):
         '''
         Validate that each System Disk is referenced by
         at most 1 Physical Device.
         '''
 
-        preamble = '_validate_pd_disks: %s Rule:%s : ' % \
-                   (node.item_id, rule_number)
+        preamble = '_validate_pd_disks: %s Rule:%s : '
 
-        errors = []
-        for disk in node.system.disks:
-            pd_refs = [pd for pd in \
-                        [pd2 for vg in node.storage_profile.volume_groups \
-                         for pd2 in vg.physical_devices] \
-                       if pd.device_name == disk.name]
+        if index is None:
+            index = NodeStorageIndex(node)
 
-            if len(pd_refs) > 1:
+        errors = []
+        for disk in index.disks:
+            if len(index.get_pd_refs(disk)) > 1:
                 msg = "Disk '%s' referenced by multiple Physical Devices" % \
                       disk.name
-                log.trace.debug(preamble + msg)
+                log.debug(preamble + "%s", node.item_id, rule_number, msg)
 
                 error = ValidationError(item_path=disk.get_vpath(),
                                         error_message=msg)
@@ -195,14 +578,271 @@ class VolMgrPlugin(Plugin):
 
         return errors
 
+    def _validate_profile(self, profile):
+        '''
+        Validate all Storage Profile level rules for a given profile
+        '''
+
+        index = ProfileIndex(profile)
+
+        errors = []
+        errors += self._validate_unique_vg_name(profile, '4', index)
+        errors += self._validate_unique_fs_mountpoint(profile, '5', index)
+        errors += self._validate_swap_fs_mountpoint(profile, '9')
+        errors += self._validate_fs_mount_options(profile, '16')
+        errors += self._validate_fs_inode_ratio(profile, '17')
+        errors += self._validate_fs_cache(profile, '25')
+        errors += self._validate_thin_provisioning(profile, '27')
+        errors += self._validate_fs_readahead(profile, '29')
+        errors += self._validate_fs_type_properties(profile, '31')
+        errors += self._validate_fs_mkfs_options(profile, '32')
+
+        return errors
+
+    def _validate_profile_cached(self, profile, fingerprint):
+        '''
+        Validate a Storage Profile, reusing the errors of a previous
+        validation if the profile content has not changed since
+        '''
+
+        preamble = '_validate_profile_cached: '
+
+        errors = self.profile_cache.get(fingerprint)
+        if errors is None:
+            errors = self._validate_profile(profile)
+            self.profile_cache.put(fingerprint, errors)
+        else:
+            log.debug(preamble + "Reusing cached validation of " + \
+                      "Storage Profile '%s'", profile.item_id)
+
+        return list(errors)
+
+    def _validate_non_root_vg_disks(self, node, rule_number, index):
+        '''
+        Validate that only the root Volume Group uses
+        the bootable System Disk. Nothing is checked while
+        the Storage Profile has no root Volume Group.
+        '''
+
+        preamble = '_validate_non_root_vg_disks: %s Rule:%s : '
+
+        errors = []
+
+        the_root_vg = self._get_root_vg_name(node)
+        if the_root_vg is None:
+            return errors
+
+        for vg in index.volume_groups:
+            if vg.volume_group_name == the_root_vg:
+                continue
+            for pd in vg.physical_devices:
+                disk = index.get_pd_disk(pd)
+                if disk is not None and disk.bootable == 'true':
+                    message = ("Only the root Volume Group may use the " + \
+                               "bootable System Disk '%s'") % disk.name
+                    log.debug(preamble + "VG:%s %s", node.item_id,
+                              rule_number, vg.item_id, message)
+                    errors.append(ValidationError(item_path=pd.get_vpath(),
+                                                  error_message=message))
+        return errors
+
+    def _validate_cache_devices(self, node, rule_number, index):
+        '''
+        Validate that the cache_device of a Volume Group is a
+        System Disk of the Node used by no Physical Device, no
+        other Volume Group and not the bootable System Disk
+        '''
+
+        preamble = '_validate_cache_devices: %s Rule:%s : '
+
+        errors = []
+        vgs_by_cache_device = {}
+
+        for vg in index.volume_groups:
+            cache_device = getattr(vg, 'cache_device', None)
+            if cache_device is None:
+                continue
+            disk = index.disks_by_name.get(cache_device)
+            if disk is None:
+                message = ("Cache device '%s' does not exist as a " + \
+                           "System Disk") % cache_device
+            elif disk.bootable == 'true':
+                message = ("Cache device '%s' must not be the " + \
+                           "bootable System Disk") % cache_device
+            elif index.get_pd_refs(disk):
+                message = ("Cache device '%s' is referenced by " + \
+                           "a Physical Device") % cache_device
+            elif cache_device in vgs_by_cache_device:
+                message = ("Cache device '%s' is already the cache " + \
+                           "device of Volume Group '%s'") % \
+                           (cache_device,
+                            vgs_by_cache_device[cache_device].item_id)
+            else:
+                vgs_by_cache_device[cache_device] = vg
+                continue
+
+            log.debug(preamble + "VG:%s %s", node.item_id, rule_number,
+                      vg.item_id, message)
+            errors.append(ValidationError(item_path=vg.get_vpath(),
+                                          error_message=message))
+        return errors
+
+    def _validate_volume_drivers(self, node, rule_number, index):
+        '''
+        Validate that a Driver can be loaded for the
+        volume_driver of every Volume Group of a Node
+        '''
+
+        preamble = '_validate_volume_drivers: %s Rule:%s : '
+
+        errors = []
+        for vg in index.volume_groups:
+            if self.drivers.get(vg.volume_driver) is None:
+                message = ("No Volume Manager Driver is available " + \
+                           "for volume_driver '%s': %s") % \
+                           (vg.volume_driver,
+                            self.drivers.get_load_error(vg.volume_driver))
+                log.debug(preamble + "VG:%s %s", node.item_id, rule_number,
+                          vg.item_id, message)
+                errors.append(ValidationError(item_path=vg.get_vpath(),
+                                              error_message=message))
+        return errors
+
+    def _validate_node(self, node, index, batch_errors=None):
+        '''
+        Validate all Node level rules (System against Profile)
+        for a given Managed Node. The errors of the Drivers which
+        have already validated the Node as part of a batch may be
+        supplied, keyed by volume_driver.
+        '''
+
+        if batch_errors is None:
+            batch_errors = {}
+
+        errors = []
+        errors += self._validate_bootable_disk(node, '13', index)
+        errors += self._validate_disk_tuning(node, '30', index)
+
+        if node.storage_profile:
+            errors += self._validate_disk_exists(node, '1.1', index)
+            errors += self._validate_pd_disks(node, '12', index)
+            errors += self._validate_volume_drivers(node, '21', index)
+            errors += self._validate_non_root_vg_disks(node, '22', index)
+            errors += self._validate_cache_devices(node, '26', index)
+
+            for name in self._get_driver_names(index):
+                if name in batch_errors:
+                    errors += batch_errors[name]
+                    continue
+                driver = self.drivers.get(name)
+                if driver is not None:
+                    errors += driver.validate_node(node, index)
+
+        return errors
+
+    def _validate_node_args(self, args):
+        '''
+        Validate a Managed Node given a (node, index, batch_errors) tuple
+        '''
+
+        node, index, batch_errors = args
+        return self._validate_node(node, index, batch_errors)
+
+    def _validate_nodes_batched(self, pending):
+        '''
+        Validate the pending (node, index) pairs with every Driver
+        able to validate a batch of Nodes in one pass. Returns the
+        errors per Node vpath, keyed by volume_driver.
+        '''
+
+        nodes_by_driver = {}
+        for node, index in pending:
+            if node.storage_profile:
+                for name in self._get_driver_names(index):
+                    nodes_by_driver.setdefault(name, []).append((node,
+                                                                 index))
+
+        batch_errors = dict((node.get_vpath(), {}) for node, _ in pending)
+        for name, driver_nodes in nodes_by_driver.items():
+            driver = self.drivers.get(name)
+            if driver is None or not hasattr(driver, 'validate_nodes'):
+                continue
+            results = driver.validate_nodes(
+                                    [node for node, _ in driver_nodes],
+                                    [index for _, index in driver_nodes])
+            for (node, _), errors in zip(driver_nodes, results):
+                batch_errors[node.get_vpath()][name] = errors
+
+        return batch_errors
+
+    def _get_cached_node_errors(self, node, state):
+        '''
+        Return the errors of a previous validation of a Managed Node
+        if its storage items are unchanged and were already unchanged
+        then, else None
+        '''
+
+        preamble = '_get_cached_node_errors: %s : '
+
+        if not VolMgrPlugin.INCREMENTAL_VALIDATION or state is None:
+            return None
+
+        cached = self.node_cache.get(node.get_vpath())
+        if cached is not None and cached[0] == state:
+            log.debug(preamble + "Reusing cached validation", node.item_id)
+            return list(cached[1])
+
+        return None
+
+    def _validate_nodes(self, nodes):
+        '''
+        Validate a list of Managed Nodes, concurrently where
+        configured, returning one list of errors per Node
+        in the order of the Nodes. Only the Nodes whose storage
+        items have changed are indexed and validated again.
+        '''
+
+        results = [None] * len(nodes)
+        pending = []
+
+        for position, node in enumerate(nodes):
+            state = None
+            if VolMgrPlugin.INCREMENTAL_VALIDATION:
+                state = NodeStorageIndex.get_storage_state(node)
+            results[position] = self._get_cached_node_errors(node, state)
+            if results[position] is None:
+                pending.append((position, node, NodeStorageIndex(node),
+                                state))
+
+        pool = VolMgrPool(VolMgrPlugin.VALIDATION_POOL,
+                          VolMgrPlugin.VALIDATION_WORKERS)
+
+        # Batch capable Drivers, such as the LVM capacity rules,
+        # check all pending Nodes at once
+        batch_errors = self._validate_nodes_batched(
+                        [(node, index) for _, node, index, _ in pending])
+
+        node_errors = pool.map(self._validate_node_args,
+                               [(node, index, batch_errors[node.get_vpath()]) \
+                                for _, node, index, _ in pending])
+
+        for (position, node, _, state), errors in \
+                zip(pending, node_errors):
+            results[position] = errors
+            if VolMgrPlugin.INCREMENTAL_VALIDATION:
+                self.node_cache.put(node.get_vpath(), (state, errors))
+
+        return results
+
     def validate_model(self, plugin_api_context):
         """
         This method can be used to validate the Model ...
 
           D=Done, H=HalfDone, N=NotDone
         1.1 D validate the PD device exists as a System Disk
-        1.2 H validate size constraints between system.disk & VG items
-              (see LVM Driver validation)
+        1.2 H validate size constraints between system.disk & VG items,
+              and between the cache device & cached FS items
+              (see LVM and VxVM Driver validation)
         2.  D validate that VG must contain 1-5 FSs and 1 PD
         3.  D validate that we can only create a 1-2 VGs
         4.  D validate VG name is unique in scope of storage-profile
@@ -219,66 +859,315 @@ class VolMgrPlugin(Plugin):
         14. D validate the FS size must be a multiple of the
               Logical Extent size, which defaults to 4 MB
               (see LVM Driver validation)
+        15. D validate FS striping: stripes within the number of PDs,
+              stripe_size a power of 2 up to the Logical Extent size,
+              FS size aligned to stripes x Logical Extent and fitting
+              on the stripes; VxVM stripes x mirrors within the number
+              of PDs (see LVM and VxVM Driver validation)
+        16. D validate FS mount_options, after expanding the named
+              presets, are valid for the FS type
+        17. D validate FS inode_ratio is a valid mke2fs bytes-per-inode
+              value or usage type, on an ext4 FS only
+        18. D validate VG pe_size is a power of 2; FS sizes are then
+              aligned and capacity checked against it per VG
+              (see LVM Driver validation)
+        19. D validate a VxVM VG uses no bootable System Disk
+              (see VxVM Driver validation)
+        20. D validate FS in a VxVM VG is of type 'vxfs'
+              (see VxVM Driver validation)
+        21. D validate a Driver is registered and loads for
+              the VG volume_driver
+        22. D validate only the root VG uses the bootable System Disk;
+              together with 12 no System Disk is shared between VGs
+        23. D validate an applied FS size is not reduced
+              (see LVM Driver validation)
+        24. D validate a growing FS fits in the free extents of its VG;
+              the growth is applied online (see LVM Driver validation)
+        25. D validate a cached FS has a valid cache_size and
+              cache_policy, is not swap, and is in an LVM VG with
+              a cache_device
+        26. D validate a VG cache_device is a non bootable System Disk
+              used by no PD and no other VG
+        27. D validate a VG thin_pool_size and overcommit_ratio; a thin
+              FS is in an LVM VG with a thin pool, is neither swap,
+              '/', striped nor cached; FS snap_size is a percentage
+        28. D validate the thin FSs of a VG fit in its thin pool size
+              times its overcommit ratio (see LVM Driver validation)
+        29. D validate FS readahead_kb is a number of Kilobytes up to
+              64M, on an FS of an LVM VG
+        30. D validate System Disk io_scheduler is a known scheduler
+              and nr_requests a queue depth between 4 and 8192
+        31. D validate a tmpfs FS is mounted on a directory other than
+              '/' and takes no Logical Volume property; an xfs FS is
+              at least 16M. A tmpfs FS takes no VG capacity and is
+              excluded from 1.2, 14, 23 and 24
+        32. D validate FS mkfs_options are short mkfs options of the
+              FS type, with values free of shell metacharacters
+        33. D validate a VxVM VG has at least one PD
+              (see VxVM Driver validation)
 
         """
 
-        profiles = []
         nodes = plugin_api_context.query("node")
 
+        # Fingerprint each distinct Storage Profile once
+        profile_fingerprints = {}
         for node in nodes:
             if node.storage_profile:
-                profiles.append(node.storage_profile)
+                key = node.storage_profile.get_vpath()
+                if key not in profile_fingerprints:
+                    profile_fingerprints[key] = \
+                        VolMgrUtils.get_profile_fingerprint(
+                                                    node.storage_profile)
 
         # To avoid duplicate Profile errors, only validate once
         errors = []
-        for profile in profiles:
-            errors += self._validate_unique_vg_name(profile, '4')
-            errors += self._validate_unique_fs_mountpoint(profile, '5')
-            errors += self._validate_swap_fs_mountpoint(profile, '9')
-
-        # Validate each Node (System against Profile)
+        fingerprints = set()
         for node in nodes:
-            if node.system:
-                errors += self._validate_bootable_disk(node, '13')
-
-                if node.storage_profile:
-                    errors += self._validate_disk_exists(node, '1.1')
-                    errors += self._validate_pd_disks(node, '12')
+            if node.storage_profile:
+                fingerprint = \
+                   profile_fingerprints[node.storage_profile.get_vpath()]
+                if fingerprint not in fingerprints:
+                    fingerprints.add(fingerprint)
+                    errors += self._validate_profile_cached(
+                                                       node.storage_profile,
+                                                       fingerprint)
 
-                    errors += self.lvm_driver.validate_node(node)
-                    errors += self.vxvm_driver.validate_node(node)
+        # Validate each Node (System against Profile)
+        for node_errors in self._validate_nodes([node for node in nodes \
+                                                 if node.system]):
+            errors += node_errors
 
         return errors
 
 # ----------------------
 
-    def _gen_tasks_for_node(self, node):
+    def _get_root_vg_name(self, node):
         '''
-        Generate all Tasks for a given Managed Node.
+        Return the name of the root Volume Group of a Node,
+        or None if the Storage Profile has none
         '''
 
-        preamble = '._gen_tasks_for_node: %s : ' % node.item_id
+        preamble = '._get_root_vg_name: %s : '
 
-        log.trace.debug((preamble + \
-                         "Generating tasks for Node '%s'") % \
-                         node.item_id)
-
-        tasks = []
         try:
-            the_root_vg = node.storage_profile.view_root_vg
+            return node.storage_profile.view_root_vg
         except ViewError as e:
-            log.trace.debug(preamble + str(e))
-            return tasks
+            log.debug(preamble + "%s", node.item_id, e)
+            return None
 
-        for vg in node.storage_profile.volume_groups:
-            if vg.volume_group_name == the_root_vg:
-                if vg.volume_driver == 'lvm':
-                    tasks += self.lvm_driver.gen_tasks_for_volume_group(node,
-                                                                        vg)
-                elif vg.volume_driver == 'vxvm':
-                    tasks += self.vxvm_driver.gen_tasks_for_volume_group(node,
-                                                                         vg)
+    def _iter_tasks_for_vg(self, node, vg, index):
+        '''
+        Generate all Tasks for a given Volume Group
+        with the Driver of its volume_driver
+        '''
+
+        preamble = '._iter_tasks_for_vg: %s VG:%s : '
+
+        driver = self.drivers.get(vg.volume_driver)
+        if driver is None:
+            log.debug(preamble + "No Driver for volume_driver '%s'",
+                      node.item_id, vg.item_id, vg.volume_driver)
+            return []
+        elif hasattr(driver, 'iter_tasks_for_volume_group'):
+            return driver.iter_tasks_for_volume_group(node, vg, index)
+
+        return driver.gen_tasks_for_volume_group(node, vg, index)
+
+    @staticmethod
+    def _is_below(path, mount_point):
+        '''
+        Return boolean True if path lies strictly below mount_point
+        '''
+
+        return path.startswith(mount_point.rstrip('/') + '/')
+
+    def _link_nested_mount(self, task, mounts, directories):
+        '''
+        Make the Mount Directory of a File System depend on the
+        Mounts of the File Systems it is nested in, whichever
+        Volume Group they belong to. mounts and directories collect
+        the Mount and Mount Directory Tasks of the Node seen so far.
+        '''
+
+        if task.call_type == 'mount':
+            mounts[task.call_id] = task
+            for path, directory in directories:
+                if VolMgrPlugin._is_below(path, task.call_id):
+                    directory.requires.add(task)
+        elif task.call_type == 'file' and \
+             task.kwargs.get('ensure') == 'directory':
+            path = task.kwargs.get('path', task.call_id)
+            directories.append((path, task))
+            for mount_point, mount in mounts.items():
+                if VolMgrPlugin._is_below(path, mount_point):
+                    task.requires.add(mount)
+
+    def _iter_tasks_for_node(self, node, index=None):
+        '''
+        Generate all Tasks for a given Managed Node,
+        yielding them one Volume Group at a time, root Volume
+        Group first. Nothing is generated while the Storage Profile
+        has no root Volume Group. The Tasks of Volume Groups on
+        different System Disks are independent of each other, except
+        where a File System is mounted within another.
+        '''
+
+        preamble = '._iter_tasks_for_node: %s : '
+
+        log.debug(preamble + "Generating tasks for Node '%s'",
+                  node.item_id, node.item_id)
+
+        the_root_vg = self._get_root_vg_name(node)
+        if the_root_vg is None:
+            return
+
+        if index is None:
+            index = NodeStorageIndex(node)
+
+        vgs = sorted(index.volume_groups,
+                     key=lambda vg: vg.volume_group_name != the_root_vg)
+
+        mounts = {}
+        directories = []
+        for vg in vgs:
+            for task in self._iter_tasks_for_vg(node, vg, index):
+                self._link_nested_mount(task, mounts, directories)
+                yield task
+
+    def _gen_tasks_for_node(self, node, index=None):
+        '''
+        Generate all Tasks for a given Managed Node.
+        '''
+
+        return list(self._iter_tasks_for_node(node, index))
+
+    def _index_node(self, node, profile_fingerprints):
+        '''
+        Index a Managed Node with the fingerprint of its Storage
+        Profile. profile_fingerprints is keyed by Storage Profile
+        vpath, so each Storage Profile is fingerprinted once.
+        '''
 
+        key = node.storage_profile.get_vpath()
+        fingerprint = profile_fingerprints.get(key)
+        if fingerprint is None:
+            fingerprint = \
+                   VolMgrUtils.get_profile_fingerprint(node.storage_profile)
+            profile_fingerprints[key] = fingerprint
+
+        return NodeStorageIndex(node, fingerprint)
+
+    def _gen_node_tasks(self, node, profile_fingerprints):
+        '''
+        Generate all Tasks for a given Managed Node in a pool worker,
+        returned with the Node as a (node, tasks) pair
+        '''
+
+        return (node, self._gen_tasks_for_node(node,
+                              self._index_node(node, profile_fingerprints)))
+
+    def _iter_task_nodes(self, nodes):
+        '''
+        Yield the Nodes which have both a System and a Storage Profile
+        '''
+
+        preamble = '._iter_task_nodes: '
+
+        for node in nodes:
+            log.debug(preamble + "Examining Node '%s'", node.item_id)
+            if node.storage_profile and node.system:
+                log.debug(preamble + "Processing Storage Profile on Node '%s'",
+                          node.item_id)
+                yield node
+            else:
+                log.debug(preamble + "Node '%s' does not have both a " + \
+                          "System and Storage Profile", node.item_id)
+
+    def _iter_tasks(self, nodes):
+        '''
+        Generate the Tasks for all Nodes as a stream, Node by Node.
+        The Nodes are consumed lazily. With a serial pool each Task
+        is yielded as soon as it is built; otherwise Nodes are
+        processed concurrently by threads and their Tasks yielded
+        in Node order.
+        One summary line is logged per Node; individual Tasks are
+        logged 1 in every TASK_LOG_SAMPLE_RATE.
+        '''
+
+        preamble = '._iter_tasks: '
+
+        pool = VolMgrPool(VolMgrPlugin.TASK_POOL, VolMgrPlugin.TASK_WORKERS)
+        task_nodes = self._iter_task_nodes(nodes)
+        profile_fingerprints = {}
+
+        if pool.mode == VolMgrPool.SERIAL:
+            node_tasks = ((node,
+                           self._iter_tasks_for_node(node,
+                               self._index_node(node, profile_fingerprints))) \
+                          for node in task_nodes)
+        else:
+            node_tasks = pool.imap(lambda node: \
+                                   self._gen_node_tasks(node,
+                                                        profile_fingerprints),
+                                   task_nodes)
+
+        for node, tasks in node_tasks:
+            summary = log.summary(preamble + "Node '%s': %d tasks",
+                                  node.item_id)
+            for task in tasks:
+                log.debug_sampled('task', VolMgrPlugin.TASK_LOG_SAMPLE_RATE,
+                                  preamble + "Task: %s", task)
+                summary.add()
+                yield task
+            summary.emit()
+
+    def _snapshot_callback(self, callback_api, hostname, action,
+                           **arguments):
+        '''
+        Run an LVM snapshot action on a Managed Node through the
+        'lv' agent shipped with this plugin
+        '''
+
+        preamble = '_snapshot_callback: %s : '
+
+        log.debug(preamble + "Running '%s' on %s/%s", hostname, action,
+                  arguments.get('vg'), arguments.get('lv'))
+
+        results = run_rpc_command([hostname], 'lv', action, arguments)
+        result = results.get(hostname, {})
+        errors = result.get('errors')
+        if not errors and result.get('data', {}).get('status', 0):
+            errors = result['data'].get('err')
+        if errors or not result:
+            message = "LVM %s of %s/%s failed on %s: %s" % \
+                      (action, arguments.get('vg'), arguments.get('lv'),
+                       hostname, errors or 'no response')
+            log.debug(preamble + "%s", hostname, message)
+            raise CallbackExecutionException(message)
+
+    def create_snapshot_plan(self, plugin_api_context):
+        """
+        Plugin can provide tasks to create, remove or restore the
+        snapshots of the File Systems of every Managed Node, per
+        the action of the snapshot plan. Restoring merges each
+        snapshot back into its Volume, which rolls a Node back
+        without reinstalling it.
+        """
+
+        action = plugin_api_context.snapshot_action()
+
+        tasks = []
+        nodes = plugin_api_context.query('node')
+        for node in self._iter_task_nodes(nodes):
+            index = NodeStorageIndex(node)
+            for vg in index.volume_groups:
+                driver = self.drivers.get(vg.volume_driver)
+                if driver is not None and \
+                   hasattr(driver, 'gen_snapshot_tasks'):
+                    tasks += driver.gen_snapshot_tasks(node, vg, action,
+                                                   self._snapshot_callback,
+                                                   index)
         return tasks
 
     def create_configuration(self, plugin_api_context):
@@ -292,26 +1181,7 @@ class VolMgrPlugin(Plugin):
           # TODO Please provide an example CLI snippet for plugin lvm
           # here
         """
-        tasks = []
-        preamble = '.create_configuration: '
 
         nodes = plugin_api_context.query('node')
-        for node in nodes:
-            log.trace.debug((preamble + \
-                            "Examining Node '%s'") % \
-                            node.item_id)
-            if node.storage_profile and node.system:
-                log.trace.debug((preamble + \
-                                "Processing Storage Profile on Node '%s'") % \
-                                node.item_id)
-                tasks += self._gen_tasks_for_node(node)
-            else:
-                log.trace.debug((preamble + \
-                                 "Node '%s' does not have both a " + \
-                                 "System and Storage Profile") % \
-                                 node.item_id)
 
-        for task in tasks:
-            log.trace.debug(preamble + "Task: %s" % task)
-
-        return tasks
+        return list(self._iter_tasks(nodes))
@@ -0,0 +1,92 @@
+##############################################################################
+# COPYRIGHT Ericsson AB 2014
+#
+# The copyright to the computer program(s) herein is the property of
+# Ericsson AB. The programs may be used and/or copied only with written
+# permission from Ericsson AB. or in accordance with the terms and
+# conditions stipulated in the agreement/contract under which the
+# program(s) have been supplied.
+##############################################################################
+
+from multiprocessing.pool import ThreadPool
+
+
+class VolMgrPool(object):
+    '''
+    Worker pool applying a function to a sequence of independent
+    items. Results are always returned in the order of the items,
+    whichever mode is used.
+    '''
+
+    SERIAL = 'serial'
+    THREAD = 'thread'
+
+    MODES = (SERIAL, THREAD)
+
+    def __init__(self, mode=THREAD, workers=4):
+        '''
+        Constructor
+        @param mode: One of 'serial' or 'thread'
+        @type mode: String
+        @param workers: Maximum number of concurrent workers
+        @type workers: Integer
+        '''
+
+        if mode not in VolMgrPool.MODES:
+            raise ValueError("Unknown pool mode '%s'" % mode)
+
+        self.mode = mode
+        self.workers = workers
+
+    def _is_serial(self, items):
+        '''
+        Return boolean True if the items are better processed serially
+        '''
+
+        return self.mode == VolMgrPool.SERIAL or \
+               self.workers < 2 or len(items) < 2
+
+    def _create_pool(self, items):
+        '''
+        Create a pool no larger than the number of items
+        '''
+
+        return ThreadPool(min(self.workers, len(items)))
+
+    def map(self, func, items):
+        '''
+        Apply func to every item and return the list of results
+        '''
+
+        items = list(items)
+
+        if self._is_serial(items):
+            return [func(item) for item in items]
+
+        pool = self._create_pool(items)
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    def imap(self, func, items):
+        '''
+        Apply func to every item, yielding the results in order
+        as they become available. The items are consumed as they
+        are dispatched rather than gathered up front, so they may
+        be any iterable, including a generator.
+        '''
+
+        if self.mode == VolMgrPool.SERIAL or self.workers < 2:
+            for item in items:
+                yield func(item)
+            return
+
+        pool = ThreadPool(self.workers)
+        try:
+            for result in pool.imap(func, items):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
@@ -10,12 +10,150 @@
 
 import re
 
+from volmgr_plugin.volmgr_cache import VolMgrCache
+
 
 class VolMgrUtils(object):
     '''
     Simple utilities for various file system requirements.
     '''
 
+    # Item properties which contribute to a Storage Profile fingerprint
+    VG_FINGERPRINT_PROPERTIES = ['volume_group_name', 'volume_driver',
+                                 'pe_size', 'cache_device',
+                                 'thin_pool_size', 'overcommit_ratio']
+    FS_FINGERPRINT_PROPERTIES = ['type', 'mount_point', 'size',
+                                 'stripes', 'stripe_size', 'mount_options',
+                                 'mkfs_options', 'inode_ratio', 'mirrors',
+                                 'cache_policy', 'cache_size', 'thin',
+                                 'snap_size', 'readahead_kb']
+    PD_FINGERPRINT_PROPERTIES = ['device_name']
+
+    # Named File System inode_ratio values, as mke2fs usage types
+    INODE_RATIO_TYPES = ['largefile', 'largefile4']
+
+    # Bytes per inode bounds accepted by mke2fs
+    MIN_INODE_RATIO = 1024
+
+    MAX_INODE_RATIO = 67108864
+
+    # mkfs options accepted per File System type, as the short
+    # options taking no value and those taking one
+    MKFS_OPTIONS = {'ext4': ('Fjq', 'bEgGiIJLmNOTU'),
+                    'xfs': ('fKq', 'bdilLnrs'),
+                    'vxfs': ('', 'o')}
+
+    # An mkfs option value, free of shell metacharacters
+    MKFS_OPTION_VALUE = r'[A-Za-z0-9_.,=:/+-]+'
+
+    # File System cache_policy values, as LVM cache modes
+    CACHE_POLICIES = ['writethrough', 'writeback']
+
+    DEFAULT_CACHE_POLICY = 'writethrough'
+
+    # File System read ahead bounds, in Kilobytes
+    MAX_READAHEAD_KB = 65536
+
+    # Block queue settings of a System Disk
+    IO_SCHEDULERS = ['noop', 'deadline', 'cfq',
+                     'none', 'mq-deadline', 'kyber', 'bfq']
+
+    MIN_NR_REQUESTS = 4
+
+    MAX_NR_REQUESTS = 8192
+
+    # Smallest File System of type 'xfs' accepted by mkfs.xfs, in Megabytes
+    MIN_XFS_SIZE_MB = 16
+
+    # File System properties which only apply to a Logical Volume
+    # and so not to a File System of type 'tmpfs'
+    VOLUME_FS_PROPERTIES = ['stripes', 'stripe_size', 'mkfs_options',
+                            'inode_ratio', 'cache_size', 'cache_policy',
+                            'thin', 'snap_size', 'readahead_kb']
+
+    @staticmethod
+    def _item_fingerprint(item, properties):
+        '''
+        Fingerprint a single model item from its vpath
+        and the values of the nominated properties
+        '''
+
+        return (item.get_vpath(),) + \
+               tuple([getattr(item, name, None) for name in properties])
+
+    @staticmethod
+    def get_profile_fingerprint(profile):
+        '''
+        Utility method to build a hashable fingerprint of the
+        content of a Storage Profile. Any change to a Volume Group,
+        File System or Physical Device under the profile yields
+        a different fingerprint.
+        @param profile: Storage Profile
+        @type profile: QueryItem
+        @return: Fingerprint of the profile content
+        @rtype: Tuple
+        '''
+
+        vgs = []
+        for vg in profile.volume_groups:
+            fss = tuple([VolMgrUtils._item_fingerprint(fs,
+                                   VolMgrUtils.FS_FINGERPRINT_PROPERTIES)
+                         for fs in vg.file_systems])
+            pds = tuple([VolMgrUtils._item_fingerprint(pd,
+                                   VolMgrUtils.PD_FINGERPRINT_PROPERTIES)
+                         for pd in vg.physical_devices])
+            vgs.append((VolMgrUtils._item_fingerprint(vg,
+                                   VolMgrUtils.VG_FINGERPRINT_PROPERTIES),
+                        fss, pds))
+
+        return (getattr(profile, 'storage_profile_name', None), tuple(vgs))
+
+    @staticmethod
+    def get_applied_property(item, name):
+        '''
+        Utility method to return the value of a property as last
+        applied to the model item
+        @param item: Model item
+        @type item: QueryItem
+        @param name: Property name
+        @type name: String
+        @return: Applied value, None if the item was never applied
+        @rtype: String
+        '''
+
+        if item.is_initial():
+            return None
+
+        applied = getattr(item, 'applied_properties', None) or {}
+        return applied.get(name)
+
+    @staticmethod
+    def is_valid_mkfs_options(fs_type, mkfs_options):
+        '''
+        Utility method to check mkfs options are a space separated
+        list of the short options accepted for a File System type,
+        each followed by a value if it takes one
+        @param fs_type: File System type
+        @type fs_type: String
+        @param mkfs_options: mkfs options
+        @type mkfs_options: String
+        @return: True if the options are accepted
+        @rtype: Boolean
+        '''
+
+        options = VolMgrUtils.MKFS_OPTIONS.get(fs_type)
+        if options is None:
+            return False
+
+        flags, valued = options
+        tokens = ['-[%s] %s' % (valued, VolMgrUtils.MKFS_OPTION_VALUE)]
+        if flags:
+            tokens.append('-[%s]' % flags)
+        token = '(%s)' % '|'.join(tokens)
+
+        return re.match(r'^%s( +%s)*\Z' % (token, token),
+                        mkfs_options) is not None
+
     @staticmethod
     def get_size_megabytes(size_units):
         '''
@@ -23,29 +161,156 @@ class VolMgrUtils(object):
         into a Numeric Megabytes value
         @param size_units: Combined size-and-unit string
         @type size_units: String
-        @return: Numeric size in Megabytes
+        @return: Numeric size in Megabytes, 0 if the string is invalid
         @rtype: Integer
         '''
 
-        pattern = r'^\s*(?P<size>[1-9][0-9]*)\s*(?P<unit>[MGT])\s*$'
-        regexp = re.compile(pattern)
+        size = Size.parse(size_units)
+        if size is None:
+            return 0
 
-        match = regexp.search(size_units)
+        return size.megabytes
 
-        if match:
-            parts = match.groupdict()
-            if parts:
-                if 'size' in parts.keys():
-                    size = int(parts['size'])
+    @staticmethod
+    def get_sizes_megabytes(sizes_units):
+        '''
+        Utility method to convert a batch of combined size-and-unit
+        strings into Numeric Megabytes values
+        @param sizes_units: Combined size-and-unit strings
+        @type sizes_units: List of Strings
+        @return: Numeric sizes in Megabytes, 0 for invalid strings
+        @rtype: List of Integers
+        '''
 
-                    if 'unit' in parts.keys():
-                        unit = parts['unit']
-                        if unit == 'M':
-                            size *= 1
-                        elif unit == 'G':
-                            size *= 1024
-                        elif unit == 'T':
-                            size *= 1024 * 1024
-                        return size
-        else:
-            return 0
+        return [size.megabytes if size is not None else 0 \
+                for size in Size.parse_all(sizes_units)]
+
+
+class Size(object):
+    '''
+    Immutable storage size, held as an exact number of Kilobytes.
+    Parsed from combined size-and-unit strings such as '512M',
+    with K, M, G, T and P (binary) units.
+    '''
+
+    __slots__ = ['kilobytes']
+
+    UNITS = {'K': 1,
+             'M': 1024,
+             'G': 1024 ** 2,
+             'T': 1024 ** 3,
+             'P': 1024 ** 4}
+
+    PATTERN = re.compile(r'^\s*(?P<size>[1-9][0-9]*)\s*(?P<unit>[KMGTP])\s*$')
+
+    PARSE_CACHE_SIZE = 1024
+
+    _parsed = VolMgrCache(PARSE_CACHE_SIZE)
+
+    def __init__(self, kilobytes):
+        '''
+        Constructor
+        @param kilobytes: Exact size in Kilobytes
+        @type kilobytes: Integer
+        '''
+
+        self.kilobytes = int(kilobytes)
+
+    @classmethod
+    def from_megabytes(cls, megabytes):
+        '''
+        Create a Size from a number of Megabytes
+        '''
+
+        return cls(int(megabytes) * Size.UNITS['M'])
+
+    @classmethod
+    def parse(cls, size_units):
+        '''
+        Parse a combined size-and-unit string
+        @param size_units: Combined size-and-unit string
+        @type size_units: String
+        @return: The parsed Size, or None if the string is invalid
+        @rtype: Size
+        '''
+
+        size = Size._parsed.get(size_units)
+        if size is None:
+            try:
+                match = Size.PATTERN.match(size_units)
+            except TypeError:
+                return None
+            if not match:
+                return None
+            size = cls(int(match.group('size')) * \
+                       Size.UNITS[match.group('unit')])
+            Size._parsed.put(size_units, size)
+
+        return size
+
+    @classmethod
+    def parse_all(cls, sizes_units):
+        '''
+        Parse a batch of combined size-and-unit strings
+        @return: The parsed Sizes, None for each invalid string
+        @rtype: List of Sizes
+        '''
+
+        parse = cls.parse
+        return [parse(size_units) for size_units in sizes_units]
+
+    @property
+    def megabytes(self):
+        '''
+        Size in whole Megabytes, rounded down
+        '''
+
+        return self.kilobytes // Size.UNITS['M']
+
+    def is_multiple_of(self, other):
+        '''
+        Return boolean True if this Size is an exact multiple of other
+        '''
+
+        return self.kilobytes % other.kilobytes == 0
+
+    def __add__(self, other):
+        return Size(self.kilobytes + other.kilobytes)
+
+    def __sub__(self, other):
+        return Size(self.kilobytes - other.kilobytes)
+
+    def __mul__(self, factor):
+        return Size(self.kilobytes * int(factor))
+
+    __rmul__ = __mul__
+
+    def __eq__(self, other):
+        return isinstance(other, Size) and self.kilobytes == other.kilobytes
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __lt__(self, other):
+        return self.kilobytes < other.kilobytes
+
+    def __le__(self, other):
+        return self.kilobytes <= other.kilobytes
+
+    def __gt__(self, other):
+        return self.kilobytes > other.kilobytes
+
+    def __ge__(self, other):
+        return self.kilobytes >= other.kilobytes
+
+    def __hash__(self):
+        return hash(self.kilobytes)
+
+    def __str__(self):
+        for unit in ['P', 'T', 'G', 'M']:
+            if self.kilobytes and self.kilobytes % Size.UNITS[unit] == 0:
+                return '%d%s' % (self.kilobytes // Size.UNITS[unit], unit)
+        return '%dK' % self.kilobytes
+
+    def __repr__(self):
+        return "Size('%s')" % self
@@ -8,14 +8,16 @@
 # program(s) have been supplied.
 ##############################################################################
 
-# from litp.core.validators import ValidationError
-# from litp.core.execution_manager import ConfigTask
-# from volmgr_plugin.volmgr_utils import VolMgrUtils
-# from litp.core.task import OrderedTaskList
-# from litp.core.extension import ViewError
+from litp.core.validators import ValidationError
+from litp.core.execution_manager import ConfigTask
+from volmgr_plugin.volmgr_utils import Size
+from volmgr_plugin.volmgr_index import NodeStorageIndex
+from volmgr_plugin.volmgr_mount import MountOptions
+
+from volmgr_plugin.volmgr_logging import VolMgrLogger
 
 from litp.core.litp_logging import LitpLogger
-log = LitpLogger()
+log = VolMgrLogger(LitpLogger())
 
 
 class VxvmDriver(object):
@@ -23,26 +25,448 @@ class VxvmDriver(object):
     LITP VxVm Driver
     """
 
-    def gen_tasks_for_volume_group(self, node, vg):
+    VXVM_BIN = '/usr/sbin'
+
+    VXFS_BIN = '/opt/VRTS/bin'
+
+    # Private region VxVM reserves on every initialized disk
+    PRIVATE_REGION_SIZE = Size.parse('32M')
+
+    # Stripe unit vxassist applies when a striped Volume sets none
+    DEFAULT_STRIPE_SIZE = Size.parse('64K')
+
+    MIN_STRIPE_SIZE = Size.parse('4K')
+
+    # VxFS block sizes: the smallest wastes least space on small
+    # File Systems, the largest suits large File Systems
+    SMALL_BLOCK_SIZE = 1024
+
+    LARGE_BLOCK_SIZE = 8192
+
+    LARGE_FS_SIZE = Size.parse('1G')
+
+    def _suitable_state(self, items):
+        '''
+        Check if any 1 of items is Initial or Updated
+        '''
+
+        return any((item.is_initial() or item.is_updated()) for item in items)
+
+    @staticmethod
+    def _parse_count(value):
+        '''
+        Return the integer value of a stripes or mirrors
+        property: 1 if unset, 0 if invalid
+        '''
+
+        if value is None:
+            return 1
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return 0
+
+    def _gen_disk_access_name(self, disk):
+        '''
+        Generate the VxVM disk access name of a System Disk, from the
+        Facter fact naming its device. This relies on the operating
+        system native VxVM naming scheme, which the naming scheme
+        Task sets before any System Disk is initialized.
+        '''
+
+        return '$(basename $::disk_scsi_3%s_dev)' % disk.uuid
+
+    def _gen_volume_device_name(self, vg, fs, raw=False):
+        '''
+        Generate the device of a VxVM Volume
+        '''
+
+        return '/dev/vx/%s/%s/%s' % ('rdsk' if raw else 'dsk',
+                                     vg.volume_group_name, fs.item_id)
+
+    def _gen_layout_args(self, fs):
+        '''
+        Generate the vxassist layout arguments of a Volume:
+        concatenated, striped across 'stripes' columns,
+        mirrored 'mirrors' times, or both
+        '''
+
+        stripes = VxvmDriver._parse_count(getattr(fs, 'stripes', None))
+        mirrors = VxvmDriver._parse_count(getattr(fs, 'mirrors', None))
+
+        if stripes > 1 and mirrors > 1:
+            layout = 'stripe-mirror'
+        elif stripes > 1:
+            layout = 'stripe'
+        elif mirrors > 1:
+            layout = 'mirror'
+        else:
+            layout = 'concat'
+
+        args = ['layout=%s' % layout]
+        if stripes > 1:
+            stripe_size = getattr(fs, 'stripe_size', None) or \
+                          str(VxvmDriver.DEFAULT_STRIPE_SIZE)
+            args += ['ncol=%d' % stripes,
+                     'stripeunit=%s' % stripe_size.lower()]
+        if mirrors > 1:
+            args.append('nmirror=%d' % mirrors)
+
+        return args
+
+    def _gen_mkfs_options(self, fs):
+        '''
+        Generate the mkfs options of a VxFS File System. An explicit
+        'mkfs_options' property overrides the generated options.
+        '''
+
+        mkfs_options = getattr(fs, 'mkfs_options', None)
+        if mkfs_options:
+            return mkfs_options
+
+        size = Size.parse(fs.size)
+        if size is not None and size >= VxvmDriver.LARGE_FS_SIZE:
+            bsize = VxvmDriver.LARGE_BLOCK_SIZE
+        else:
+            bsize = VxvmDriver.SMALL_BLOCK_SIZE
+
+        return '-o bsize=%d,largefiles' % bsize
+
+    def _gen_exec_task(self, node, model_item, desc, call_id,
+                       command, unless):
+        '''
+        Generate an idempotent shell command Task
+        '''
+
+        return ConfigTask(node,
+                          model_item,
+                          desc,
+                          'exec',
+                          call_id,
+                          command=command,
+                          unless=unless,
+                          path=[VxvmDriver.VXVM_BIN, VxvmDriver.VXFS_BIN,
+                                '/bin', '/usr/bin'],
+                          provider='shell')
+
+    def _gen_tasks_for_disk_group(self, node, vg, pds, disks):
+        '''
+        Generate the Tasks initializing the System Disks of a
+        Volume Group and creating its Disk Group. Returns the
+        Disk Group Task last.
+        '''
+
+        preamble = '._gen_tasks_for_disk_group: %s VG:%s : '
+
+        log.debug(preamble + "Generating Disk Group tasks",
+                  node.item_id, vg.item_id)
+
+        dg_name = vg.volume_group_name
+
+        # Disk access names follow the operating system device names
+        scheme_task = self._gen_exec_task(node, vg,
+                    "VxVM Naming Scheme: %s::%s" % (vg.item_id,
+                                                    node.item_id),
+                    'vxddladm_namingscheme_%s' % dg_name,
+                    'vxddladm set namingscheme=osn',
+                    "vxddladm get namingscheme | grep -q '^OS Native'")
+
+        tasks = []
+        members = []
+        for pd, disk in zip(pds, disks):
+            da_name = self._gen_disk_access_name(disk)
+            members.append('%s=%s' % (pd.item_id, da_name))
+            disk_task = self._gen_exec_task(node, vg,
+                    "VxVM Disk: %s::%s::%s" % (pd.item_id, vg.item_id,
+                                                node.item_id),
+                    'vxdisksetup_%s' % disk.uuid,
+                    'vxdisksetup -i %s format=cdsdisk' % da_name,
+                    "vxdisk list %s | grep -q '^flags:.*online'" % da_name)
+            disk_task.requires.add(scheme_task)
+            tasks.append(disk_task)
+
+        dg_task = self._gen_exec_task(node, vg,
+                    "VxVM Disk Group: %s::%s" % (vg.item_id, node.item_id),
+                    'vxdg_init_%s' % dg_name,
+                    'vxdg init %s %s' % (dg_name, ' '.join(members)),
+                    'vxdg list %s' % dg_name)
+        for task in tasks:
+            dg_task.requires.add(task)
+
+        return [scheme_task] + tasks + [dg_task]
+
+    def _gen_tasks_for_file_system(self, node, vg, fs, dg_task):
+        '''
+        Generate the Tasks creating the Volume of a File System,
+        making the VxFS File System on it and mounting it
+        '''
+
+        preamble = '._gen_tasks_for_file_system: %s VG:%s, FS:%s : '
+
+        log.debug(preamble + "Generating tasks for File System '%s'",
+                  node.item_id, vg.item_id, fs.item_id, fs.item_id)
+
+        dg_name = vg.volume_group_name
+        ids = "%s::%s::%s" % (fs.item_id, vg.item_id, node.item_id)
+
+        volume_task = self._gen_exec_task(node, fs,
+                    "VxVM Volume: %s" % ids,
+                    'vxassist_%s_%s' % (dg_name, fs.item_id),
+                    'vxassist -g %s make %s %s %s' % \
+                            (dg_name, fs.item_id, fs.size.lower(),
+                             ' '.join(self._gen_layout_args(fs))),
+                    'vxprint -g %s -v %s' % (dg_name, fs.item_id))
+        volume_task.requires.add(dg_task)
+
+        raw_device = self._gen_volume_device_name(vg, fs, raw=True)
+        mkfs_task = self._gen_exec_task(node, fs,
+                    "VxFS: %s" % ids,
+                    'mkfs_vxfs_%s_%s' % (dg_name, fs.item_id),
+                    'mkfs -t vxfs %s %s' % (self._gen_mkfs_options(fs),
+                                            raw_device),
+                    'fstyp %s | grep -q vxfs' % raw_device)
+        mkfs_task.requires.add(volume_task)
+
+        tasks = [volume_task, mkfs_task]
+
+        # We skip over the / File System, as the LVM Driver does
+        if fs.mount_point == "/":
+            return tasks
+
+        file_task = ConfigTask(node,
+                               fs,
+                               "Mount Directory: %s" % ids,
+                               'file',
+                               fs.mount_point,
+                               path=fs.mount_point,
+                               ensure="directory",
+                               owner="0",
+                               group="0",
+                               mode="0755",
+                               backup='false')
+
+        mount_task = ConfigTask(node,
+                                fs,
+                                "Mount: %s" % ids,
+                                'mount',
+                                fs.mount_point,
+                                fstype='vxfs',
+                                device=self._gen_volume_device_name(vg, fs),
+                                ensure='mounted',
+                                options=MountOptions.get_options_string(fs),
+                                atboot="true")
+        mount_task.requires.add(mkfs_task)
+        mount_task.requires.add(file_task)
+
+        return tasks + [file_task, mount_task]
+
+    def gen_tasks_for_volume_group(self, node, vg, index=None):
         '''
         Generate all Tasks for a given Volume Group
         for a given Managed Node.
         '''
 
-        preamble = '.gen_tasks_for_volume_group: %s VG:%s : ' % \
-                   (node.item_id, vg.item_id)
-        log.trace.debug(preamble + "Generating tasks for Volume Group")
+        preamble = '.gen_tasks_for_volume_group: %s VG:%s : '
+        log.debug(preamble + "Generating tasks for Volume Group",
+                  node.item_id, vg.item_id)
+
+        if index is None:
+            index = NodeStorageIndex(node)
+
+        pds = list(vg.physical_devices)
+        if not pds:
+            # Reported by validation rule 33
+            log.debug(preamble + "No Physical Devices, skipping",
+                      node.item_id, vg.item_id)
+            return []
+
+        disks = [index.get_pd_disk(pd) for pd in pds]
+        if None in disks:
+            # Reported by validation rule 1.1
+            log.debug(preamble + "A Physical Device has no System Disk, " + \
+                      "skipping", node.item_id, vg.item_id)
+            return []
+
+        fss = [fs for fs in vg.file_systems \
+               if self._suitable_state(pds + [vg, fs])]
+
         tasks = []
+        if not fss and not self._suitable_state(pds + [vg]):
+            return tasks
+
+        tasks = self._gen_tasks_for_disk_group(node, vg, pds, disks)
+        dg_task = tasks[-1]
+        for fs in fss:
+            tasks += self._gen_tasks_for_file_system(node, vg, fs, dg_task)
 
         return tasks
 
-    def validate_node(self, node):
+# -------------
+
+    def _validate_vg_disks(self, node, vg, disks, rule_number):
+        '''
+        Validate that a VxVM Volume Group uses no bootable
+        System Disk, which is left to the operating system
+        '''
+
+        preamble = '._validate_vg_disks: %s VG:%s, Rule:%s : '
+
+        errors = []
+        for disk in disks:
+            if disk.bootable == 'true':
+                message = ("The bootable System Disk '%s' cannot be " + \
+                           "used by a VxVM Volume Group") % disk.name
+                log.debug(preamble + "%s", node.item_id, vg.item_id,
+                          rule_number, message)
+                errors.append(ValidationError(item_path=vg.get_vpath(),
+                                              error_message=message))
+        return errors
+
+    def _validate_vg_pds(self, node, vg, pd_count, rule_number):
+        '''
+        Validate that a VxVM Volume Group has Physical Devices,
+        as a Disk Group cannot be created without members
+        '''
+
+        preamble = '._validate_vg_pds: %s VG:%s, Rule:%s : '
+
+        if not pd_count:
+            message = "A VxVM Volume Group must have at least one " + \
+                      "Physical Device"
+            log.debug(preamble + "%s", node.item_id, vg.item_id,
+                      rule_number, message)
+            return [ValidationError(item_path=vg.get_vpath(),
+                                    error_message=message)]
+        return []
+
+    def _validate_fs_type(self, node, vg, fs, rule_number):
+        '''
+        Validate that a File System of a VxVM Volume Group
+        is of type 'vxfs'
+        '''
+
+        preamble = '._validate_fs_type: %s VG:%s, FS:%s, Rule:%s : '
+
+        if fs.type != 'vxfs':
+            message = "A File System in a VxVM Volume Group must " + \
+                      "have type set to 'vxfs'"
+            log.debug(preamble + "%s", node.item_id, vg.item_id,
+                      fs.item_id, rule_number, message)
+            return [ValidationError(item_path=fs.get_vpath(),
+                                    error_message=message)]
+        return []
+
+    def _validate_fs_layout(self, node, vg, fs, pd_count, rule_number):
+        '''
+        Validate that the stripes, stripe_size and mirrors of a
+        File System can be laid out on the Volume Group disks
+        '''
+
+        preamble = '._validate_fs_layout: %s VG:%s, FS:%s, Rule:%s : '
+
+        stripes = VxvmDriver._parse_count(getattr(fs, 'stripes', None))
+        mirrors = VxvmDriver._parse_count(getattr(fs, 'mirrors', None))
+        stripe_size = getattr(fs, 'stripe_size', None)
+        size = Size.parse(fs.size)
+
+        message = None
+        if stripes < 1 or mirrors < 1 or stripes * mirrors > pd_count:
+            message = ("File System stripes '%s' and mirrors '%s' " + \
+                       "need more than the %d Physical Devices of " + \
+                       "Volume Group '%s'") % \
+                       (getattr(fs, 'stripes', None),
+                        getattr(fs, 'mirrors', None), pd_count, vg.item_id)
+        elif stripe_size is not None:
+            unit = Size.parse(stripe_size)
+            if unit is None or unit < VxvmDriver.MIN_STRIPE_SIZE or \
+               unit.kilobytes & (unit.kilobytes - 1):
+                message = ("File System stripe_size '%s' must be a " + \
+                           "power of 2 of at least %s") % \
+                           (stripe_size, VxvmDriver.MIN_STRIPE_SIZE)
+            elif size is not None and \
+                 not size.is_multiple_of(unit * stripes):
+                message = ("File System size '%s' is not an exact " + \
+                           "multiple of %d stripes of '%s'") % \
+                           (fs.size, stripes, stripe_size)
+
+        if message:
+            log.debug(preamble + "%s", node.item_id, vg.item_id,
+                      fs.item_id, rule_number, message)
+            return [ValidationError(item_path=fs.get_vpath(),
+                                    error_message=message)]
+        return []
+
+    def _validate_vg_size(self, node, vg, disks, rule_number):
+        '''
+        Validate that the mirrored and striped Volumes of a
+        Volume Group fit on its System Disks, less the VxVM
+        private region of each
+        '''
+
+        preamble = '._validate_vg_size: %s VG:%s, Rule:%s : '
+
+        private_kb = VxvmDriver.PRIVATE_REGION_SIZE.kilobytes
+        disks_kb = sorted([max(size.kilobytes - private_kb, 0) \
+                           if size is not None else 0 \
+                           for size in Size.parse_all([disk.size \
+                                                       for disk in disks])],
+                          reverse=True)
+
+        required_kb = 0
+        too_wide = []
+        for fs in vg.file_systems:
+            size = Size.parse(fs.size)
+            if size is None:
+                continue
+            stripes = VxvmDriver._parse_count(getattr(fs, 'stripes', None))
+            mirrors = VxvmDriver._parse_count(getattr(fs, 'mirrors', None))
+            if stripes < 1 or mirrors < 1 or \
+               stripes * mirrors > len(disks_kb):
+                continue
+            required_kb += size.kilobytes * mirrors
+            if size.kilobytes // stripes > disks_kb[stripes * mirrors - 1]:
+                too_wide.append(fs)
+
+        errors = []
+        if required_kb > sum(disks_kb) or too_wide:
+            message = ("The System Disks (sizes = %s) do not have " + \
+                       "sufficient space for all File Systems " + \
+                       "(%s required including mirrors, %s usable)") % \
+                       (', '.join([disk.size for disk in disks]),
+                        Size(required_kb), Size(sum(disks_kb)))
+            log.debug(preamble + "%s", node.item_id, vg.item_id,
+                      rule_number, message)
+            errors.append(ValidationError(item_path=vg.get_vpath(),
+                                          error_message=message))
+        return errors
+
+    def validate_node(self, node, index=None):
         '''
         Validate all VxVm Node items for a given Managed Node
         '''
 
-        preamble = '.validate_node: %s : ' % node.item_id
-        log.trace.debug(preamble + "Validating Node")
+        preamble = '.validate_node: %s : '
+        log.debug(preamble + "Validating Node", node.item_id)
+
+        if index is None:
+            index = NodeStorageIndex(node)
+
         errors = []
 
+        for vg in index.volume_groups:
+            if vg.volume_driver != 'vxvm':
+                continue
+            disks = index.get_vg_disks(vg)
+            pd_count = len(list(vg.physical_devices))
+
+            errors += self._validate_vg_disks(node, vg, disks, '19')
+            errors += self._validate_vg_pds(node, vg, pd_count, '33')
+            for fs in vg.file_systems:
+                errors += self._validate_fs_type(node, vg, fs, '20')
+                if pd_count:
+                    errors += self._validate_fs_layout(node, vg, fs,
+                                                       pd_count, '15')
+            if disks:
+                errors += self._validate_vg_size(node, vg, disks, '1.2')
+
         return errors
@@ -16,11 +16,40 @@ from litp.extensions.core_extension import CoreExtension
 from litp.core.plugin_context_api import PluginApiContext
 from litp.core.model_type import ItemType, Child
 from lvm_extension.lvm_extension import LvmExtension
-from volmgr_plugin.volmgr_utils import VolMgrUtils
-
+from volmgr_plugin.volmgr_utils import VolMgrUtils, Size
+from lvm_driver.lvm_driver import LvmDriver
+from volmgr_plugin.volmgr_index import ProfileIndex, NodeStorageIndex
+from volmgr_plugin.volmgr_pool import VolMgrPool
+from volmgr_plugin.volmgr_mount import MountOptions
+from volmgr_plugin.volmgr_logging import VolMgrLogger
+from volmgr_plugin.volmgr_drivers import VolMgrDriverRegistry
+from volmgr_plugin.volmgr_cache import VolMgrCache
+
+import logging
+import os
+import tempfile
 import unittest
 
 
+class _TraceHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self, logging.DEBUG)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class _TraceLogger(object):
+    def __init__(self, trace):
+        self.trace = trace
+
+
+class _Unprintable(object):
+    def __str__(self):
+        raise AssertionError("Formatted while debug disabled")
+
+
 class TestVolMgrPlugin(unittest.TestCase):
 
     def setUp(self):
@@ -49,6 +78,17 @@ class TestVolMgrPlugin(unittest.TestCase):
                                        '1.0.0',
                                        self.plugin)
 
+        self.trace = logging.getLogger('volmgr.test')
+        self.trace_level = self.trace.level
+        self.trace_handler = _TraceHandler()
+        self.trace.addHandler(self.trace_handler)
+        self.trace.propagate = False
+
+    def tearDown(self):
+        self.trace.removeHandler(self.trace_handler)
+        self.trace.setLevel(self.trace_level)
+        self.trace.propagate = True
+
     def _create_storage_profile_items(self, profile, system, data):
 
         if profile:
@@ -61,39 +101,47 @@ class TestVolMgrPlugin(unittest.TestCase):
                 else:
                     driver = 'lvm'
 
-                self.model_manager.create_item('volume-group',
+                rsp = self.model_manager.create_item('volume-group',
                                                vg_url,
                                                volume_group_name=vg['name'],
-                                               volume_driver=driver)
+                                               volume_driver=driver,
+                                               **vg.get('props', {}))
+                self.assertFalse(isinstance(rsp, list), rsp)
 
                 if 'FSs' in vg:
                     for fs in vg['FSs']:
                         fs_url = vg_url + '/file_systems/' + fs['id']
 #                       print "Creating FS " + fs_url
-                        self.model_manager.create_item('file-system',
+                        rsp = self.model_manager.create_item('file-system',
                                                        fs_url,
                                                        type=fs['type'],
                                                        mount_point=fs['mp'],
-                                                       size=fs['size'])
+                                                       size=fs['size'],
+                                                       **fs.get('props', {}))
+                        self.assertFalse(isinstance(rsp, list), rsp)
                 if 'PDs' in vg:
                     for pd in vg['PDs']:
                         pd_url = vg_url + '/physical_devices/' + pd['id']
 #                       print "Creating PD " + pd_url
-                        self.model_manager.create_item('physical-device',
+                        rsp = self.model_manager.create_item(
+                                                       'physical-device',
                                                        pd_url,
                                                        device_name=pd['device'])
+                        self.assertFalse(isinstance(rsp, list), rsp)
 
         if system:
             sys_url = system.get_vpath()
             for disk in data['disks']:
                 disk_url = sys_url + '/disks/' + disk['id']
 #               print "Creating Disk " + disk_url
-                self.model_manager.create_item('disk',
+                rsp = self.model_manager.create_item('disk',
                                                disk_url,
                                                bootable=disk['bootable'],
                                                uuid=disk['uuid'],
                                                name=disk['name'],
-                                               size=disk['size'])
+                                               size=disk['size'],
+                                               **disk.get('props', {}))
+                self.assertFalse(isinstance(rsp, list), rsp)
 
     def setup_model(self, link_node_to_system=True):
 
@@ -181,6 +229,47 @@ class TestVolMgrPlugin(unittest.TestCase):
         self.assertEquals(0, VolMgrUtils.get_size_megabytes('1F'))
         self.assertEquals(0, VolMgrUtils.get_size_megabytes('1'))
         self.assertEquals(0, VolMgrUtils.get_size_megabytes('G'))
+        self.assertEquals(1024 ** 3, VolMgrUtils.get_size_megabytes('1P'))
+        self.assertEquals(2, VolMgrUtils.get_size_megabytes('2048K'))
+        self.assertEquals([1024, 0, 4],
+                          VolMgrUtils.get_sizes_megabytes(['1G', '1F', '4M']))
+
+    def test_size(self):
+        self.assertEqual(Size.parse('2048M'), Size.parse('2G'))
+        self.assertEqual(None, Size.parse('1F'))
+        self.assertEqual(None, Size.parse(None))
+        self.assertEqual(3 * 1024, Size.parse('3M').kilobytes)
+        self.assertTrue(Size.parse('1M') < Size.parse('1G'))
+        self.assertEqual(Size.parse('12M'), Size.parse('4M') * 3)
+        self.assertEqual(Size.parse('1G'),
+                         Size.parse('1536M') - Size.parse('512M'))
+        self.assertTrue(Size.parse('12M').is_multiple_of(Size.parse('4M')))
+        self.assertFalse(Size.parse('6K').is_multiple_of(Size.parse('4M')))
+        self.assertEqual('1536M', str(Size.parse('1536M')))
+        self.assertEqual('1T', str(Size.parse('1024G')))
+        self.assertTrue(Size.parse('1G') is Size.parse('1G'))
+        self.assertEqual([Size.parse('1G'), None],
+                         Size.parse_all(['1G', 'G']))
+
+    def test_logger_defers_formatting(self):
+        self.trace.setLevel(logging.INFO)
+        log = VolMgrLogger(_TraceLogger(self.trace))
+        log.debug("Task: %s", _Unprintable())
+        log.debug_sampled('task', 1, "Task: %s", _Unprintable())
+        self.assertEqual([], self.trace_handler.messages)
+
+        self.trace.setLevel(logging.DEBUG)
+        log = VolMgrLogger(_TraceLogger(self.trace))
+        log.debug("VG:%s FS:%s", 'vg1', 'fs1')
+        for i in range(5):
+            log.debug_sampled('task', 2, "Task: %d", i)
+        summary = log.summary("Node '%s': %d tasks", 'n1')
+        summary.add()
+        summary.add(2)
+        summary.emit()
+        self.assertEqual(["VG:vg1 FS:fs1", "Task: 0", "Task: 2", "Task: 4",
+                          "Node 'n1': 3 tasks"],
+                         self.trace_handler.messages)
 
     def test_validate_model_01(self):
         self.setup_model()
@@ -387,18 +476,562 @@ class TestVolMgrPlugin(unittest.TestCase):
         self.assertEqual(1, len(errors))
 
 
+    def test_profile_index(self):
+        self.setup_model()
+
+        disk1_name = 'primary'
+        disk2_name = 'secondary'
+        storage_data = \
+        {'VGs': [{'id': 'vg1',
+                  'name': 'root_vg',
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/',     'size': '8G'},
+                          {'id': 'fs2', 'type': 'ext4', 'mp': '/home', 'size': '4G'}],
+                  'PDs': [{'id': 'pd1', 'device': disk1_name}]
+                 },
+                 {'id': 'vg2',
+                  'name': 'root_vg',    # Duplicate name
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/home', 'size': '4G'},
+                          {'id': 'fs2', 'type': 'ext4', 'mp': '/var',  'size': '4G'}],
+                  'PDs': [{'id': 'pd1', 'device': disk2_name}]
+                 }
+                ],
+         'disks': [{'id': 'disk1', 'bootable': 'true',  'uuid': 'ABCD_1234',
+                    'name': disk1_name, 'size': '40G'},
+                   {'id': 'disk2', 'bootable': 'false', 'uuid': 'ABCD_1235',
+                    'name': disk2_name, 'size': '40G'}
+                  ]
+        }
+
+        self._create_storage_profile_items(self.sp1,
+                                           self.system1,
+                                           storage_data)
+
+        node = self.context.query('node')[0]
+        profile = node.storage_profile
+        index = ProfileIndex(profile)
+
+        self.assertEqual(2, len(index.vgs_by_name['root_vg']))
+        self.assertEqual(2, len(index.fss_by_mount_point['/home']))
+        self.assertEqual(1, len(index.fss_by_mount_point['/var']))
+
+        vg_errors = self.plugin._validate_unique_vg_name(profile, '4', index)
+        fs_errors = self.plugin._validate_unique_fs_mountpoint(profile, '5',
+                                                               index)
+        self.assertEqual(2, len(vg_errors))
+        self.assertEqual(2, len(fs_errors))
+        self.assertEqual(sorted([e.item_path for e in fs_errors]),
+                         sorted([fs.get_vpath() \
+                                 for vg in profile.volume_groups \
+                                 for fs in vg.file_systems \
+                                 if fs.mount_point == '/home']))
+
+
+    def _link_second_node(self):
+        n2_url = '/deployments/d1/clusters/c1/nodes/n2'
+        self.model_manager.create_item('node', n2_url, hostname='node2')
+
+        s2_url = '/infrastructure/systems/s2'
+        self.system2 = self.model_manager.create_item('system',
+                                                      s2_url,
+                                                      system_name='MN2SYS')
+        self.model_manager.create_link('storage-profile',
+                                       n2_url + '/storage_profile',
+                                       storage_profile_name='storage_profile_1')
+        self.model_manager.create_link('system',
+                                       n2_url + '/system',
+                                       system_name='MN2SYS')
+
+    def test_validate_shared_profile_once(self):
+        self.setup_model()
+        self._link_second_node()
+
+        disk_name = 'primary'
+        storage_data = \
+        {'VGs': [{'id': 'vg1',
+                  'name': 'root_vg',
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/home', 'size': '10G'},
+                          # Duplicate Mount Point
+                          {'id': 'fs2', 'type': 'ext4', 'mp': '/home', 'size': '20G'}],
+                  'PDs': [{'id': 'pd1', 'device': disk_name}]
+                 }
+                ],
+         'disks': [{'id': 'disk1', 'bootable': 'true', 'uuid': 'ABCD_1234',
+                    'name': disk_name, 'size': '40G'}
+                  ]
+        }
+
+        self._create_storage_profile_items(self.sp1,
+                                           self.system1,
+                                           storage_data)
+        self._create_storage_profile_items(None,
+                                           self.system2,
+                                           storage_data)
+
+        # Profile errors are reported once, not once per Node, and
+        # each distinct Storage Profile is fingerprinted once
+        fingerprinted = []
+        get_profile_fingerprint = VolMgrUtils.get_profile_fingerprint
+
+        def _fingerprint(profile):
+            fingerprinted.append(profile.get_vpath())
+            return get_profile_fingerprint(profile)
+
+        VolMgrUtils.get_profile_fingerprint = staticmethod(_fingerprint)
+        try:
+            errors = self.plugin.validate_model(self.context)
+        finally:
+            VolMgrUtils.get_profile_fingerprint = \
+                                       staticmethod(get_profile_fingerprint)
+        self.assertEqual(2, len(errors))
+        self.assertEqual(1, len(self.plugin.profile_cache))
+        self.assertEqual(sorted(set(fingerprinted)), sorted(fingerprinted))
+
+        # A second pass is answered from the cache
+        errors = self.plugin.validate_model(self.context)
+        self.assertEqual(2, len(errors))
+        self.assertEqual(1, len(self.plugin.profile_cache))
+
+        # Changing a File System invalidates the cached result
+        fs_url = self.sp1.get_vpath() + '/volume_groups/vg1/file_systems/fs2'
+        self.model_manager.update_item(fs_url, mount_point='/var')
+        errors = self.plugin.validate_model(self.context)
+        self.assertEqual(0, len(errors))
+        self.assertEqual(2, len(self.plugin.profile_cache))
+
+
+    def test_node_storage_index(self):
+        self.setup_model()
+        self._create_dataset1()
+        self._create_dataset2()
+
+        node = self.context.query('node')[0]
+        index = NodeStorageIndex(node)
+
+        self.assertEqual(2, len(index.disks))
+        self.assertEqual(['primary', 'secondary'],
+                         sorted(index.disks_by_name.keys()))
+        self.assertEqual(1, len(index.get_boot_disks()))
+        self.assertEqual(5, len(index.file_systems))
+
+        for vg in index.volume_groups:
+            disk = index.get_vg_disk(vg)
+            pd = [pd for pd in vg.physical_devices][0]
+            self.assertEqual(pd.device_name, disk.name)
+            self.assertEqual(disk, index.get_pd_disk(pd))
+            self.assertEqual([pd], index.get_pd_refs(disk))
+            self.assertEqual(disk,
+                       self.plugin.lvm_driver._get_node_disk_for_pd(node, pd,
+                                                                    index))
+
+
+    def _set_storage_items_applied(self):
+        for item_type in ['system', 'disk', 'storage-profile',
+                          'volume-group', 'file-system', 'physical-device']:
+            for item in self.model_manager.query(item_type):
+                item.set_applied()
+
+    def test_validate_model_incremental(self):
+        self.setup_model()
+        self._create_dataset1()
+
+        validated = []
+        validate_node = self.plugin._validate_node
+
+        def _counting_validate_node(node, index, batch_errors=None):
+            validated.append(node.item_id)
+            return validate_node(node, index, batch_errors)
+
+        self.plugin._validate_node = _counting_validate_node
+
+        indexed = []
+        index_init = NodeStorageIndex.__init__
+
+        def _counting_index_init(index, node):
+            indexed.append(node.item_id)
+            index_init(index, node)
+
+        # Initial items are re-validated on every pass
+        self.assertEqual(0, len(self.plugin.validate_model(self.context)))
+        self.assertEqual(0, len(self.plugin.validate_model(self.context)))
+        self.assertEqual(2, len(validated))
+
+        # Applied, unchanged items reuse the previous result
+        self._set_storage_items_applied()
+        self.assertEqual(0, len(self.plugin.validate_model(self.context)))
+        NodeStorageIndex.__init__ = _counting_index_init
+        try:
+            self.assertEqual(0, len(self.plugin.validate_model(self.context)))
+        finally:
+            NodeStorageIndex.__init__ = index_init
+        self.assertEqual(3, len(validated))
+
+        # without indexing the Node again
+        self.assertEqual([], indexed)
+
+        # An Updated File System triggers re-validation of the Node
+        fs_url = self.sp1.get_vpath() + '/volume_groups/vg1/file_systems/fs3'
+        self.model_manager.update_item(fs_url, size='14337M')
+        errors = self.plugin.validate_model(self.context)
+        self.assertEqual(4, len(validated))
+        self.assertEqual(1, len(errors))
+
+        # Incremental mode can be switched off
+        VolMgrPlugin.INCREMENTAL_VALIDATION = False
+        try:
+            self.plugin.validate_model(self.context)
+            self.assertEqual(5, len(validated))
+        finally:
+            VolMgrPlugin.INCREMENTAL_VALIDATION = True
+
+
+    def test_grow_swap(self):
+        self.setup_model()
+        self._create_dataset1()
+        self._set_storage_items_applied()
+
+        fs_url = self.sp1.get_vpath() + '/volume_groups/vg1/file_systems/fs2'
+        self.model_manager.update_item(fs_url, size='3G')
+        self.assertEqual(0, len(self.plugin.validate_model(self.context)))
+
+        # Swap is not resized by lvextend -r, but re-made offline
+        tasks = self.plugin.create_configuration(self.context)
+        grow_task = tasks[0]
+        self.assertEqual('lvextend_root_vg_fs2', grow_task.call_id)
+        self.assertFalse('lvextend -r' in grow_task.kwargs['command'])
+        self.assertTrue(grow_task.description.startswith('Grow Swap offline'))
+
+        # Swap is only turned off if memory can take the pages in use
+        memory_check, command = \
+            grow_task.kwargs['command'].split(' && ', 1)
+        self.assertTrue(memory_check.startswith('awk '))
+        self.assertTrue(memory_check.endswith('/proc/swaps /proc/meminfo'))
+        self.assertEqual('swapoff /dev/root_vg/fs2 && ' + \
+                         'lvextend -L 3145728k /dev/root_vg/fs2 && ' + \
+                         'mkswap /dev/root_vg/fs2 && ' + \
+                         'swapon /dev/root_vg/fs2', command)
+        self.assertTrue('/proc/swaps' in grow_task.kwargs['unless'])
+
+    def test_volmgr_cache_lru(self):
+        cache = VolMgrCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))
+
+        # The least recently used entry is evicted
+        cache.put('c', 3)
+        self.assertEqual(2, len(cache))
+        self.assertFalse('b' in cache)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(None, cache.get('b'))
+
+        VolMgrCache(0).put('a', 1)
+
+    def test_grow_file_system(self):
+        self.setup_model()
+        self._create_dataset1()
+        self._set_storage_items_applied()
+
+        fs_url = self.sp1.get_vpath() + '/volume_groups/vg1/file_systems/fs3'
+        self.model_manager.update_item(fs_url, size='15G')
+        self.assertEqual(0, len(self.plugin.validate_model(self.context)))
+
+        # The Volume is grown online before the Volume Task runs
+        tasks = self.plugin.create_configuration(self.context)
+        self.assertEqual(['exec', 'lvm::volume', 'file', 'mount'],
+                         [task.call_type for task in tasks])
+        grow_task = tasks[0]
+        self.assertEqual('lvextend_root_vg_fs3', grow_task.call_id)
+        self.assertEqual('lvextend -r -L 15728640k /dev/root_vg/fs3',
+                         grow_task.kwargs['command'])
+        self.assertTrue(grow_task in tasks[1].requires)
+
+        # File Systems cannot shrink
+        self.model_manager.update_item(fs_url, size='12G')
+        errors = self.plugin.validate_model(self.context)
+        self.assertEqual(1, len(errors))
+        self.assertTrue('can only grow' in errors[0].error_message)
+
+        # nor grow beyond the free extents of the Volume Group
+        self.model_manager.update_item(fs_url, size='20G')
+        errors = self.plugin.validate_model(self.context)
+        self.assertEqual(1, len(errors))
+        self.assertEqual(fs_url, errors[0].item_path)
+        self.assertTrue("cannot grow from '14G' to '20G'" in
+                        errors[0].error_message)
+
+
+    def test_validate_model_pool_modes(self):
+        self.setup_model()
+        self._link_second_node()
+
+        disk_name = 'primary'
+        storage_data = \
+        {'VGs': [{'id': 'vg1',
+                  'name': 'root_vg',
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/', 'size': '11M'},
+                          {'id': 'fs2', 'type': 'ext4', 'mp': '/home', 'size': '30G'}],
+                  'PDs': [{'id': 'pd1', 'device': disk_name}]
+                 }
+                ],
+         'disks': [{'id': 'disk1', 'bootable': 'true', 'uuid': 'ABCD_1234',
+                    'name': disk_name, 'size': '20G'}
+                  ]
+        }
+
+        self._create_storage_profile_items(self.sp1,
+                                           self.system1,
+                                           storage_data)
+        self._create_storage_profile_items(None,
+                                           self.system2,
+                                           storage_data)
+
+        results = []
+        for mode in [VolMgrPool.SERIAL, VolMgrPool.THREAD]:
+            VolMgrPlugin.VALIDATION_POOL = mode
+            try:
+                errors = VolMgrPlugin().validate_model(self.context)
+            finally:
+                VolMgrPlugin.VALIDATION_POOL = VolMgrPool.THREAD
+            results.append([(e.item_path, e.error_message) for e in errors])
+
+        self.assertEqual(4, len(results[0]))
+        self.assertEqual(results[0], results[1])
+
+    def test_lvm_validate_nodes_batch(self):
+        self.setup_model()
+        self._link_second_node()
+
+        disk_name = 'primary'
+        storage_data = \
+        {'VGs': [{'id': 'vg1',
+                  'name': 'root_vg',
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/', 'size': '10G'},
+                          {'id': 'fs2', 'type': 'ext4', 'mp': '/home', 'size': '6M'}],
+                  'PDs': [{'id': 'pd1', 'device': disk_name}]
+                 }
+                ],
+         'disks': [{'id': 'disk1', 'bootable': 'true', 'uuid': 'ABCD_1234',
+                    'name': disk_name, 'size': '10G'}
+                  ]
+        }
+        self._create_storage_profile_items(self.sp1,
+                                           self.system1,
+                                           storage_data)
+
+        disk_data = {'VGs': [],
+                     'disks': [{'id': 'disk1', 'bootable': 'true',
+                                'uuid': 'ABCD_1236', 'name': disk_name,
+                                'size': '20G'}]}
+        self._create_storage_profile_items(None, self.system2, disk_data)
+
+        nodes = sorted(self.context.query('node'), key=lambda n: n.item_id)
+        driver = self.plugin.lvm_driver
+
+        batch = driver.validate_nodes(nodes)
+        self.assertEqual(2, len(batch))
+        for node, node_errors in zip(nodes, batch):
+            self.assertEqual([(e.item_path, e.error_message) \
+                              for e in driver.validate_node(node)],
+                             [(e.item_path, e.error_message) \
+                              for e in node_errors])
+
+        # n1: misaligned FS (rule 14) then disk overflow (rule 1.2)
+        self.assertEqual(2, len(batch[0]))
+        self.assertTrue(batch[0][0].item_path.endswith('/fs2'))
+        self.assertTrue(batch[0][1].item_path.endswith('/vg1'))
+        # n2: only the misaligned FS
+        self.assertEqual(1, len(batch[1]))
+
+    def test_lvm_capacity_extents(self):
+        self.setup_model()
+
+        storage_data = \
+        {'VGs': [{'id': 'vg1',
+                  'name': 'root_vg',
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/', 'size': '10G'},
+                          {'id': 'fs2', 'type': 'ext4', 'mp': '/home',
+                           'size': '5G'}],
+                  'PDs': [{'id': 'pd1', 'device': 'primary'}]
+                 },
+                 {'id': 'vg2',
+                  'name': 'app_vg',
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/opt',
+                           'size': '10G'}],
+                  'PDs': [{'id': 'pd1', 'device': 'secondary'}]
+                 }
+                ],
+         'disks': [{'id': 'disk1', 'bootable': 'true', 'uuid': 'ABCD_1234',
+                    'name': 'primary', 'size': '16G'},
+                   {'id': 'disk2', 'bootable': 'false', 'uuid': 'ABCD_1235',
+                    'name': 'secondary', 'size': '10G'}
+                  ]
+        }
+        self._create_storage_profile_items(self.sp1,
+                                           self.system1,
+                                           storage_data)
+
+        node = self.context.query('node')[0]
+        driver = self.plugin.lvm_driver
+        checker = driver._create_capacity_checker()
+        checker.add_node(node, NodeStorageIndex(node))
+
+        # 16G less the 1M aligned 500M boot partition, less pe_start
+        self.assertEqual([(16384 - 501 - 1) // 4, (10240 - 1) // 4],
+                         checker.vg_extents)
+        self.assertEqual([3840, 2560], checker.get_vg_used_extents())
+        self.assertEqual([(16384 - 502) // 4 - 3840, -1],
+                         checker.get_vg_headroom_extents())
+
+        errors = driver.validate_node(node)
+        self.assertEqual(1, len(errors))
+        self.assertTrue(errors[0].item_path.endswith('/vg2'))
+        self.assertTrue('2560 extents of 4M required, 2559 usable' in
+                        errors[0].error_message)
+
+    def test_driver_registry(self):
+        config_fd, config_file = tempfile.mkstemp(suffix='.conf')
+        try:
+            os.write(config_fd, b"[plugin]\nname=volmgr\n\n[drivers]\n" \
+                                b"other=volmgr_plugin.volmgr_cache.VolMgrCache\n"
+                                b"broken=no_such_module.Driver\n")
+            os.close(config_fd)
+
+            registry = VolMgrDriverRegistry(config_file)
+            self.assertEqual(['broken', 'lvm', 'other', 'vxvm'],
+                             registry.names())
+            self.assertFalse(registry.is_loaded('lvm'))
+
+            driver = registry.get('lvm')
+            self.assertTrue(isinstance(driver, LvmDriver))
+            self.assertTrue(driver is registry.get('lvm'))
+            self.assertFalse(registry.is_loaded('vxvm'))
+
+            self.assertTrue(registry.get('other') is not None)
+            self.assertEqual(None, registry.get('broken'))
+            self.assertTrue("cannot load 'no_such_module.Driver'" in
+                            registry.get_load_error('broken'))
+            self.assertEqual(None, registry.get('unknown'))
+            self.assertEqual("no Driver is registered",
+                             registry.get_load_error('unknown'))
+            self.assertEqual(None, registry.get_load_error('lvm'))
+        finally:
+            os.remove(config_file)
+
+    def test_validate_unknown_volume_driver(self):
+        self.setup_model()
+
+        storage_data = \
+        {'VGs': [{'id': 'vg1',
+                  'name': 'root_vg',
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/', 'size': '8G'}],
+                  'PDs': [{'id': 'pd1', 'device': 'primary'}]
+                 }
+                ],
+         'disks': [{'id': 'disk1', 'bootable': 'true', 'uuid': 'ABCD_1234',
+                    'name': 'primary', 'size': '20G'}
+                  ]
+        }
+        self._create_storage_profile_items(self.sp1,
+                                           self.system1,
+                                           storage_data)
+
+        self.plugin.drivers.register('lvm', 'no_such_module.LvmDriver')
+        errors = self.plugin.validate_model(self.context)
+        self.assertEqual(1, len(errors))
+        self.assertTrue(errors[0].item_path.endswith('/vg1'))
+        # The load failure is reported with the error
+        self.assertTrue("'no_such_module.LvmDriver'" in
+                        errors[0].error_message)
+        self.assertTrue('No module named' in errors[0].error_message)
+        self.assertEqual([], self.plugin.create_configuration(self.context))
+
+    def test_pool_preserves_order(self):
+        items = range(20)
+        for mode in [VolMgrPool.SERIAL, VolMgrPool.THREAD]:
+            pool = VolMgrPool(mode, 4)
+            self.assertEqual([i * 2 for i in items],
+                             pool.map(lambda i: i * 2, items))
+        self.assertRaises(ValueError, VolMgrPool, 'fibre', 4)
+        self.assertRaises(ValueError, VolMgrPool, 'process', 4)
+
+
     def test_create_configuration_01(self):
         self.setup_model()
         self._create_dataset1()
         tasks = self.plugin.create_configuration(self.context)
-        self.assertEqual(3, len(tasks))
+        self.assertEqual(5, len(tasks))
+
+        # The Mount depends on the Volume and the Mount Directory only
+        volume_task, file_task, mount_task = tasks[2:]
+        self.assertEqual(['lvm::volume', 'file', 'mount'],
+                         [task.call_type for task in tasks[2:]])
+        self.assertEqual(set([volume_task, file_task]), mount_task.requires)
+        self.assertEqual(set(), file_task.requires)
+        self.assertEqual(set(), volume_task.requires)
 
     def test_create_configuration_02(self):
         self.setup_model()
         self._create_dataset1()
         self._create_dataset2()
         tasks = self.plugin.create_configuration(self.context)
-        self.assertEqual(3, len(tasks))
+        # The root VG first, then app_vg on its own disk
+        self.assertEqual(11, len(tasks))
+        root_tasks, app_tasks = tasks[:5], tasks[5:]
+        self.assertEqual(['fs1', 'fs2', 'fs3'],
+                         [task.call_id for task in root_tasks[:3]])
+        self.assertEqual(['lvm::volume', 'file', 'mount'] * 2,
+                         [task.call_type for task in app_tasks])
+        self.assertEqual('$::disk_scsi_3ABCD_1235_dev',
+                         app_tasks[0].kwargs['pv'])
+        # LVs outside the root VG are named after their VG item too
+        self.assertEqual(['vg2_fs1', 'vg2_fs2'],
+                         [task.call_id for task in app_tasks \
+                          if task.call_type == 'lvm::volume'])
+        self.assertEqual('/dev/app_vg/vg2_fs1',
+                         app_tasks[2].kwargs['device'])
+        for task in app_tasks:
+            self.assertFalse(task.requires & set(root_tasks))
+
+    def test_create_configuration_nested_mounts(self):
+        self.setup_model()
+
+        storage_data = \
+        {'VGs': [{'id': 'vg1',
+                  'name': 'root_vg',
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/', 'size': '8G'},
+                          {'id': 'fs2', 'type': 'ext4', 'mp': '/var',
+                           'size': '4G'}],
+                  'PDs': [{'id': 'pd1', 'device': 'primary'}]
+                 },
+                 {'id': 'vg2',
+                  'name': 'data_vg',
+                  'FSs': [{'id': 'fs1', 'type': 'ext4',
+                           'mp': '/var/lib/data', 'size': '8G'}],
+                  'PDs': [{'id': 'pd1', 'device': 'primary'}]
+                 }
+                ],
+         'disks': [{'id': 'disk1', 'bootable': 'true', 'uuid': 'ABCD_1234',
+                    'name': 'primary', 'size': '40G'}
+                  ]
+        }
+        self._create_storage_profile_items(self.sp1,
+                                           self.system1,
+                                           storage_data)
+
+        tasks = self.plugin.create_configuration(self.context)
+        mounts = dict((task.call_id, task) for task in tasks \
+                      if task.call_type == 'mount')
+        directories = dict((task.call_id, task) for task in tasks \
+                           if task.call_type == 'file')
+        self.assertTrue(mounts['/var'] in
+                        directories['/var/lib/data'].requires)
+        self.assertEqual(set(), directories['/var'].requires)
+
+        # Both VGs on the bootable disk: rules 12 and 22
+        errors = self.plugin.validate_model(self.context)
+        self.assertEqual(2, len(errors))
+        self.assertTrue(errors[1].item_path.endswith('/vg2/physical_devices/pd1'))
 
     def test_create_configuration_03(self):
         self.setup_model()
@@ -432,21 +1065,613 @@ class TestVolMgrPlugin(unittest.TestCase):
         # No linked System, so no Tasks exoected
         self.assertEqual(0, len(tasks))
 
-    def test_create_configuration_05(self):
+    def test_create_configuration_vg_without_disks(self):
         self.setup_model()
+        self._create_dataset1()
 
-        disk_name = 'primary'
+        storage_data = \
+        {'VGs': [{'id': 'vg2',
+                  'name': 'app_vg',
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/app',
+                           'size': '1G'}]
+                 },
+                 {'id': 'vg3',
+                  'name': 'data_vg',
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/data',
+                           'size': '1G'}],
+                  'PDs': [{'id': 'pd1', 'device': 'missing'}]
+                 }
+                ],
+         'disks': []
+        }
+        self._create_storage_profile_items(self.sp1,
+                                           self.system1,
+                                           storage_data)
+
+        # The File Systems of a VG without Physical Devices are
+        # not laid out in stripes over them
+        errors = self.plugin.validate_model(self.context)
+        self.assertFalse([error for error in errors \
+                          if 'stripes' in error.error_message])
+
+        # A VG without Physical Devices, or with one lacking a
+        # System Disk, gets no Tasks
+        tasks = self.plugin.create_configuration(self.context)
+        self.assertEqual(['fs1', 'fs2', 'fs3', '/home', '/home'],
+                         [task.call_id for task in tasks])
+
+    def test_create_configuration_pool_modes(self):
+        self.setup_model()
+        self._link_second_node()
+        self._create_dataset1()
+
+        disk_data = {'VGs': [],
+                     'disks': [{'id': 'disk1', 'bootable': 'true',
+                                'uuid': 'ABCD_1236', 'name': 'primary',
+                                'size': '28G'}]}
+        self._create_storage_profile_items(None, self.system2, disk_data)
+
+        results = []
+        for mode in [VolMgrPool.SERIAL, VolMgrPool.THREAD]:
+            VolMgrPlugin.TASK_POOL = mode
+            try:
+                tasks = self.plugin.create_configuration(self.context)
+            finally:
+                VolMgrPlugin.TASK_POOL = VolMgrPool.THREAD
+            results.append([str(task) for task in tasks])
+
+        self.assertEqual(10, len(results[0]))
+        self.assertEqual(results[0], results[1])
+
+        # Serially, the Nodes are consumed one at a time
+        consumed = []
+
+        def _nodes():
+            for node in self.context.query('node'):
+                consumed.append(node.item_id)
+                yield node
+
+        VolMgrPlugin.TASK_POOL = VolMgrPool.SERIAL
+        try:
+            tasks = self.plugin._iter_tasks(_nodes())
+            next(tasks)
+            self.assertEqual(1, len(consumed))
+            self.assertEqual(10, len(list(tasks)) + 1)
+        finally:
+            VolMgrPlugin.TASK_POOL = VolMgrPool.THREAD
+
+    def test_create_configuration_templates_shared(self):
+        self.setup_model()
+        self._link_second_node()
+        self._create_dataset1()
+
+        disk_data = {'VGs': [],
+                     'disks': [{'id': 'disk1', 'bootable': 'false',
+                                'uuid': 'ABCD_1236', 'name': 'primary',
+                                'size': '28G'}]}
+        self._create_storage_profile_items(None, self.system2, disk_data)
+
+        VolMgrPlugin.TASK_POOL = VolMgrPool.SERIAL
+        try:
+            tasks = self.plugin.create_configuration(self.context)
+        finally:
+            VolMgrPlugin.TASK_POOL = VolMgrPool.THREAD
+
+        self.assertEqual(10, len(tasks))
+        self.assertEqual(1, len(self.plugin.lvm_driver.template_cache))
+
+        # Only the Node identity and Physical Volume differ per Node
+        self.assertEqual('$::disk_scsi_3ABCD_1234_part2_dev',
+                         tasks[0].kwargs['pv'])
+        self.assertEqual('$::disk_scsi_3ABCD_1236_dev',
+                         tasks[5].kwargs['pv'])
+        self.assertEqual("Volume: fs1::vg1::pd1::n2", tasks[5].description)
+        self.assertEqual(tasks[0].kwargs['size'], tasks[5].kwargs['size'])
+
+    def test_create_configuration_batched_volumes(self):
+        self.setup_model()
+        self._create_dataset1()
+
+        LvmDriver.BATCH_VOLUMES = True
+        try:
+            tasks = self.plugin.create_configuration(self.context)
+        finally:
+            LvmDriver.BATCH_VOLUMES = False
+
+        # The Volume Group, then the /home mount directory and mount
+        self.assertEqual(3, len(tasks))
+        vg_task, file_task, mount_task = tasks
+        self.assertEqual('lvm::volume_group', vg_task.call_type)
+        self.assertEqual('root_vg', vg_task.call_id)
+        self.assertEqual({'fs1': {'size': '10G', 'fstype': 'ext4'},
+                          'fs2': {'size': '2G', 'fstype': 'swap'},
+                          'fs3': {'size': '14G', 'fstype': 'ext4'}},
+                         vg_task.kwargs['volumes'])
+        self.assertEqual(['file', 'mount'],
+                         [task.call_type for task in tasks[1:]])
+        self.assertEqual(set([vg_task, file_task]), mount_task.requires)
+
+    def test_create_configuration_striped(self):
+        self.setup_model()
+
+        storage_data = \
+        {'VGs': [{'id': 'vg1',
+                  'name': 'root_vg',
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/', 'size': '8G',
+                           'props': {'stripes': '2', 'stripe_size': '64K'}},
+                          {'id': 'fs2', 'type': 'ext4', 'mp': '/home',
+                           'size': '8M', 'props': {'stripes': '3'}},
+                          {'id': 'fs3', 'type': 'xfs', 'mp': '/data',
+                           'size': '1G',
+                           'props': {'stripes': '2', 'stripe_size': '128K'}}],
+                  'PDs': [{'id': 'pd1', 'device': 'primary'},
+                          {'id': 'pd2', 'device': 'secondary'}]
+                 }
+                ],
+         'disks': [{'id': 'disk1', 'bootable': 'true', 'uuid': 'ABCD_1234',
+                    'name': 'primary', 'size': '10G'},
+                   {'id': 'disk2', 'bootable': 'false', 'uuid': 'ABCD_1235',
+                    'name': 'secondary', 'size': '10G'}
+                  ]
+        }
+        self._create_storage_profile_items(self.sp1,
+                                           self.system1,
+                                           storage_data)
+
+        errors = self.plugin.validate_model(self.context)
+        self.assertEqual(1, len(errors))
+        self.assertTrue(errors[0].item_path.endswith('/fs2'))
+        self.assertTrue('stripes' in errors[0].error_message)
+
+        tasks = self.plugin.create_configuration(self.context)
+        volume_task = tasks[0]
+        self.assertEqual(['$::disk_scsi_3ABCD_1234_part2_dev',
+                          '$::disk_scsi_3ABCD_1235_dev'],
+                         volume_task.kwargs['pv'])
+        self.assertEqual('2', volume_task.kwargs['stripes'])
+        self.assertEqual('64K', volume_task.kwargs['stripesize'])
+        self.assertEqual('-b 4096 -E stride=16,stripe_width=32',
+                         volume_task.kwargs['mkfs_options'])
+
+        xfs_task = [task for task in tasks if task.call_id == 'fs3'][0]
+        self.assertEqual('-d su=128k,sw=2', xfs_task.kwargs['mkfs_options'])
+
+    def test_create_configuration_cached(self):
+        self.setup_model()
+
+        storage_data = \
+        {'VGs': [{'id': 'vg1',
+                  'name': 'root_vg',
+                  'props': {'cache_device': 'ssd'},
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/', 'size': '8G'},
+                          {'id': 'fs2', 'type': 'ext4', 'mp': '/data',
+                           'size': '20G',
+                           'props': {'cache_size': '4G',
+                                     'cache_policy': 'writeback'}}],
+                  'PDs': [{'id': 'pd1', 'device': 'primary'}]
+                 }
+                ],
+         'disks': [{'id': 'disk1', 'bootable': 'true', 'uuid': 'ABCD_1234',
+                    'name': 'primary', 'size': '40G'},
+                   {'id': 'disk2', 'bootable': 'false', 'uuid': 'ABCD_1235',
+                    'name': 'ssd', 'size': '5G'}
+                  ]
+        }
+        self._create_storage_profile_items(self.sp1,
+                                           self.system1,
+                                           storage_data)
+
+        self.assertEqual(0, len(self.plugin.validate_model(self.context)))
+
+        # The cache pool is built on the SSD once it joins the VG,
+        # and attached to the Volume once that exists
+        tasks = self.plugin.create_configuration(self.context)
+        cache_tasks = tasks[-5:]
+        self.assertEqual(['vgextend_root_vg_cache',
+                          'pvchange_root_vg_cache',
+                          'lvcreate_root_vg_fs2_cache',
+                          'lvconvert_root_vg_fs2_cache',
+                          'lvchange_root_vg_fs2_cachemode'],
+                         [task.call_id for task in cache_tasks])
+        self.assertEqual('vgextend root_vg $::disk_scsi_3ABCD_1235_dev',
+                         cache_tasks[0].kwargs['command'])
+        for i in range(1, 5):
+            self.assertTrue(cache_tasks[i - 1] in cache_tasks[i].requires)
+        volume_task = [task for task in tasks \
+                       if task.call_type == 'lvm::volume' and \
+                          task.call_id == 'fs2'][0]
+        self.assertTrue(volume_task in cache_tasks[3].requires)
+
+        # Nothing but the cache pool is ever allocated on the SSD
+        self.assertEqual('pvchange -x n $::disk_scsi_3ABCD_1235_dev',
+                         cache_tasks[1].kwargs['command'])
+        self.assertTrue(cache_tasks[2].kwargs['command'].startswith(
+                        'pvchange -x y $::disk_scsi_3ABCD_1235_dev && '))
+        self.assertTrue(cache_tasks[2].kwargs['command'].endswith(
+                        'pvchange -x n $::disk_scsi_3ABCD_1235_dev && exit $rc'))
+
+        # Attaching and changing the cache mode are guarded separately
+        self.assertEqual('lvconvert -y --type cache --cachepool ' + \
+                         'root_vg/fs2_cache --cachemode writeback root_vg/fs2',
+                         cache_tasks[3].kwargs['command'])
+        self.assertEqual('lvchange -y --cachemode writeback root_vg/fs2',
+                         cache_tasks[4].kwargs['command'])
+        self.assertFalse('lvchange' in cache_tasks[3].kwargs['command'])
+
+        # A larger cache no longer fits on the SSD
+        fs_url = self.sp1.get_vpath() + '/volume_groups/vg1/file_systems/fs2'
+        self.model_manager.update_item(fs_url, cache_size='5G')
+        errors = self.plugin.validate_model(self.context)
+        self.assertEqual(1, len(errors))
+        self.assertTrue(errors[0].item_path.endswith('/vg1'))
+        self.assertTrue('File System caches' in errors[0].error_message)
+
+        # Nor can the cache device be the bootable System Disk
+        vg_url = self.sp1.get_vpath() + '/volume_groups/vg1'
+        self.model_manager.update_item(fs_url, cache_size='1G')
+        self.model_manager.update_item(vg_url, cache_device='primary')
+        errors = self.plugin.validate_model(self.context)
+        self.assertEqual(1, len(errors))
+        self.assertTrue('bootable' in errors[0].error_message)
+
+    def _create_thin_dataset(self):
+        storage_data = \
+        {'VGs': [{'id': 'vg1',
+                  'name': 'root_vg',
+                  'props': {'thin_pool_size': '10G'},
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/', 'size': '8G',
+                           'props': {'snap_size': '50'}},
+                          {'id': 'fs2', 'type': 'ext4', 'mp': '/data',
+                           'size': '8G', 'props': {'thin': 'true'}},
+                          {'id': 'fs3', 'type': 'ext4', 'mp': '/logs',
+                           'size': '4G', 'props': {'thin': 'true'}}],
+                  'PDs': [{'id': 'pd1', 'device': 'primary'}]
+                 }
+                ],
+         'disks': [{'id': 'disk1', 'bootable': 'true', 'uuid': 'ABCD_1234',
+                    'name': 'primary', 'size': '40G'}
+                  ]
+        }
+        self._create_storage_profile_items(self.sp1,
+                                           self.system1,
+                                           storage_data)
+
+    def test_create_configuration_thin(self):
+        self.setup_model()
+        self._create_thin_dataset()
+
+        # 12G of thin File Systems overcommit a 10G pool
+        errors = self.plugin.validate_model(self.context)
+        self.assertEqual(1, len(errors))
+        self.assertTrue('overcommit' in errors[0].error_message)
+
+        vg_url = self.sp1.get_vpath() + '/volume_groups/vg1'
+        self.model_manager.update_item(vg_url, overcommit_ratio='1.5')
+        self.assertEqual(0, len(self.plugin.validate_model(self.context)))
+
+        tasks = self.plugin.create_configuration(self.context)
+        call_ids = [task.call_id for task in tasks]
+        self.assertEqual(['fs1', 'vgcreate_root_vg',
+                          'lvcreate_root_vg_thin_pool',
+                          'lvcreate_root_vg_fs2', 'mkfs_root_vg_fs2',
+                          '/data', '/data',
+                          'lvcreate_root_vg_fs3', 'mkfs_root_vg_fs3',
+                          '/logs', '/logs'], call_ids)
+        self.assertEqual('lvcreate -y --thin -V 8388608k -n fs2 ' + \
+                         'root_vg/thin_pool', tasks[3].kwargs['command'])
+        self.assertTrue(tasks[2] in tasks[3].requires)
+        # The Mount waits for the File System on the thin Volume
+        self.assertTrue(tasks[4] in tasks[6].requires)
+
+        # Neither '/' nor swap can be thin
+        fs_url = vg_url + '/file_systems/fs1'
+        self.model_manager.update_item(fs_url, thin='true')
+        errors = self.plugin.validate_model(self.context)
+        self.assertTrue(fs_url in [error.item_path for error in errors])
+
+    def test_create_snapshot_plan(self):
+        import volmgr_plugin.volmgr_plugin as volmgr_plugin_module
+
+        self.setup_model()
+        self._create_thin_dataset()
+        self._set_storage_items_applied()
+
+        calls = []
+        results = {'status': 0}
+
+        def _run_rpc_command(nodes, agent, action, arguments):
+            calls.append((nodes, agent, action, arguments))
+            return dict((node, {'errors': '', 'data': dict(results)}) \
+                        for node in nodes)
+
+        run_rpc_command = volmgr_plugin_module.run_rpc_command
+        volmgr_plugin_module.run_rpc_command = _run_rpc_command
+        try:
+            self.context.snapshot_action = lambda: 'create'
+            tasks = self.plugin.create_snapshot_plan(self.context)
+            self.assertEqual(3, len(tasks))
+            for task in tasks:
+                task.callback(None, *task.args, **task.kwargs)
+            # A thick File System reserves snap_size percent of its size
+            self.assertEqual((['node1'], 'lv', 'create_snapshot',
+                              {'vg': 'root_vg', 'lv': 'fs1',
+                               'name': 'fs1_snapshot', 'size': '4194304k'}),
+                             calls[0])
+            self.assertFalse('size' in calls[1][3])
+
+            # Restoring merges the snapshots back
+            self.context.snapshot_action = lambda: 'restore'
+            tasks = self.plugin.create_snapshot_plan(self.context)
+            self.assertEqual(['merge_snapshot'] * 3,
+                             [task.args[1] for task in tasks])
+
+            # A failed agent action fails the Task
+            results.update(status=1, err='Snapshot does not exist')
+            try:
+                tasks[0].callback(None, *tasks[0].args, **tasks[0].kwargs)
+                self.fail('CallbackExecutionException not raised')
+            except volmgr_plugin_module.CallbackExecutionException as e:
+                self.assertTrue('Snapshot does not exist' in str(e))
+        finally:
+            volmgr_plugin_module.run_rpc_command = run_rpc_command
+
+    def test_block_tuning(self):
+        self.setup_model()
+
+        storage_data = \
+        {'VGs': [{'id': 'vg1',
+                  'name': 'root_vg',
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/', 'size': '8G'},
+                          {'id': 'fs2', 'type': 'ext4', 'mp': '/db',
+                           'size': '8G', 'props': {'readahead_kb': '1024'}}],
+                  'PDs': [{'id': 'pd1', 'device': 'primary'}]
+                 }
+                ],
+         'disks': [{'id': 'disk1', 'bootable': 'true', 'uuid': 'ABCD_1234',
+                    'name': 'primary', 'size': '40G',
+                    'props': {'io_scheduler': 'deadline',
+                              'nr_requests': '256'}}
+                  ]
+        }
+        self._create_storage_profile_items(self.sp1,
+                                           self.system1,
+                                           storage_data)
+
+        self.assertEqual(0, len(self.plugin.validate_model(self.context)))
+
+        tasks = self.plugin.create_configuration(self.context)
+        tasks = dict((task.call_id, task) for task in tasks)
+
+        # Read ahead is set in 512 byte sectors, once the Volume exists
+        readahead_task = tasks['lvchange_root_vg_fs2_readahead']
+        self.assertEqual('lvchange -y -r 2048 root_vg/fs2',
+                         readahead_task.kwargs['command'])
+        self.assertTrue(tasks['fs2'] in readahead_task.requires)
+
+        # The whole bootable Disk is tuned by a persistent udev rule
+        rule_file = '/etc/udev/rules.d/99-litp-ABCD_1234.rules'
+        self.assertTrue('ATTR{queue/scheduler}="deadline", ' + \
+                        'ATTR{queue/nr_requests}="256"' in
+                        tasks[rule_file].kwargs['content'])
+        self.assertTrue(tasks[rule_file] in
+                        tasks['udev_tune_ABCD_1234'].requires)
+        self.assertTrue('$::disk_scsi_3ABCD_1234_dev' in
+                        tasks['udev_tune_ABCD_1234'].kwargs['command'])
+
+        disk_url = self.system1.get_vpath() + '/disks/disk1'
+        self.model_manager.update_item(disk_url, io_scheduler='fifo')
+        fs_url = self.sp1.get_vpath() + '/volume_groups/vg1/file_systems/fs2'
+        self.model_manager.update_item(fs_url, readahead_kb='131072')
+        errors = self.plugin.validate_model(self.context)
+        self.assertEqual(sorted([disk_url, fs_url]),
+                         sorted([error.item_path for error in errors]))
+
+    def test_xfs_and_tmpfs(self):
+        self.setup_model()
+
+        storage_data = \
+        {'VGs': [{'id': 'vg1',
+                  'name': 'root_vg',
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/', 'size': '8G'},
+                          {'id': 'fs2', 'type': 'xfs', 'mp': '/data',
+                           'size': '8G',
+                           'props': {'mount_options': 'throughput'}},
+                          {'id': 'fs3', 'type': 'tmpfs', 'mp': '/scratch',
+                           'size': '64G',
+                           'props': {'mount_options': 'latency'}}],
+                  'PDs': [{'id': 'pd1', 'device': 'primary'}]
+                 }
+                ],
+         'disks': [{'id': 'disk1', 'bootable': 'true', 'uuid': 'ABCD_1234',
+                    'name': 'primary', 'size': '20G'}
+                  ]
+        }
+        self._create_storage_profile_items(self.sp1,
+                                           self.system1,
+                                           storage_data)
+
+        # The tmpfs takes no space on the Disk
+        self.assertEqual(0, len(self.plugin.validate_model(self.context)))
+
+        tasks = self.plugin.create_configuration(self.context)
+        tasks = dict((task.call_id, task) for task in tasks)
+
+        self.assertEqual('xfs', tasks['fs2'].kwargs['fstype'])
+        # mkfs.xfs defaults apply to an unstriped Volume
+        self.assertFalse('mkfs_options' in tasks['fs2'].kwargs)
+        self.assertEqual('xfs', tasks['/data'].kwargs['fstype'])
+        self.assertEqual('noatime,nodiratime,inode64,largeio,allocsize=64m',
+                         tasks['/data'].kwargs['options'])
+
+        # The tmpfs is mounted only, capped at its size
+        self.assertFalse('fs3' in tasks)
+        self.assertEqual('tmpfs', tasks['/scratch'].kwargs['device'])
+        self.assertEqual('size=64G,noatime,nodiratime',
+                         tasks['/scratch'].kwargs['options'])
+
+        fs_url = self.sp1.get_vpath() + '/volume_groups/vg1/file_systems/fs3'
+        self.model_manager.update_item(fs_url, stripes='2')
+        errors = self.plugin.validate_model(self.context)
+        self.assertEqual([fs_url], [error.item_path for error in errors])
+
+    def test_mount_options(self):
+        self.setup_model()
+
+        storage_data = \
+        {'VGs': [{'id': 'vg1',
+                  'name': 'root_vg',
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/', 'size': '8G'},
+                          {'id': 'fs2', 'type': 'ext4', 'mp': '/data',
+                           'size': '4G',
+                           'props': {'mount_options': 'ssd,commit=30'}},
+                          {'id': 'fs3', 'type': 'ext4', 'mp': '/logs',
+                           'size': '1G',
+                           'props': {'mount_options': 'throughput,data=fast'}},
+                          {'id': 'fs4', 'type': 'swap', 'mp': 'swap',
+                           'size': '1G',
+                           'props': {'mount_options': 'latency'}}],
+                  'PDs': [{'id': 'pd1', 'device': 'primary'}]
+                 }
+                ],
+         'disks': [{'id': 'disk1', 'bootable': 'true', 'uuid': 'ABCD_1234',
+                    'name': 'primary', 'size': '20G'}
+                  ]
+        }
+        self._create_storage_profile_items(self.sp1,
+                                           self.system1,
+                                           storage_data)
+
+        errors = self.plugin.validate_model(self.context)
+        self.assertEqual(['fs3', 'fs4'],
+                         sorted([e.item_path.split('/')[-1] for e in errors]))
+
+        self.assertEqual(['noatime', 'nodiratime', 'discard', 'commit=30'],
+                         MountOptions.expand('ssd,commit=30'))
+        self.assertEqual(['data=fast'],
+                         MountOptions.get_unsupported('ext4',
+                                                 'throughput,data=fast'))
+
+        tasks = self.plugin.create_configuration(self.context)
+        mounts = dict((task.call_id, task.kwargs['options']) \
+                      for task in tasks if task.call_type == 'mount')
+        self.assertEqual('noatime,nodiratime,discard,commit=30',
+                         mounts['/data'])
+
+    def test_mkfs_options(self):
+        self.setup_model()
+
+        storage_data = \
+        {'VGs': [{'id': 'vg1',
+                  'name': 'root_vg',
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/', 'size': '8G',
+                           'props': {'inode_ratio': 'largefile'}},
+                          {'id': 'fs2', 'type': 'ext4', 'mp': '/data',
+                           'size': '4G',
+                           'props': {'mkfs_options': '-m 0'}},
+                          {'id': 'fs3', 'type': 'ext4', 'mp': '/logs',
+                           'size': '1G', 'props': {'inode_ratio': '512'}},
+                          {'id': 'fs4', 'type': 'ext4', 'mp': '/opt',
+                           'size': '1G'}],
+                  'PDs': [{'id': 'pd1', 'device': 'primary'}]
+                 }
+                ],
+         'disks': [{'id': 'disk1', 'bootable': 'true', 'uuid': 'ABCD_1234',
+                    'name': 'primary', 'size': '20G'}
+                  ]
+        }
+        self._create_storage_profile_items(self.sp1,
+                                           self.system1,
+                                           storage_data)
+
+        errors = self.plugin.validate_model(self.context)
+        self.assertEqual(1, len(errors))
+        self.assertTrue(errors[0].item_path.endswith('/fs3'))
+
+        tasks = self.plugin.create_configuration(self.context)
+        volumes = dict((task.call_id, task.kwargs.get('mkfs_options')) \
+                       for task in tasks if task.call_type == 'lvm::volume')
+        self.assertEqual('-T largefile', volumes['fs1'])
+        self.assertEqual('-m 0', volumes['fs2'])
+
+        # mkfs defaults apply without stripes, inode_ratio or mkfs_options
+        self.assertEqual(None, volumes['fs4'])
+
+        # mkfs_options reach the Node command line, so only the
+        # options of mkfs for the File System type are accepted
+        fs_url = self.sp1.get_vpath() + '/volume_groups/vg1/file_systems/fs2'
+        for mkfs_options in ('-m 0; reboot', '-m $(reboot)', '-d su=64k',
+                             '-m', '--force'):
+            self.model_manager.update_item(fs_url, mkfs_options=mkfs_options)
+            errors = self.plugin.validate_model(self.context)
+            self.assertEqual(2, len(errors), mkfs_options)
+            self.assertTrue(fs_url in [error.item_path for error in errors])
+
+        self.model_manager.update_item(fs_url,
+                                       mkfs_options='-F -m 1 -E nodiscard')
+        self.assertEqual(1, len(self.plugin.validate_model(self.context)))
+
+    def test_vg_pe_size(self):
+        self.setup_model()
+
+        storage_data = \
+        {'VGs': [{'id': 'vg1',
+                  'name': 'root_vg',
+                  'props': {'pe_size': '32M'},
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/', 'size': '8G'},
+                          {'id': 'fs2', 'type': 'ext4', 'mp': '/data',
+                           'size': '100M'}],
+                  'PDs': [{'id': 'pd1', 'device': 'primary'}]
+                 },
+                 {'id': 'vg2',
+                  'name': 'app_vg',
+                  'props': {'pe_size': '3M'},
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/opt',
+                           'size': '9M'}],
+                  'PDs': [{'id': 'pd1', 'device': 'secondary'}]
+                 }
+                ],
+         'disks': [{'id': 'disk1', 'bootable': 'true', 'uuid': 'ABCD_1234',
+                    'name': 'primary', 'size': '20G'},
+                   {'id': 'disk2', 'bootable': 'false', 'uuid': 'ABCD_1235',
+                    'name': 'secondary', 'size': '1G'}
+                  ]
+        }
+        self._create_storage_profile_items(self.sp1,
+                                           self.system1,
+                                           storage_data)
+
+        errors = dict((e.item_path.split('storage_profiles/sp1/')[1],
+                       e.error_message) \
+                      for e in self.plugin.validate_model(self.context))
+        self.assertEqual(["volume_groups/vg1/file_systems/fs2",
+                          "volume_groups/vg2"], sorted(errors))
+        self.assertTrue("size ('32')" in
+                        errors["volume_groups/vg1/file_systems/fs2"])
+
+        tasks = self.plugin.create_configuration(self.context)
+        self.assertEqual('32M', tasks[0].kwargs['pe_size'])
+
+    def test_create_configuration_05(self):
+        self.setup_model()
 
         storage_data = \
         {'VGs': [{'id': 'vg1',
                   'name': 'root_vg',
                   'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/', 'size': '10G'}],
-                  'PDs': [{'id': 'pd1', 'device': disk_name}],
+                  'PDs': [{'id': 'pd1', 'device': 'primary'}]
+                 },
+                 {'id': 'vg2',
+                  'name': 'data_dg',
+                  'FSs': [{'id': 'fs1', 'type': 'vxfs', 'mp': '/data',
+                           'size': '10G'}],
+                  'PDs': [{'id': 'pd1', 'device': 'secondary'}],
                   'volume_driver': 'vxvm'
                  }
                 ],
          'disks': [{'id': 'disk1', 'bootable': 'true', 'uuid': 'ABCD_1234',
-                    'name': disk_name, 'size': '15G'}
+                    'name': 'primary', 'size': '15G'},
+                   {'id': 'disk2', 'bootable': 'false', 'uuid': 'ABCD_1235',
+                    'name': 'secondary', 'size': '15G'}
                   ]
         }
 
@@ -454,6 +1679,127 @@ class TestVolMgrPlugin(unittest.TestCase):
                                            self.system1,
                                            storage_data)
 
+        self.assertEqual(0, len(self.plugin.validate_model(self.context)))
+
         tasks = self.plugin.create_configuration(self.context)
-        # No Tasks expected for VxVm VGs
-        self.assertEqual(0, len(tasks))
+        # The root Volume, then the VxVM naming scheme, Disk setup,
+        # Disk Group, Volume, VxFS, Mount Directory and Mount
+        self.assertEqual(['fs1', 'vxddladm_namingscheme_data_dg',
+                          'vxdisksetup_ABCD_1235', 'vxdg_init_data_dg',
+                          'vxassist_data_dg_fs1', 'mkfs_vxfs_data_dg_fs1',
+                          '/data', '/data'],
+                         [task.call_id for task in tasks])
+        scheme_task, disk_task, dg_task, volume_task, mkfs_task, \
+            file_task, mount_task = tasks[1:]
+        self.assertEqual(['exec'] * 5,
+                         [task.call_type for task in tasks[1:6]])
+        self.assertEqual('vxddladm set namingscheme=osn',
+                         scheme_task.kwargs['command'])
+        self.assertEqual('vxdisksetup -i ' + \
+                         '$(basename $::disk_scsi_3ABCD_1235_dev) ' + \
+                         'format=cdsdisk',
+                         disk_task.kwargs['command'])
+        self.assertEqual('vxdg init data_dg ' + \
+                         'pd1=$(basename $::disk_scsi_3ABCD_1235_dev)',
+                         dg_task.kwargs['command'])
+        self.assertEqual('vxassist -g data_dg make fs1 10g layout=concat',
+                         volume_task.kwargs['command'])
+        self.assertEqual('mkfs -t vxfs -o bsize=8192,largefiles ' + \
+                         '/dev/vx/rdsk/data_dg/fs1',
+                         mkfs_task.kwargs['command'])
+        self.assertEqual('file', file_task.call_type)
+        self.assertEqual('mount', mount_task.call_type)
+        self.assertEqual('vxfs', mount_task.kwargs['fstype'])
+        self.assertEqual('/dev/vx/dsk/data_dg/fs1',
+                         mount_task.kwargs['device'])
+        self.assertEqual(set([scheme_task]), disk_task.requires)
+        self.assertEqual(set([disk_task]), dg_task.requires)
+        self.assertEqual(set([dg_task]), volume_task.requires)
+        self.assertEqual(set([volume_task]), mkfs_task.requires)
+        self.assertEqual(set([mkfs_task, file_task]), mount_task.requires)
+
+    def test_vxvm_validate_node(self):
+        self.setup_model()
+
+        storage_data = \
+        {'VGs': [{'id': 'vg1',
+                  'name': 'root_vg',
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/', 'size': '10G'}],
+                  'PDs': [{'id': 'pd1', 'device': 'primary'}]
+                 },
+                 {'id': 'vg2',
+                  'name': 'data_dg',
+                  'volume_driver': 'vxvm',
+                  'FSs': [{'id': 'fs1', 'type': 'vxfs', 'mp': '/data',
+                           'size': '8G',
+                           'props': {'stripes': '2', 'mirrors': '2'}},
+                          {'id': 'fs2', 'type': 'ext4', 'mp': '/logs',
+                           'size': '1G'},
+                          {'id': 'fs3', 'type': 'vxfs', 'mp': '/arch',
+                           'size': '20G',
+                           'props': {'stripes': '2', 'stripe_size': '64K'}}],
+                  'PDs': [{'id': 'pd1', 'device': 'secondary'},
+                          {'id': 'pd2', 'device': 'tertiary'}]
+                 }
+                ],
+         'disks': [{'id': 'disk1', 'bootable': 'true', 'uuid': 'ABCD_1234',
+                    'name': 'primary', 'size': '20G'},
+                   {'id': 'disk2', 'bootable': 'false', 'uuid': 'ABCD_1235',
+                    'name': 'secondary', 'size': '10G'},
+                   {'id': 'disk3', 'bootable': 'false', 'uuid': 'ABCD_1236',
+                    'name': 'tertiary', 'size': '10G'}
+                  ]
+        }
+        self._create_storage_profile_items(self.sp1,
+                                           self.system1,
+                                           storage_data)
+
+        node = self.context.query('node')[0]
+        errors = self.plugin.vxvm_driver.validate_node(node)
+        # fs1 needs 4 PDs, fs2 is not vxfs, and fs3 leaves
+        # no room for the private regions
+        self.assertEqual(['fs1', 'fs2', 'vg2'],
+                         sorted([e.item_path.split('/')[-1] for e in errors]))
+        self.assertEqual([], self.plugin.lvm_driver.validate_node(node))
+
+    def test_vxvm_vg_without_pds(self):
+        self.setup_model()
+
+        storage_data = \
+        {'VGs': [{'id': 'vg1',
+                  'name': 'root_vg',
+                  'FSs': [{'id': 'fs1', 'type': 'ext4', 'mp': '/', 'size': '10G'}],
+                  'PDs': [{'id': 'pd1', 'device': 'primary'}]
+                 },
+                 {'id': 'vg2',
+                  'name': 'data_dg',
+                  'volume_driver': 'vxvm',
+                  'FSs': [{'id': 'fs1', 'type': 'vxfs', 'mp': '/data',
+                           'size': '1G'}]
+                 }
+                ],
+         'disks': [{'id': 'disk1', 'bootable': 'true', 'uuid': 'ABCD_1234',
+                    'name': 'primary', 'size': '20G'}
+                  ]
+        }
+        self._create_storage_profile_items(self.sp1,
+                                           self.system1,
+                                           storage_data)
+
+        # A Disk Group cannot be created without members
+        errors = self.plugin.validate_model(self.context)
+        self.assertEqual(1, len(errors))
+        self.assertTrue(errors[0].item_path.endswith('/vg2'))
+        self.assertTrue('Physical Device' in errors[0].error_message)
+
+        tasks = self.plugin.create_configuration(self.context)
+        self.assertEqual(['fs1'], [task.call_id for task in tasks])
+
+        # Nor from a Physical Device with no System Disk
+        pd_url = self.sp1.get_vpath() + \
+                 '/volume_groups/vg2/physical_devices/pd1'
+        rsp = self.model_manager.create_item('physical-device', pd_url,
+                                             device_name='missing')
+        self.assertFalse(isinstance(rsp, list), rsp)
+        tasks = self.plugin.create_configuration(self.context)
+        self.assertEqual(['fs1'], [task.call_id for task in tasks])